@@ -0,0 +1,16 @@
+"""
+Benchmarks of qw_reports on deterministic synthetic data.
+
+synthetic writes stores of synthetic sites laid out like the staged
+/said/{id}/ tables, and suite times the steps of the report pipeline on
+them. The other modules benchmark single components:
+
+- prediction: native prediction against linearmodel
+- validation: closed-form leave-one-out statistics
+- scenario_prediction: batched scenario prediction
+- stream: StreamingPredictor
+
+Usage: python -m benchmarks run [--sites N] [--years Y] ...
+       python -m benchmarks compare BASELINE CURRENT
+       python -m benchmarks.prediction [years]
+"""
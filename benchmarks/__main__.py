@@ -0,0 +1,84 @@
+"""
+Run the benchmark suite or compare saved results.
+
+Usage: python -m benchmarks run [--sites N] [--years Y] [--seed S]
+                                [--repeat R] [--scenario NAME ...]
+                                [--nwis] [--store FILE] [--output DIR]
+       python -m benchmarks compare BASELINE CURRENT
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.suite import SCENARIOS, compare_results, run_suite, save_results
+from benchmarks.synthetic import write_nwis_store, write_store
+
+
+def run(args):
+    store_path = args.store
+    if store_path is None:
+        fd, store_path = tempfile.mkstemp(suffix='.h5')
+        os.close(fd)
+
+    scenarios = args.scenario or [name for name in SCENARIOS
+                                  if args.nwis or name != 'stage']
+
+    write = write_nwis_store if args.nwis else write_store
+    sites = write(store_path, n_sites=args.sites, years=args.years, seed=args.seed)
+    print('{} sites, {} years, {}'.format(args.sites, args.years, store_path))
+
+    try:
+        results = run_suite(store_path, sites, years=args.years,
+                            scenarios=scenarios, repeat=args.repeat)
+    finally:
+        if args.store is None:
+            os.remove(store_path)
+
+    results['parameters']['seed'] = args.seed
+    print('saved', save_results(results, args.output))
+
+    return 0
+
+
+def compare(args):
+    print(compare_results(args.baseline, args.current).to_string(float_format='{:.3f}'.format))
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks',
+                                     description='Benchmarks of qw_reports on synthetic data')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='time the pipeline scenarios')
+    run_parser.add_argument('--sites', type=int, default=4, help='number of sites')
+    run_parser.add_argument('--years', type=float, default=2,
+                            help='years of 15-minute data per site')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='times each scenario is timed')
+    run_parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                            help='scenario to run, may be repeated (default: all)')
+    run_parser.add_argument('--nwis', action='store_true',
+                            help='also write raw NWIS tables and time staging '
+                                 '(needs hygnd)')
+    run_parser.add_argument('--store', default=None,
+                            help='keep the synthetic store in this file')
+    run_parser.add_argument('--output', default='benchmark_results',
+                            help='directory the results are saved in')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='compare two saved results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
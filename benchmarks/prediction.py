@@ -0,0 +1,55 @@
+"""
+Benchmark HierarchicalModel prediction on a synthetic 10-year, 15-minute
+record and check the native PredictionEngine against linearmodel.
+
+Usage: python -m benchmarks.prediction [years]
+"""
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import TP_MODEL_LIST, synthetic_record
+from qw_reports.model import HierarchicalModel
+
+# largest relative difference allowed between the engines, as in
+# tests/test_prediction.py
+RTOL = 1e-6
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    out = func(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def main(years=10):
+    con_df, sur_df = synthetic_record(years)
+    model = HierarchicalModel(con_df, sur_df, TP_MODEL_LIST)
+    print('{} rows, {} sub-models'.format(len(sur_df), len(model._fits)))
+
+    # parity of each sub-model against linearmodel
+    for i in range(len(model._fits)):
+        reference, t_ref = timed(model._get_model(i)._model.predict_response_variable,
+                                 explanatory_data=model._surrogate_data,
+                                 raw_response=True,
+                                 bias_correction=True,
+                                 prediction_interval=True)
+        native, t_nat = timed(model._get_engine(i).predict, sur_df)
+
+        name = model._fits[i].raw_response
+        columns = [name, name + '_L90.0', name + '_U90.0']
+        error = np.nanmax(np.abs(native[columns].values / reference[columns].values - 1))
+        print('{:<45} linearmodel {:7.3f} s  native {:7.3f} s  max rel. diff {:.1e}'.format(
+            model._fits[i].formula, t_ref, t_nat, error))
+        if not error <= RTOL:
+            raise AssertionError('{} differs from linearmodel by {:.1e}'.format(
+                model._fits[i].formula, error))
+
+    _, t_update = timed(model.get_prediction, cascade=False)
+    _, t_cascade = timed(model.get_prediction)
+    print('get_prediction: update {:.3f} s, cascade {:.3f} s'.format(t_update, t_cascade))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
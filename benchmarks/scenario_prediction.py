@@ -0,0 +1,50 @@
+"""
+Benchmark batched scenario prediction against predicting each scenario of
+scaled OrthoP and turbidity separately, and check that they agree.
+
+Usage: python -m benchmarks.scenario_prediction [n_scenarios] [days]
+"""
+import sys
+
+import numpy as np
+
+from benchmarks.prediction import timed
+from benchmarks.synthetic import TP_MODEL_LIST, synthetic_record
+from qw_reports.model import HierarchicalModel
+from qw_reports.scenarios import scaled_scenarios
+
+
+def predict_each(model, surrogate_df, factors):
+    predictions = []
+    for k in range(len(factors['OrthoP'])):
+        scenario = surrogate_df.copy()
+        for column in factors:
+            scenario[column] *= factors[column][k]
+        predictions.append(model.get_prediction(scenario))
+    return predictions
+
+
+def main(n_scenarios=500, days=30):
+    con_df, sur_df = synthetic_record(years=2)
+    model = HierarchicalModel(con_df, sur_df, TP_MODEL_LIST)
+    record = sur_df.iloc[:days * 96]
+
+    factors = {'OrthoP': np.linspace(0.5, 1.5, n_scenarios),
+               'Turb_YSI': np.linspace(0.5, 1.5, n_scenarios)}
+
+    columns = model.get_surrogate_variables()
+    batched, t_batched = timed(
+        lambda: model.get_scenario_prediction(
+            scaled_scenarios(record, factors, columns=columns)))
+    each, t_each = timed(predict_each, model, record, factors)
+
+    error = max(np.nanmax(np.abs(batched.loc[k].values - each[k].values))
+                for k in range(n_scenarios))
+
+    print('{} scenarios of {} rows'.format(n_scenarios, len(record)))
+    print('batched     {:7.3f} s'.format(t_batched))
+    print('per scenario {:6.3f} s  max abs. diff {:.1e}'.format(t_each, error))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
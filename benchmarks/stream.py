@@ -0,0 +1,34 @@
+"""
+Benchmark StreamingPredictor: the cost of each new observation should not
+depend on the length of the record the model was fit to.
+
+Usage: python -m benchmarks.stream [n_observations]
+"""
+import sys
+
+from benchmarks.prediction import timed
+from benchmarks.synthetic import TP_MODEL_LIST, synthetic_record
+from qw_reports.model import HierarchicalModel
+from qw_reports.stream import StreamingPredictor
+
+
+def stream(predictor, rows, batch_size):
+    feed = ((timestamp, row.to_dict()) for timestamp, row in rows.iterrows())
+    for _ in predictor.run(feed, batch_size=batch_size):
+        pass
+
+
+def main(n_observations=500):
+    for years in [1, 5, 10]:
+        con_df, sur_df = synthetic_record(years)
+        model = HierarchicalModel(con_df, sur_df, TP_MODEL_LIST)
+        rows = sur_df.iloc[-n_observations:]
+
+        for batch_size in [1, 96]:
+            _, elapsed = timed(stream, StreamingPredictor(model), rows, batch_size)
+            print('{:2d}-year record, batches of {:3d}: {:7.1f} us per observation'.format(
+                years, batch_size, elapsed / n_observations * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,392 @@
+"""
+Timed scenarios of the report pipeline on a synthetic store.
+
+Each scenario prepares its inputs from the store, untimed, and returns a
+function that runs one step of the pipeline over every site and the number
+of rows it processed. run_suite times each scenario and returns the results
+with the versions and parameters they were measured with, so that results
+saved from different versions can be compared.
+
+Examples
+--------
+>>> sites = write_store('synthetic.h5', n_sites=4, years=2)
+>>> results = run_suite('synthetic.h5', sites, years=2)
+>>> save_results(results, 'benchmark_results')
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import MODEL_LISTS
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(name):
+    """Register a scenario under name.
+    """
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+
+    return register
+
+
+class BenchmarkData:
+    """Sites of a synthetic store, with their tables read once.
+    """
+    def __init__(self, store_path, sites):
+        self.store_path = store_path
+        self.sites = sites
+        self._tables = {}
+
+    def get(self, site, table):
+        key = (site['id'], table)
+        if key not in self._tables:
+            with pd.HDFStore(self.store_path, mode='r') as store:
+                self._tables[key] = store.get('/said/{}/{}'.format(site['id'], table))
+
+        return self._tables[key]
+
+
+class SiteProject:
+    """Project template holding a list of site dicts, as used by the tables.
+    """
+    def __init__(self, sites):
+        self.sites = sites
+
+
+@scenario('stage')
+def stage(data):
+    """SurrogateModel.stage of every site. Needs a store written by
+    write_nwis_store.
+
+    Sites are staged in a copy of the store, so that the staged tables
+    read by the other scenarios are left as written.
+    """
+    from qw_reports.preprocess.said import SurrogateModel
+
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    shutil.copyfile(data.store_path, path)
+    rows = sum(len(data.get(site, 'iv')) for site in data.sites)
+
+    def run():
+        for site in data.sites:
+            SurrogateModel(site['id'], path).stage(verbose=False)
+        return rows
+
+    return run
+
+
+@scenario('fit')
+def fit(data):
+    """HierarchicalModel fit of every constituent of every site.
+    """
+    from qw_reports.model import HierarchicalModel
+
+    frames = [(data.get(site, 'qwdata'), data.get(site, 'iv')) for site in data.sites]
+
+    def run():
+        rows = 0
+        for con_df, sur_df in frames:
+            for model_list in MODEL_LISTS.values():
+                HierarchicalModel(con_df, sur_df, model_list, min_samples=10)
+                rows += len(con_df)
+        return rows
+
+    return run
+
+
+@scenario('predict')
+def predict(data):
+    """HierarchicalModel.get_prediction of every constituent of every site.
+    """
+    from qw_reports.model import HierarchicalModel
+
+    models = [HierarchicalModel(data.get(site, 'qwdata'), data.get(site, 'iv'),
+                                model_list, min_samples=10)
+              for site in data.sites for model_list in MODEL_LISTS.values()]
+
+    def run():
+        rows = 0
+        for model in models:
+            rows += len(model.get_prediction())
+        return rows
+
+    return run
+
+
+@scenario('mean_annual_load')
+def annual_load(data):
+    """mean_annual_load of every constituent of every site.
+    """
+    from qw_reports.analysis.loads import mean_annual_load
+
+    frames = [data.get(site, 'iv') for site in data.sites]
+
+    def run():
+        rows = 0
+        for sur_df in frames:
+            for constituent in MODEL_LISTS:
+                mean_annual_load(sur_df['Discharge'], sur_df[constituent])
+                rows += len(sur_df)
+        return rows
+
+    return run
+
+
+@scenario('load_interval')
+def load_interval(data):
+    """Monte Carlo water-year load realizations of every constituent of
+    every site.
+    """
+    from qw_reports.analysis.uncertainty import CONSTITUENT_SCALES, load_realizations
+
+    frames = [data.get(site, 'iv') for site in data.sites]
+
+    def run():
+        rows = 0
+        for sur_df in frames:
+            for constituent in MODEL_LISTS:
+                load_realizations(sur_df['Discharge'], sur_df[constituent],
+                                  sur_df[constituent + '_L90.0'],
+                                  sur_df[constituent + '_U90.0'],
+                                  scale=CONSTITUENT_SCALES[constituent],
+                                  n_realizations=100)
+                rows += len(sur_df)
+        return rows
+
+    return run
+
+
+@scenario('load_table')
+def load_table(data):
+    """LoadTable.generate over every site, reading from the store.
+    """
+    from qw_reports.tables import LoadTable
+
+    project = SiteProject(data.sites)
+
+    def run():
+        with pd.HDFStore(data.store_path, mode='r') as store:
+            LoadTable(store, project).generate()
+        return sum(len(data.get(site, 'iv')) for site in data.sites)
+
+    return run
+
+
+@scenario('events')
+def events(data):
+    """network_events over every site, reading from the store.
+    """
+    from qw_reports.analysis.events import network_events
+
+    def run():
+        with pd.HDFStore(data.store_path, mode='r') as store:
+            network_events(store, data.sites)
+        return sum(len(data.get(site, 'iv')) for site in data.sites)
+
+    return run
+
+
+@scenario('sample_table')
+def sample_table(data):
+    """SampleTable.generate of every constituent over every site.
+    """
+    from qw_reports.tables import SampleTable
+
+    project = SiteProject(data.sites)
+
+    def run():
+        for constituent in MODEL_LISTS:
+            SampleTable(data.store_path, project).generate(constituent)
+        return sum(len(data.get(site, 'qwdata')) for site in data.sites)
+
+    return run
+
+
+@scenario('plots')
+def plots(data):
+    """plot_nitrate, plot_ssc and plot_tp of every site, saved to files.
+    """
+    from qw_reports.plot import plot_nitrate, plot_ssc, plot_tp
+
+    frames = [(data.get(site, 'qwdata'), data.get(site, 'iv')) for site in data.sites]
+    directory = tempfile.mkdtemp()
+
+    def run():
+        rows = 0
+        for i, (con_df, sur_df) in enumerate(frames):
+            for name, plot in [('nitrate', plot_nitrate), ('ssc', plot_ssc),
+                               ('tp', plot_tp)]:
+                plot(con_df, sur_df,
+                     filename=os.path.join(directory, '{}_{}.png'.format(i, name)))
+                rows += len(sur_df)
+        return rows
+
+    return run
+
+
+def time_scenario(run, repeat=3):
+    """Time run, repeat times.
+
+    Returns
+    -------
+    (times in seconds, rows processed by the last run)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - start)
+
+    return times, rows
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Versions of the code and the libraries the results were measured with.
+    """
+    import matplotlib
+    import scipy
+    import statsmodels
+
+    return {'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scipy': scipy.__version__,
+            'statsmodels': statsmodels.__version__,
+            'matplotlib': matplotlib.__version__}
+
+
+def run_suite(store_path, sites, years=None, scenarios=None, repeat=3,
+              verbose=True):
+    """Time scenarios on a synthetic store.
+
+    A scenario that raises, e.g. for a missing optional dependency, is
+    recorded with its error and the others still run.
+
+    Parameters
+    ----------
+    store_path : string
+        Store written by write_store or write_nwis_store.
+    sites : list
+        Site dicts returned by write_store.
+    years : float
+        Length of the records, recorded with the results.
+    scenarios : list
+        Names of the scenarios to run. Default is all of SCENARIOS.
+    repeat : int
+        Number of times each scenario is timed.
+
+    Returns
+    -------
+    dict with the environment, parameters and a result per scenario: its
+    times, best and median time and rows per second of the best time.
+    """
+    if scenarios is None:
+        scenarios = list(SCENARIOS)
+
+    data = BenchmarkData(store_path, sites)
+    results = OrderedDict()
+
+    for name in scenarios:
+        try:
+            times, rows = time_scenario(SCENARIOS[name](data), repeat)
+        except Exception:
+            results[name] = {'error': traceback.format_exc().strip().splitlines()[-1]}
+            if verbose:
+                print('{:<18} failed: {}'.format(name, results[name]['error']))
+            continue
+
+        best = min(times)
+        rows = int(rows)
+        results[name] = {'times': times, 'best': best,
+                         'median': float(np.median(times)), 'rows': rows,
+                         'rows_per_second': rows / best if best > 0 else None}
+        if verbose:
+            print('{:<18} best {:8.3f} s  median {:8.3f} s  {:>10,} rows'.format(
+                name, best, results[name]['median'], rows))
+
+    return {'environment': environment(),
+            'parameters': {'sites': len(sites), 'years': years,
+                           'repeat': repeat},
+            'created': pd.Timestamp.now().isoformat(),
+            'results': results}
+
+
+def save_results(results, directory):
+    """Save results as JSON, named by time and revision.
+
+    Returns
+    -------
+    Path of the file written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = '{}_{}.json'.format(
+        pd.Timestamp(results['created']).strftime('%Y%m%dT%H%M%S'),
+        results['environment']['revision'] or 'unknown')
+    path = os.path.join(directory, name)
+
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    return path
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current):
+    """Best times of two saved results side by side.
+
+    Parameters
+    ----------
+    baseline, current : dict or string
+        Results, or paths of saved results.
+
+    Returns
+    -------
+    DataFrame of the best time of each scenario in both and their ratio,
+    current / baseline, so that values above 1 are slowdowns.
+    """
+    if isinstance(baseline, str):
+        baseline = load_results(baseline)
+    if isinstance(current, str):
+        current = load_results(current)
+
+    rows = []
+    for name in OrderedDict.fromkeys(list(baseline['results']) + list(current['results'])):
+        before = baseline['results'].get(name, {}).get('best', np.nan)
+        after = current['results'].get(name, {}).get('best', np.nan)
+        rows.append((name, before, after, after / before))
+
+    table = pd.DataFrame(rows, columns=['scenario', 'baseline', 'current', 'ratio'])
+
+    return table.set_index('scenario')
@@ -0,0 +1,218 @@
+"""
+Deterministic synthetic data for the benchmarks.
+
+Sites have 15-minute surrogate records (Discharge, Turb_HACH, Turb_YSI,
+NitrateSurr and OrthoP) and sparse samples of SSC, TP and Nitrate related to
+them through the same kinds of models used by Report. The same seed always
+gives the same data.
+
+Examples
+--------
+>>> sites = write_store('synthetic.h5', n_sites=4, years=2)
+>>> with pd.HDFStore('synthetic.h5') as store:
+...     iv = store.get('/said/{}/iv'.format(sites[0]['id']))
+"""
+import numpy as np
+import pandas as pd
+
+from qw_reports.match import build_match_index
+
+START = '2010-10-01'
+
+NITRATE_MODEL_LIST = [
+    ['Nitrate',['NitrateSurr']],
+]
+
+SSC_MODEL_LIST = [
+    ['log(SSC)',['log(Turb_HACH)']],
+    ['log(SSC)',['log(Turb_YSI)']]
+]
+
+TP_MODEL_LIST = [
+    ['log(TP)',['log(OrthoP)','log(Turb_HACH)']],
+    ['log(TP)',['log(OrthoP)','log(Turb_YSI)']],
+    ['log(TP)',['log(Turb_HACH)']],
+    ['log(TP)',['log(Turb_YSI)']]
+]
+
+MODEL_LISTS = {'Nitrate': NITRATE_MODEL_LIST,
+               'SSC': SSC_MODEL_LIST,
+               'TP': TP_MODEL_LIST}
+
+# NWIS parameter codes of the surrogates and samples, see qw_reports.codes
+IV_CODES = {'Discharge': '00060', 'Turb_HACH': '63680_hach',
+            'Turb_YSI': '63680_ysi', 'NitrateSurr': '99133', 'OrthoP': '51289'}
+QW_CODES = {'TP': 'p00665', 'SSC': 'p80154', 'Nitrate': 'p00631'}
+
+
+def _concentrations(sur_df, rng):
+    """SSC, TP and Nitrate of each row of sur_df, with model error.
+    """
+    n = len(sur_df)
+    return pd.DataFrame(
+        {'SSC': np.exp(0.5 + 1.1 * np.log(sur_df['Turb_YSI'].values)
+                       + rng.normal(0, 0.3, n)),
+         'TP': np.exp(-1 + 0.3 * np.log(sur_df['Turb_YSI'].values)
+                      + 0.5 * np.log(sur_df['OrthoP'].values)
+                      + rng.normal(0, 0.2, n)),
+         'Nitrate': np.maximum(0, sur_df['NitrateSurr'].values
+                               + rng.normal(0, 0.3, n))},
+        index=sur_df.index)
+
+
+def synthetic_record(years=10, n_samples=200, seed=0, start=START):
+    """Synthetic surrogate and constituent frames for one site.
+
+    Parameters
+    ----------
+    years : float
+        Length of the 15-minute surrogate record.
+    n_samples : int
+        Number of samples, taken at random rows of the record.
+    seed : int
+    start : string
+        First timestamp of the record.
+
+    Returns
+    -------
+    (constituent frame of SSC, TP and Nitrate samples, surrogate frame)
+    """
+    rng = np.random.RandomState(seed)
+    index = pd.date_range(start, periods=int(years * 365.25 * 96),
+                          freq='15min')
+    n = len(index)
+
+    # seasonal baseflow with a random walk of storm flows
+    season = np.sin(2 * np.pi * np.arange(n) / (365.25 * 96))
+    discharge = np.exp(5 + 0.5 * season + 0.2 * np.cumsum(rng.normal(0, 0.02, n)))
+    turb = np.exp(1 + 0.6 * np.log(discharge) + rng.normal(0, 0.2, n))
+    sur_df = pd.DataFrame({'Discharge': discharge,
+                           'Turb_HACH': turb,
+                           'Turb_YSI': turb * np.exp(rng.normal(0, 0.1, n)),
+                           'NitrateSurr': np.exp(1.5 - 0.5 * season + rng.normal(0, 0.1, n)),
+                           'OrthoP': np.exp(-2 + 0.2 * np.log(discharge) + rng.normal(0, 0.2, n))},
+                          index=index)
+    # gap in one sensor so that the fallback models are exercised
+    sur_df.iloc[n//3:n//2, sur_df.columns.get_loc('Turb_HACH')] = np.nan
+
+    rows = np.sort(rng.choice(n, n_samples, replace=False))
+    con_df = _concentrations(sur_df.iloc[rows], rng)
+
+    return con_df, sur_df
+
+
+def add_predictions(sur_df, seed=0):
+    """Add synthetic predictions of SSC, TP and Nitrate, with 90% prediction
+    intervals, as Report.commit writes them to the iv table.
+
+    Lets the load, table and plot benchmarks run without fitting models.
+    """
+    rng = np.random.RandomState(seed)
+    sur_df = sur_df.copy()
+    predicted = _concentrations(sur_df.ffill(), rng)
+
+    for constituent in predicted:
+        sur_df[constituent] = predicted[constituent]
+        sur_df[constituent + '_L90.0'] = predicted[constituent] * np.exp(-0.4)
+        sur_df[constituent + '_U90.0'] = predicted[constituent] * np.exp(0.4)
+
+    return sur_df
+
+
+def synthetic_sites(n_sites, seed=0):
+    """Site dicts, as in a project template, of n_sites synthetic sites.
+    """
+    return [{'id': '{:08d}'.format(99000000 + seed * 1000 + i),
+             'name': 'Synthetic{}'.format(i),
+             'start': START}
+            for i in range(n_sites)]
+
+
+def write_store(path, n_sites=4, years=2, seed=0, n_samples=None,
+                predictions=True):
+    """Write the staged tables of synthetic sites to an HDF store, laid out
+    as by SurrogateModel.stage: /said/{id}/iv, /said/{id}/qwdata and
+    /said/{id}/match.
+
+    Parameters
+    ----------
+    path : string
+        HDF file, overwritten.
+    n_sites : int
+    years : float
+    seed : int
+        Each site is generated from its own seed, derived from this one.
+    n_samples : int
+        Samples per site. Default is about 30 a year, at least 30.
+    predictions : bool
+        Add synthetic prediction columns to the iv tables, see
+        add_predictions.
+
+    Returns
+    -------
+    list of site dicts
+    """
+    if n_samples is None:
+        n_samples = max(30, int(30 * years))
+
+    sites = synthetic_sites(n_sites, seed)
+
+    with pd.HDFStore(path, mode='w') as store:
+        for i, site in enumerate(sites):
+            db_path = '/said/{}/'.format(site['id'])
+            con_df, sur_df = synthetic_record(years, n_samples, seed=seed * 1000 + i)
+            store.put(db_path + 'qwdata', con_df)
+            store.put(db_path + 'match', build_match_index(sur_df, con_df))
+
+            if predictions:
+                sur_df = add_predictions(sur_df, seed=seed * 1000 + i)
+            store.put(db_path + 'iv', sur_df)
+
+    return sites
+
+
+def nwis_tables(con_df, sur_df):
+    """Raw NWIS iv, dv and qwdata frames of a synthetic site, as read by
+    SurrogateModel.stage: columns named by parameter code with approval
+    codes in the _cd columns.
+    """
+    iv = pd.DataFrame(index=sur_df.index)
+    for column, code in IV_CODES.items():
+        iv[code] = sur_df[column]
+        iv[code + '_cd'] = 'A'
+
+    dv = pd.DataFrame({'00060': sur_df['Discharge'].resample('D').mean()})
+    dv['00060_cd'] = 'A'
+
+    qwdata = con_df.rename(columns=QW_CODES)
+
+    return iv, dv, qwdata
+
+
+def write_nwis_store(path, n_sites=4, years=2, seed=0, n_samples=None):
+    """Write raw NWIS tables of synthetic sites with hygnd, for benchmarking
+    SurrogateModel.stage, along with their staged tables (see write_store).
+
+    Returns
+    -------
+    list of site dicts
+    """
+    from hygnd.store import NWISStore
+
+    if n_samples is None:
+        n_samples = max(30, int(30 * years))
+
+    sites = write_store(path, n_sites, years, seed, n_samples, predictions=False)
+
+    for i, site in enumerate(sites):
+        con_df, sur_df = synthetic_record(years, n_samples, seed=seed * 1000 + i)
+        iv, dv, qwdata = nwis_tables(con_df, sur_df)
+
+        with NWISStore(path) as store:
+            station = store.get_station(site['id'])
+
+        station.put('iv', iv)
+        station.put('dv', dv)
+        station.put('qwdata', qwdata)
+
+    return sites
@@ -0,0 +1,51 @@
+"""
+Benchmark closed-form leave-one-out statistics against a single OLS fit and
+against refitting the model once per sample.
+
+Usage: python -m benchmarks.validation [n_samples]
+"""
+import sys
+import time
+
+import numpy as np
+import statsmodels.api as sm
+
+from qw_reports.validation import LeaveOneOut
+
+
+def timed(func, *args, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def refit_loo(exog, endog):
+    resid = np.empty(len(endog))
+    for i in range(len(endog)):
+        keep = np.arange(len(endog)) != i
+        res = sm.OLS(endog[keep], exog[keep]).fit()
+        resid[i] = endog[i] - exog[i].dot(res.params)
+    return resid
+
+
+def main(n_samples=300):
+    rng = np.random.RandomState(0)
+    exog = sm.add_constant(rng.normal(size=(n_samples, 3)))
+    endog = exog.dot([1, 0.5, -0.3, 0.2]) + rng.normal(0, 0.3, n_samples)
+
+    _, t_fit = timed(lambda: sm.OLS(endog, exog).fit())
+    loo, t_loo = timed(LeaveOneOut, exog, endog)
+    resid, t_refit = timed(refit_loo, exog, endog, repeat=1)
+
+    print('{} samples'.format(n_samples))
+    print('single fit      {:9.5f} s'.format(t_fit))
+    print('closed-form LOO {:9.5f} s'.format(t_loo))
+    print('refit LOO       {:9.5f} s  max abs. diff {:.1e}'.format(
+        t_refit, np.max(np.abs(resid - loo.resid))))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,208 @@
+"""
+Command line interface.
+
+Usage: python -m qw_reports report STORE TEMPLATE [--workers N] [--cache DIR]
+                                                  [--no-plots] [--changed-only]
+                                                  [--force] [--trace FILE]
+                                                  [--profile STAGE]
+       python -m qw_reports pipeline STORE TEMPLATE [--workers N] [--cache DIR]
+                                                    [--no-stage] [--no-plots]
+                                                    [--force] [--trace FILE]
+                                                    [--profile STAGE]
+       python -m qw_reports events STORE TEMPLATE [--method {threshold,slope}]
+                                                  [--output DIR] [--plots]
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+
+def start_trace(args):
+    """Enable qw_reports.instrument if --trace was given.
+    """
+    if args.trace:
+        from qw_reports import instrument
+        instrument.enable(args.trace, profile=args.profile)
+
+
+def print_trace(args):
+    """Print the time spent in each stage of the trace.
+    """
+    if args.trace:
+        from qw_reports import instrument
+        print(instrument.summary(args.trace).to_string())
+
+
+def add_trace_arguments(parser):
+    from qw_reports.instrument import STAGES
+
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                        help='append the time, CPU and memory of each stage to '
+                             'this JSON-lines file')
+    parser.add_argument('--profile', default=None, choices=STAGES,
+                        help='capture this stage with cProfile, next to the trace')
+
+
+def print_artifacts(artifacts):
+    """Print the artifacts regenerated and the number skipped.
+    """
+    regenerated = artifacts[artifacts.status == 'regenerated']
+    for path in regenerated.artifact:
+        print('regenerated {}'.format(path))
+
+    print('{} artifacts regenerated, {} skipped'.format(
+        len(regenerated), len(artifacts) - len(regenerated)))
+
+
+def report(args):
+    """Model and plot every site of a project.
+    """
+    from hygnd.project import Project
+    from qw_reports.cache import ModelCache
+    from qw_reports.driver import ReportDriver
+
+    cache = ModelCache(args.cache) if args.cache else None
+    start_trace(args)
+
+    with pd.HDFStore(args.store) as store:
+        driver = ReportDriver(store, Project(args.template),
+                              n_workers=args.workers, cache=cache,
+                              plots=not args.no_plots,
+                              changed_only=args.changed_only,
+                              force=args.force)
+        failures = driver.run()
+
+    if driver.artifacts is not None:
+        print_artifacts(driver.artifacts)
+    print_trace(args)
+
+    for site_id, error in failures.items():
+        print('site {} failed:\n{}'.format(site_id, error), file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+def pipeline(args):
+    """Stage, model, compute loads and plot every site of a project as a
+    dependency graph, skipping steps whose inputs are unchanged.
+    """
+    from hygnd.project import Project
+    from qw_reports.cache import ModelCache
+    from qw_reports.scheduler import Scheduler, add_report_pipeline
+
+    cache = ModelCache(args.cache) if args.cache else None
+    start_trace(args)
+
+    with pd.HDFStore(args.store) as store:
+        scheduler = Scheduler(store, max_workers=args.workers)
+        add_report_pipeline(scheduler, Project(args.template).sites,
+                            store_path=args.store, stage=not args.no_stage,
+                            plots=not args.no_plots, cache=cache,
+                            force=args.force)
+        scheduler.run(force=args.force)
+
+    print(scheduler.report())
+    print_trace(args)
+    for task, error in scheduler.failures.items():
+        print('task {} failed:\n{}'.format(task, error), file=sys.stderr)
+
+    return 1 if scheduler.failures else 0
+
+
+def events(args):
+    """Tabulate the storm events of every site of a project, and optionally
+    plot them.
+    """
+    import os
+
+    from hygnd.project import Project
+    from qw_reports.analysis.events import (EVENT_CONSTITUENTS, baseflow,
+                                            network_events)
+
+    sites = Project(args.template).sites
+    os.makedirs(args.output, exist_ok=True)
+
+    with pd.HDFStore(args.store, mode='r') as store:
+        table = network_events(store, sites, method=args.method)
+        table.to_csv(os.path.join(args.output, 'events.csv'), index=False)
+        print('{} events at {} sites'.format(len(table), table['site'].nunique()))
+
+        if args.plots:
+            from qw_reports.plot import plot_events
+
+            for site in sites:
+                site_table = table[table['site'] == site['id']]
+                if len(site_table) == 0:
+                    continue
+
+                sur_df = store.get('/said/{}/iv'.format(site['id']))
+                base = baseflow(sur_df['Discharge'])
+                for constituent, _ in EVENT_CONSTITUENTS:
+                    if constituent not in sur_df:
+                        continue
+                    plot_events(sur_df, site_table, constituent, baseflow=base,
+                                title=site['name'],
+                                filename=os.path.join(args.output, '{}_{}_events.png'.format(
+                                    site['name'], constituent.lower())))
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='qw_reports',
+                                     description='Tools for preparing water quality reports')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    report_parser = commands.add_parser('report', help='model and plot every site of a project')
+    report_parser.add_argument('store', help='HDF store with the /said/{id}/ tables')
+    report_parser.add_argument('template', help='project template listing the sites')
+    report_parser.add_argument('--workers', type=int, default=None,
+                               help='worker processes (default: every core)')
+    report_parser.add_argument('--cache', default=None,
+                               help='directory of the fitted model cache')
+    report_parser.add_argument('--no-plots', action='store_true',
+                               help='skip generate_plots')
+    report_parser.add_argument('--changed-only', action='store_true',
+                               help='only write prediction columns that changed')
+    report_parser.add_argument('--force', action='store_true',
+                               help='regenerate report files and figures whose inputs are unchanged')
+    add_trace_arguments(report_parser)
+    report_parser.set_defaults(func=report)
+
+    pipeline_parser = commands.add_parser('pipeline',
+                                          help='run the site pipeline as a dependency graph')
+    pipeline_parser.add_argument('store', help='HDF store with the /said/{id}/ tables')
+    pipeline_parser.add_argument('template', help='project template listing the sites')
+    pipeline_parser.add_argument('--workers', type=int, default=None,
+                                 help='tasks run at once (default: every core)')
+    pipeline_parser.add_argument('--cache', default=None,
+                                 help='directory of the fitted model cache')
+    pipeline_parser.add_argument('--no-stage', action='store_true',
+                                 help='use the tables already staged')
+    pipeline_parser.add_argument('--no-plots', action='store_true',
+                                 help='skip plotting')
+    pipeline_parser.add_argument('--force', action='store_true',
+                                 help='rerun every task and regenerate every artifact')
+    add_trace_arguments(pipeline_parser)
+    pipeline_parser.set_defaults(func=pipeline)
+
+    events_parser = commands.add_parser('events',
+                                        help='tabulate and plot the storm events of every site')
+    events_parser.add_argument('store', help='HDF store with the /said/{id}/iv tables')
+    events_parser.add_argument('template', help='project template listing the sites')
+    events_parser.add_argument('--method', default='threshold', choices=['threshold', 'slope'],
+                               help='event detection method')
+    events_parser.add_argument('--output', default='report',
+                               help='directory of events.csv and the plots')
+    events_parser.add_argument('--plots', action='store_true',
+                               help='plot the events of each constituent at each site')
+    events_parser.set_defaults(func=events)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Storm events of a discharge record.
+
+Baseflow is separated from discharge with the Lyne and Hollick recursive
+digital filter, run as a linear filter over the whole record. Events are the
+runs of observations whose quickflow (discharge above baseflow) is large,
+found with array operations rather than a loop over observations:
+
+- threshold: quickflow above threshold times baseflow.
+- slope: from the point where log discharge rises faster than rise per
+  hour, for as long as quickflow stays above threshold times baseflow, so
+  that events start at the foot of the rising limb.
+
+Events closer than min_separation are merged and those shorter than
+min_duration dropped. The volume and the load of each constituent in every
+event are integrated by interval_loads and read from prefix sums, so the
+event table of a site costs one pass over its record.
+
+Examples
+--------
+>>> events = site_events(store, '05586300')
+>>> events = network_events(store, project.sites, method='slope')
+"""
+import numpy as np
+import pandas as pd
+
+from scipy.signal import lfilter
+
+from qw_reports import instrument
+from qw_reports.analysis.loads import (DEFAULT_MAX_GAP, DEFAULT_RULE, SECONDS_PER_DAY,
+                                       interval_loads, load_rate)
+
+# (iv column, units) of the event loads
+EVENT_CONSTITUENTS = [('Nitrate', 'lbs'), ('TP', 'lbs'), ('SSC', 'tons')]
+
+METHODS = ['threshold', 'slope']
+
+# filter parameter for daily discharge (Nathan and McMahon, 1990), scaled to
+# the time between observations
+DEFAULT_ALPHA = 0.925
+DEFAULT_PASSES = 3
+
+# quickflow as a fraction of baseflow
+DEFAULT_THRESHOLD = 0.25
+# rise of log discharge per hour
+DEFAULT_RISE = 0.05
+
+DEFAULT_MIN_SEPARATION = pd.Timedelta('6h')
+DEFAULT_MIN_DURATION = pd.Timedelta('2h')
+
+# fraction of an event a load must cover to be reported
+DEFAULT_MIN_COVERAGE = 0.9
+
+EVENT_COLUMNS = ['start', 'peak', 'end', 'duration (h)', 'peak discharge (cfs)',
+                 'volume (cf)', 'quickflow volume (cf)']
+
+
+def _step_seconds(times):
+    """Median time between observations in seconds.
+    """
+    if len(times) < 2:
+        return np.nan
+
+    t = np.asarray(times, dtype='datetime64[ns]').view(np.int64)
+
+    return np.median(np.diff(t)) / 1e9
+
+
+def baseflow(discharge, alpha=DEFAULT_ALPHA, passes=DEFAULT_PASSES):
+    """Baseflow of a discharge record.
+
+    Each pass of the Lyne and Hollick filter, alternately forward and
+    backward, separates quickflow from the baseflow of the previous pass:
+
+        f[t] = a f[t-1] + (1 + a) / 2 (q[t] - q[t-1])
+
+    Baseflow is constrained to between zero and discharge after each pass,
+    rather than at each step, so that a pass is one call to lfilter.
+
+    Parameters
+    ----------
+    discharge : Series
+        Discharge indexed by time. Gaps are interpolated for the filter and
+        are NaN in the baseflow.
+    alpha : float
+        Filter parameter for daily discharge; a is alpha scaled to the time
+        between observations.
+    passes : int
+
+    Returns
+    -------
+    Series of baseflow on the index of discharge.
+    """
+    discharge = discharge.sort_index()
+    q = discharge.values.astype(float)
+    valid = np.isfinite(q)
+
+    if valid.sum() < 2:
+        return pd.Series(np.nan, index=discharge.index)
+
+    a = alpha ** (_step_seconds(discharge.index) / SECONDS_PER_DAY)
+    gain = (1 + a) / 2
+
+    filled = discharge.interpolate(limit_area='inside').bfill().ffill().values
+    base = filled
+    for i in range(passes):
+        x = base[::-1] if i % 2 else base
+        # the difference filter ignores a constant, so starting from x[0]
+        # gives no quickflow at the start of the pass
+        quick = lfilter([gain, -gain], [1, -a], x - x[0])
+        pass_base = np.clip(x - quick, 0, x)
+        base = pass_base[::-1] if i % 2 else pass_base
+
+    return pd.Series(np.where(valid, base, np.nan), index=discharge.index)
+
+
+def _runs(on, breaks):
+    """First and last position of each run of True in on, split after the
+    positions in breaks.
+    """
+    previous = np.r_[False, on[:-1] & ~breaks[:-1]]
+    following = np.r_[on[1:] & ~breaks[:-1], False]
+
+    return np.flatnonzero(on & ~previous), np.flatnonzero(on & ~following)
+
+
+def _no_events():
+    return pd.DataFrame(columns=['start', 'peak', 'end'], dtype=int)
+
+
+def detect_events(discharge, base=None, method='threshold',
+                  threshold=DEFAULT_THRESHOLD, rise=DEFAULT_RISE,
+                  min_separation=DEFAULT_MIN_SEPARATION,
+                  min_duration=DEFAULT_MIN_DURATION, max_gap=DEFAULT_MAX_GAP):
+    """Events of a discharge record.
+
+    Parameters
+    ----------
+    discharge : Series
+    base : Series
+        Baseflow on the index of discharge. Computed with baseflow if None.
+    method : string
+        'threshold' or 'slope', see the module docstring.
+    threshold : float
+        Quickflow, as a fraction of baseflow, above which an event lasts.
+    rise : float
+        Rise of log discharge per hour that starts an event, for the slope
+        method.
+    min_separation : Timedelta
+        Events separated by less are merged.
+    min_duration : Timedelta
+        Events shorter are dropped.
+    max_gap : Timedelta
+        Events are split at longer gaps in the record.
+
+    Returns
+    -------
+    DataFrame of the start, peak and end positions of each event in the
+    sorted record, in columns start, peak and end.
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}'.format(METHODS))
+
+    discharge = discharge.sort_index()
+    if base is None:
+        base = baseflow(discharge)
+
+    q = discharge.values.astype(float)
+    b = base.reindex(discharge.index).values.astype(float)
+    t = np.asarray(discharge.index, dtype='datetime64[ns]').view(np.int64)
+    n = len(q)
+
+    if n < 2:
+        return _no_events()
+
+    dt = np.diff(t) / 1e9
+    breaks = np.r_[dt > pd.Timedelta(max_gap).total_seconds(), True]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sustain = (q - b) > threshold * b
+
+        if method == 'threshold':
+            on = sustain
+        else:
+            slope = np.diff(np.log(q)) / (dt / 3600.)
+            trigger = np.r_[slope > rise, False] & ~breaks
+            # set at a trigger, kept while quickflow is sustained, reset
+            # otherwise
+            state = pd.Series(np.where(trigger, 1.0, np.where(sustain, np.nan, 0.0)))
+            on = state.ffill().fillna(0).values.astype(bool)
+
+    starts, ends = _runs(on, breaks)
+    if len(starts) == 0:
+        return _no_events()
+
+    # merge events separated by less than min_separation, but not across
+    # a gap in the record
+    separation = (t[starts[1:]] - t[ends[:-1]]) / 1e9
+    gaps = np.r_[0, np.cumsum(breaks)]
+    keep = ((separation >= pd.Timedelta(min_separation).total_seconds())
+            | (gaps[starts[1:]] > gaps[ends[:-1]]))
+    starts = starts[np.r_[True, keep]]
+    ends = ends[np.r_[keep, True]]
+
+    long_enough = (t[ends] - t[starts]) / 1e9 >= pd.Timedelta(min_duration).total_seconds()
+    starts, ends = starts[long_enough], ends[long_enough]
+    if len(starts) == 0:
+        return _no_events()
+
+    # peak: the position of the largest discharge of each event
+    member = np.zeros(n + 1, dtype=int)
+    np.add.at(member, starts, 1)
+    np.add.at(member, ends + 1, -1)
+    member = np.cumsum(member[:-1]) > 0
+    first = np.zeros(n, dtype=bool)
+    first[starts] = True
+    event_id = np.cumsum(first) - 1
+
+    positions = np.flatnonzero(member)
+    peaks = (pd.Series(np.where(np.isfinite(q[positions]), q[positions], -np.inf))
+             .groupby(event_id[positions]).idxmax().values)
+    peaks = positions[peaks]
+
+    return pd.DataFrame({'start': starts, 'peak': peaks, 'end': ends})
+
+
+def event_table(discharge, constituents=None, units='lbs', base=None,
+                rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP,
+                min_coverage=DEFAULT_MIN_COVERAGE, **kwargs):
+    """Start, peak, end, volume and loads of each event.
+
+    Parameters
+    ----------
+    discharge : Series
+    constituents : DataFrame
+        Concentrations on the index of discharge, whose event loads are
+        tabulated as '<constituent> (<units>)'.
+    units : string or list
+        'lbs' or 'tons', for all constituents or for each.
+    base : Series
+        Baseflow, see baseflow.
+    rule, max_gap
+        See interval_loads.
+    min_coverage : float
+        Loads of events whose concentrations cover less than this fraction
+        of the event are NaN.
+
+    Other keyword arguments are passed to detect_events.
+
+    Returns
+    -------
+    DataFrame with a row per event in EVENT_COLUMNS and the load columns.
+    """
+    discharge = discharge.sort_index()
+    if base is None:
+        base = baseflow(discharge)
+    base = base.reindex(discharge.index)
+
+    if constituents is None:
+        constituents = pd.DataFrame(index=discharge.index)
+    constituents = constituents.reindex(discharge.index)
+    if isinstance(units, str):
+        units = [units] * constituents.shape[1]
+
+    events = detect_events(discharge, base, max_gap=max_gap, **kwargs)
+    times = discharge.index
+    q = discharge.values.astype(float)
+
+    # discharge and quickflow, integrated to volumes, then load rates
+    rates = [q, q - base.values]
+    rates += [load_rate(q, constituents[column].values.astype(float), unit)
+              for column, unit in zip(constituents.columns, units)]
+    rates = np.column_stack(rates)
+
+    if len(times) > 1:
+        totals, seconds = interval_loads(times, rates, rule, max_gap)
+    else:
+        totals = seconds = np.zeros((0, rates.shape[1]))
+
+    # prefix sums, so an event's total is a difference of two rows
+    totals = np.vstack([np.zeros(rates.shape[1]), np.cumsum(totals, axis=0)])
+    seconds = np.vstack([np.zeros(rates.shape[1]), np.cumsum(seconds, axis=0)])
+
+    start, end = events['start'].values, events['end'].values
+    event_totals = totals[end] - totals[start]
+    duration = np.asarray((times[end] - times[start]).total_seconds())
+
+    table = pd.DataFrame({'start': times[start],
+                          'peak': times[events['peak'].values],
+                          'end': times[end],
+                          'duration (h)': duration / 3600.,
+                          'peak discharge (cfs)': q[events['peak'].values],
+                          'volume (cf)': event_totals[:, 0],
+                          'quickflow volume (cf)': event_totals[:, 1]},
+                         columns=EVENT_COLUMNS)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coverage = (seconds[end] - seconds[start]) / duration[:, np.newaxis]
+
+    for i, (column, unit) in enumerate(zip(constituents.columns, units)):
+        load = event_totals[:, i + 2]
+        table['{} ({})'.format(column, unit)] = np.where(
+            coverage[:, i + 2] >= min_coverage, load, np.nan)
+
+    return table
+
+
+def site_events(store, site_id, constituents=EVENT_CONSTITUENTS, **kwargs):
+    """Event table of a site's iv table.
+
+    Parameters
+    ----------
+    store : HDFStore
+    site_id : string
+    constituents : list
+        (iv column, units) of the loads to tabulate; columns missing from
+        the iv table are skipped.
+
+    Keyword arguments are passed to event_table.
+    """
+    sur_df = store.get('/said/{}/iv'.format(site_id))
+    constituents = [(column, unit) for column, unit in constituents
+                    if column in sur_df]
+
+    with instrument.stage('events', rows=len(sur_df), site=site_id):
+        return event_table(sur_df['Discharge'],
+                           sur_df[[column for column, _ in constituents]],
+                           [unit for _, unit in constituents], **kwargs)
+
+
+def network_events(store, sites, **kwargs):
+    """Event tables of every site, with the site id in a site column.
+
+    Sites without an iv table are skipped; other errors, such as an iv
+    table without Discharge, are raised.
+
+    Parameters
+    ----------
+    store : HDFStore
+    sites : list
+        Site dicts, as in a project template.
+
+    Keyword arguments are passed to site_events.
+    """
+    tables = []
+    for site in sites:
+        path = '/said/{}/iv'.format(site['id'])
+        if path not in store:
+            print('site {} not found'.format(site['id']))
+            continue
+
+        table = site_events(store, site['id'], **kwargs)
+        table.insert(0, 'site', site['id'])
+        tables.append(table)
+
+    if not tables:
+        return pd.DataFrame(columns=['site'] + EVENT_COLUMNS)
+
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,381 @@
+"""
+Prefix-sum index of a site's loads.
+
+A LoadIndex holds, at each IV timestamp, the cumulative load of each
+constituent, integrated by interval_loads, and the cumulative time covered
+by it. The load over any window is then the difference of two cumulative
+values found by binary search, so window totals and means, and daily, monthly
+or water-year series, cost no more for a long record than for a short one.
+The index is persisted at /said/{id}/load_index, next to the iv table, with a
+fingerprint of the values it was built from. It is extended as IV rows are
+appended and rebuilt when indexed values change.
+
+Windows are half-open, [start, end), and hold the intervals that start in
+them, as in period_loads: a water year runs from October 1 up to, but not
+including, the next October 1.
+
+Examples
+--------
+>>> index = update_load_index(store, '05586300')
+>>> index.total('2019-05-01', '2019-05-09', units='tons')['SSC']
+>>> index.resample('MS')
+>>> index.resample('WY', how='mean_annual')
+"""
+import numpy as np
+import pandas as pd
+
+from qw_reports.analysis.loads import (DEFAULT_MAX_GAP, DEFAULT_RULE, LOAD_RATE,
+                                       SECONDS_PER_YEAR, interval_loads, lbs2ton)
+from qw_reports.cache import frame_digest
+
+LOAD_INDEX_CONSTITUENTS = ['Nitrate', 'TP', 'SSC']
+
+SECONDS_SUFFIX = '_seconds'
+
+# resample frequencies other than water years, and their periods
+PERIODS = {'D': 'D', 'MS': 'M'}
+
+
+def load_index_path(site_id):
+    return '/said/{}/load_index'.format(site_id)
+
+
+def _frame_columns(constituents):
+    """Columns of a LoadIndex stored by to_frame.
+    """
+    return list(constituents) + [c + SECONDS_SUFFIX for c in constituents]
+
+
+def _rates(discharge, constituents):
+    """Load rate in lbs per second, with NaN where it is missing.
+    """
+    return (constituents.values.astype(float)
+            * discharge.values.astype(float)[:, np.newaxis] * LOAD_RATE)
+
+
+class LoadIndex:
+    """Cumulative load and covered time of constituents at a site.
+
+    Row m of the cumulative arrays holds the totals through the interval
+    that starts at times[m], integrated by interval_loads. The interval
+    starting at the last timestamp is pending until a later row is added, so
+    the last row repeats the one before it.
+
+    Parameters
+    ----------
+    times : DatetimeIndex
+        IV timestamps, increasing.
+    cumulative_load : array (n, k)
+        Load in lbs summed through each timestamp.
+    cumulative_seconds : array (n, k)
+        Seconds with a load summed through each timestamp.
+    constituents : list
+        The k constituents.
+    rule, max_gap
+        See interval_loads.
+    """
+    def __init__(self, times, cumulative_load, cumulative_seconds, constituents,
+                 rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+        self.times = pd.DatetimeIndex(times)
+        self.constituents = list(constituents)
+        self.rule = rule
+        self.max_gap = max_gap
+
+        k = len(self.constituents)
+        # a leading row of zeros, so that a window total is always a
+        # difference of two rows
+        self._load = np.vstack([np.zeros((1, k)),
+                                np.asarray(cumulative_load, dtype=float).reshape(-1, k)])
+        self._seconds = np.vstack([np.zeros((1, k)),
+                                   np.asarray(cumulative_seconds, dtype=float).reshape(-1, k)])
+
+    @staticmethod
+    def _cumulate(base, values):
+        """Rows after base: base plus the running sum of values, with the
+        pending last row.
+        """
+        rows = base + np.cumsum(values, axis=0)
+        last = rows[-1:] if len(rows) else base[np.newaxis]
+
+        return np.vstack([rows, last])
+
+    @classmethod
+    def build(cls, discharge, constituents, rule=DEFAULT_RULE,
+              max_gap=DEFAULT_MAX_GAP):
+        """Index the load of each column of constituents.
+
+        Parameters
+        ----------
+        discharge : Series
+        constituents : DataFrame
+            Concentrations on the index of discharge.
+        rule, max_gap
+            See interval_loads.
+        """
+        constituents = constituents.sort_index()
+        discharge = discharge.reindex(constituents.index)
+        k = constituents.shape[1]
+
+        if len(constituents) == 0:
+            return cls(constituents.index, np.zeros((0, k)), np.zeros((0, k)),
+                       constituents.columns, rule, max_gap)
+
+        loads, seconds = interval_loads(constituents.index,
+                                        _rates(discharge, constituents),
+                                        rule, max_gap)
+
+        return cls(constituents.index,
+                   cls._cumulate(np.zeros(k), loads),
+                   cls._cumulate(np.zeros(k), seconds),
+                   constituents.columns, rule, max_gap)
+
+    @classmethod
+    def from_frame(cls, df, rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+        """LoadIndex stored by to_frame.
+        """
+        constituents = [col for col in df.columns if not col.endswith(SECONDS_SUFFIX)]
+        seconds = [col + SECONDS_SUFFIX for col in constituents]
+
+        return cls(df.index, df[constituents].values, df[seconds].values,
+                   constituents, rule, max_gap)
+
+    def to_frame(self):
+        """Cumulative load (lbs) and seconds by timestamp, as stored.
+        """
+        df = pd.DataFrame(self._load[1:], index=self.times,
+                          columns=self.constituents)
+        for i, constituent in enumerate(self.constituents):
+            df[constituent + SECONDS_SUFFIX] = self._seconds[1:, i]
+
+        return df
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def last_time(self):
+        return self.times[-1] if len(self.times) else None
+
+    def extend(self, discharge, constituents):
+        """Append IV rows after the last indexed timestamp.
+
+        Only the new rows, and the row at the last timestamp that starts the
+        pending interval, are read; earlier rows are ignored.
+
+        Parameters
+        ----------
+        discharge : Series
+        constituents : DataFrame
+            With the columns of this index.
+        """
+        if self.last_time is None:
+            index = self.build(discharge, constituents[self.constituents],
+                               self.rule, self.max_gap)
+            self.times, self._load, self._seconds = index.times, index._load, index._seconds
+            return self
+
+        constituents = constituents[self.constituents].sort_index()
+        new = constituents.index[constituents.index > self.last_time]
+
+        if len(new) == 0:
+            return self
+
+        # the pending interval starts at the last timestamp; it is a gap if
+        # that row is no longer in the table
+        times = pd.DatetimeIndex([self.last_time]).append(new)
+        constituents = constituents.reindex(times)
+        loads, seconds = interval_loads(times,
+                                        _rates(discharge.reindex(times), constituents),
+                                        self.rule, self.max_gap)
+
+        self._load = np.vstack([self._load[:-1],
+                                self._cumulate(self._load[-2], loads)])
+        self._seconds = np.vstack([self._seconds[:-1],
+                                   self._cumulate(self._seconds[-2], seconds)])
+        self.times = self.times.append(new)
+
+        return self
+
+    def truncate(self, before):
+        """Drop the rows at or after a timestamp, e.g. so that rows whose
+        predictions changed can be indexed again with extend.
+        """
+        n = self.times.searchsorted(pd.Timestamp(before), side='left')
+
+        self.times = self.times[:n]
+        # the interval from the new last timestamp is pending again
+        self._load = np.vstack([self._load[:n], self._load[max(n - 1, 0)]])
+        self._seconds = np.vstack([self._seconds[:n], self._seconds[max(n - 1, 0)]])
+
+        return self
+
+    def _positions(self, times, default):
+        if times is None:
+            return default
+        return self.times.searchsorted(times, side='left')
+
+    def window(self, start=None, end=None):
+        """Load (lbs) and seconds covered of each constituent over the
+        intervals starting in [start, end).
+
+        Returns
+        -------
+        (load, seconds) : Series indexed by constituent
+        """
+        i = self._positions(None if start is None else pd.Timestamp(start), 0)
+        j = self._positions(None if end is None else pd.Timestamp(end), len(self.times))
+
+        load = pd.Series(self._load[j] - self._load[i], index=self.constituents)
+        seconds = pd.Series(self._seconds[j] - self._seconds[i], index=self.constituents)
+
+        return load, seconds
+
+    def total(self, start=None, end=None, units='lbs'):
+        """Load of each constituent in [start, end).
+
+        Gaps contribute nothing, as in annual_load.
+        """
+        load, _ = self.window(start, end)
+
+        return load * lbs2ton if units == 'tons' else load
+
+    def mean_annual(self, start=None, end=None, units='lbs'):
+        """Mean annual load of each constituent over [start, end), as by
+        mean_annual_load.
+        """
+        load, seconds = self.window(start, end)
+        mean = load / seconds.replace(0, np.nan) * SECONDS_PER_YEAR
+
+        return mean * lbs2ton if units == 'tons' else mean
+
+    def _edges(self, freq):
+        """Period boundaries covering the index and the label of each period.
+        """
+        first, last = self.times[0], self.times[-1]
+
+        if freq == 'WY':
+            first_year = first.year + (first.month >= 10)
+            last_year = last.year + (last.month >= 10)
+            years = np.arange(first_year, last_year + 1)
+            edges = pd.DatetimeIndex(['{}-10-01'.format(year - 1)
+                                      for year in np.append(years, last_year + 1)])
+            return edges, pd.Index(years, name='water year')
+
+        periods = pd.period_range(first.to_period(PERIODS[freq]),
+                                  last.to_period(PERIODS[freq]))
+        edges = periods.start_time.append(
+            pd.DatetimeIndex([(periods[-1] + 1).start_time]))
+
+        return edges, periods.start_time
+
+    def resample(self, freq, units='lbs', how='total'):
+        """Load of each constituent in every period of a frequency.
+
+        Parameters
+        ----------
+        freq : string
+            'D' (days), 'MS' (months), or 'WY' (water years, labeled by
+            year).
+        units : string
+            'lbs' or 'tons'.
+        how : string
+            'total' for the load of each period, 'mean_annual' for the mean
+            annual load of each period, or 'coverage' for the fraction of
+            each period with a load.
+
+        Returns
+        -------
+        DataFrame indexed by period.
+        """
+        if len(self.times) == 0:
+            return pd.DataFrame(columns=self.constituents)
+
+        edges, labels = self._edges(freq)
+        positions = self.times.searchsorted(edges, side='left')
+
+        load = np.diff(self._load[positions], axis=0)
+        seconds = np.diff(self._seconds[positions], axis=0)
+
+        if how == 'coverage':
+            lengths = np.asarray((edges[1:] - edges[:-1]).total_seconds())
+            values = seconds / lengths[:, np.newaxis]
+        elif how == 'total':
+            values = load
+        elif how == 'mean_annual':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.where(seconds > 0, load / seconds, np.nan) * SECONDS_PER_YEAR
+        else:
+            raise ValueError('how must be total, mean_annual or coverage')
+
+        if units == 'tons' and how != 'coverage':
+            values = values * lbs2ton
+
+        return pd.DataFrame(values, index=labels, columns=self.constituents)
+
+
+def _fingerprint(iv, constituents, last_time):
+    """Content hash of the iv columns indexed through last_time.
+    """
+    columns = ['Discharge'] + list(constituents)
+    if last_time is None:
+        return frame_digest(iv[columns].iloc[:0])
+
+    return frame_digest(iv.loc[iv.index <= last_time, columns])
+
+
+def update_load_index(store, site_id, constituents=None, since=None):
+    """Bring a site's stored load index up to date with its iv table.
+
+    Rows appended to the iv table after the last indexed timestamp are added
+    to the index; the rest of the index is kept. The index is stored with a
+    fingerprint of the discharge and constituent values it was built from,
+    and is rebuilt if it is missing, does not hold the constituents, or if
+    any indexed value has changed since, e.g. after Report.commit rewrote
+    the predictions.
+
+    Parameters
+    ----------
+    store : HDFStore
+    site_id : string
+    constituents : list
+        Columns of the iv table to index. Default is LOAD_INDEX_CONSTITUENTS
+        that are in the table.
+    since : datetime-like
+        Reindex rows at or after this time, whose predictions have changed,
+        e.g. after the site's models were refit. Rows before it are taken as
+        unchanged without checking the fingerprint.
+
+    Returns
+    -------
+    LoadIndex
+    """
+    iv = store.get('/said/{}/iv'.format(site_id)).sort_index()
+    if constituents is None:
+        constituents = [c for c in LOAD_INDEX_CONSTITUENTS if c in iv.columns]
+
+    path = load_index_path(site_id)
+    index = None
+    if path in store.keys():
+        stored = store.get(path)
+        # indexes of other constituents, or of an older layout, are rebuilt
+        if list(stored.columns) == _frame_columns(constituents):
+            index = LoadIndex.from_frame(stored)
+
+    if index is not None:
+        if since is not None:
+            index.truncate(since)
+        else:
+            fingerprint = getattr(store.get_storer(path).attrs, 'fingerprint', None)
+            if fingerprint != _fingerprint(iv, constituents, index.last_time):
+                index = None
+
+    if index is None:
+        index = LoadIndex.build(iv['Discharge'], iv[constituents])
+    else:
+        index.extend(iv['Discharge'], iv[constituents])
+
+    store.put(path, index.to_frame())
+    store.get_storer(path).attrs.fingerprint = _fingerprint(iv, constituents,
+                                                            index.last_time)
+
+    return index
@@ -1,5 +1,21 @@
 #FLUX_CONV = 0.00269688566
 #from qw_reports.reports import make_ssc_model
+"""
+Load integration.
+
+Loads are integrated from discharge and concentration over the actual time
+between observations, so irregular spacing and gaps in a record do not bias
+them. Every load in qw_reports (tables, plots, load indexes and streaming
+predictions) is computed by interval_loads or load_rate.
+
+An interval between consecutive observations is integrated by the
+trapezoid rule, or by the step rule, which holds each observation until the
+next. Intervals longer than max_gap, or with a missing value, are gaps: they
+add no load, and mean annual loads are taken over the time actually covered.
+"""
+import numpy as np
+import pandas as pd
+
 from hygnd.munge import update_merge
 # Conversions
 mg2lbs = 2.20462e-6
@@ -8,17 +24,39 @@ min2sec = 60
 lbs2ton = 0.0005
 interval = 15 * min2sec
 
-FLUX_CONV = mg2lbs * l2cf * interval
+SECONDS_PER_DAY = 24 * 60 * min2sec
+SECONDS_PER_YEAR = 365.25 * SECONDS_PER_DAY
+
+# lbs per second carried by 1 cfs at 1 mg/L
+LOAD_RATE = mg2lbs * l2cf
+
+# lbs per 15-minute interval, see load_ts
+FLUX_CONV = LOAD_RATE * interval
+
+# tons per day, formerly plot.LOAD_FACTOR
+LOAD_FACTOR = LOAD_RATE * SECONDS_PER_DAY * lbs2ton
 
 SAMPLES_PER_YEAR = 4 * 24 * 365.25 #samples per hour * hours * days
 
+RULES = ['trapezoid', 'step']
+DEFAULT_RULE = 'trapezoid'
+
+# longest interval integrated across; staging interpolates gaps up to 2 hours
+DEFAULT_MAX_GAP = pd.Timedelta('2h')
+
 def wy_dates(year):
     start = str(year-1) + '-10-01'
     end = str(year) + '-09-30'
     return start, end
 
+def _units_factor(units):
+    return lbs2ton if units == 'tons' else 1.0
+
 def load_ts(discharge, constituent, units='lbs'):
-    """
+    """Load of each observation of a regular 15-minute record.
+
+    Assumes a 15-minute interval; see interval_loads for records with gaps
+    or irregular spacing.
     """
     df = discharge * constituent * FLUX_CONV
 
@@ -27,10 +65,189 @@ def load_ts(discharge, constituent, units='lbs'):
 
     return df
 
-def mean_annual_load(discharge, constituent, units='lbs', wy=None, year_range=None):
+def load_rate(discharge, constituent, units='lbs', per='second'):
+    """Instantaneous load rate of each observation.
+
+    Parameters
+    ----------
+    discharge : Series or array
+        Discharge in cfs.
+    constituent : Series or array
+        Concentration in mg/L.
+    units : string
+        'lbs' or 'tons'.
+    per : string
+        'second' or 'day'.
+    """
+    seconds = {'second': 1, 'day': SECONDS_PER_DAY}[per]
+
+    return discharge * constituent * (LOAD_RATE * seconds * _units_factor(units))
+
+def _seconds(max_gap):
+    if max_gap is None:
+        return np.inf
+    return pd.Timedelta(max_gap).total_seconds()
+
+def interval_loads(times, rates, rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+    """Load carried in each interval between consecutive observations.
+
+    Parameters
+    ----------
+    times : DatetimeIndex or datetime64 array (n,)
+        Increasing observation times.
+    rates : array (n,) or (n, k)
+        Load rate of each observation per second, see load_rate.
+    rule : string
+        'trapezoid', or 'step' to hold each rate until the next observation.
+    max_gap : Timedelta or string
+        Longest interval integrated across. None bridges every gap.
+
+    Returns
+    -------
+    (loads, seconds) : arrays (n - 1, k)
+        Load of the interval starting at each observation but the last, and
+        the seconds it covers; both 0 for gaps.
+    """
+    if rule not in RULES:
+        raise ValueError('rule must be one of {}'.format(RULES))
+
+    t = np.asarray(times, dtype='datetime64[ns]').view(np.int64)
+    rates = np.asarray(rates, dtype=float)
+    if rates.ndim == 1:
+        rates = rates[:, np.newaxis]
+    dt = (np.diff(t) / 1e9)[:, np.newaxis]
+
+    if rule == 'trapezoid':
+        loads = (rates[:-1] + rates[1:]) * 0.5 * dt
+    else:
+        loads = rates[:-1] * dt
+
+    covered = np.isfinite(loads) & (dt <= _seconds(max_gap))
+
+    return np.where(covered, loads, 0.0), np.where(covered, dt, 0.0)
+
+def water_year(index):
+    """Water year of each timestamp of a DatetimeIndex, as ints.
+
+    October through December belong to the following water year, as in
+    wy_dates.
+    """
+    return index.year + (index.month >= 10)
+
+def period_start(year):
+    """First moment of a water year.
+    """
+    return pd.Timestamp('{}-10-01'.format(int(year) - 1))
+
+def period_keys(index, freq):
+    """Period of each timestamp: its water year for 'WY', else the start of
+    its pandas period, e.g. 'D' or 'M'.
+    """
+    if freq == 'WY':
+        return water_year(index)
+    return index.to_period(freq).start_time
+
+def period_lengths(labels, freq):
+    """Length in seconds of each period, labeled as by period_keys.
+    """
+    if freq == 'WY':
+        starts = pd.DatetimeIndex([period_start(year) for year in labels])
+        ends = pd.DatetimeIndex([period_start(year + 1) for year in labels])
+    else:
+        periods = pd.DatetimeIndex(labels).to_period(freq)
+        starts, ends = periods.start_time, (periods + 1).start_time
+
+    return np.asarray((ends - starts).total_seconds())
+
+def period_loads(discharge, constituents, units='lbs', freq='WY',
+                 rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+    """Load of several constituents in each period, integrated in one pass.
+
+    Each interval is counted in the period in which it starts.
+
+    Parameters
+    ----------
+    discharge : Series
+    constituents : DataFrame or Series
+        Concentrations on the index of discharge.
+    units : string or list
+        'lbs' or 'tons', for all constituents or for each.
+    freq : string
+        'WY' for water years, labeled by year, or a pandas period frequency
+        such as 'D' or 'M', labeled by the start of each period.
+    rule, max_gap
+        See interval_loads.
+
+    Returns
+    -------
+    (loads, seconds, coverage) : DataFrames indexed by period, with the
+    columns of constituents: the load, the seconds covered and the fraction
+    of the period covered.
+    """
+    if isinstance(constituents, pd.Series):
+        constituents = constituents.to_frame()
+    if isinstance(units, str):
+        units = [units] * constituents.shape[1]
+
+    constituents = constituents.sort_index()
+    discharge = discharge.reindex(constituents.index)
+
+    factor = np.array([LOAD_RATE * _units_factor(unit) for unit in units])
+    rates = (constituents.values.astype(float)
+             * discharge.values.astype(float)[:, np.newaxis] * factor)
+
+    loads, seconds = interval_loads(constituents.index, rates, rule, max_gap)
+
+    keys = period_keys(constituents.index[:-1], freq)
+    loads = pd.DataFrame(loads, columns=constituents.columns).groupby(keys).sum()
+    seconds = pd.DataFrame(seconds, columns=constituents.columns).groupby(keys).sum()
+
+    coverage = seconds.div(period_lengths(seconds.index, freq), axis=0)
+
+    return loads, seconds, coverage
+
+def water_year_loads(discharge, constituents, units='lbs', rule=DEFAULT_RULE,
+                     max_gap=DEFAULT_MAX_GAP):
+    """Load, seconds covered and coverage of each water year, see
+    period_loads.
+    """
+    return period_loads(discharge, constituents, units, 'WY', rule, max_gap)
+
+def water_year_mean_load(loads, seconds, first=None, last=None):
+    """Mean annual load over the water years first through last, from the
+    loads and seconds covered of water_year_loads.
+
+    The load is scaled from the time covered to a year, so gaps do not bias
+    it.
+
+    Parameters
+    ----------
+    loads, seconds : DataFrame
+    first, last : int
+        First and last water years. None for the start or end of the record.
+
+    Returns
+    -------
+    Series of the mean annual load of each constituent, NaN where no time in
+    the range is covered.
+    """
+    years = loads.index
+    in_range = np.ones(len(years), dtype=bool)
+    if first is not None:
+        in_range &= years >= int(first)
+    if last is not None:
+        in_range &= years <= int(last)
+
+    covered = seconds[in_range].sum()
+
+    return loads[in_range].sum() / covered.replace(0, np.nan) * SECONDS_PER_YEAR
+
+def mean_annual_load(discharge, constituent, units='lbs', wy=None, year_range=None,
+                     rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
     """Calculate the mean annual load
 
-    Assumes a 15-minute interval.
+    The load integrated over the time covered by the record, scaled to a
+    year.
 
     Parameters
     ----------
@@ -39,34 +256,41 @@ def mean_annual_load(discharge, constituent, units='lbs', wy=None, year_range=No
     wy : string
         Water year in which to calculate load. If None, calculates mean annual
         load of entire record.
+    year_range : list
+        First and last water years, used if wy is None.
+    rule, max_gap
+        See interval_loads.
     """
-    flux = load_ts(discharge, constituent, units)
+    loads, seconds, _ = water_year_loads(discharge, constituent, units, rule,
+                                         max_gap)
 
     if wy:
-        start, end = wy_dates(wy)
-        flux = flux.loc[start:end]
-
+        first = last = wy
     elif year_range:
-        start, _ = wy_dates(year_range[0])
-        _, end = wy_dates(year_range[-1])
-        flux = flux.loc[start:end]
-
+        first, last = year_range[0], year_range[-1]
+    else:
+        first = last = None
 
-    mean_15m_flux = flux.mean()
-    return mean_15m_flux * SAMPLES_PER_YEAR
+    return water_year_mean_load(loads, seconds, first, last).iloc[0]
 
 
-def annual_load(wy, discharge, constituent, units='lbs'):
+def annual_load(wy, discharge, constituent, units='lbs', rule=DEFAULT_RULE,
+                max_gap=DEFAULT_MAX_GAP):
     """ Calculate the measured annual load.
 
+    Gaps add no load; see mean_annual_load for a load corrected for them.
+
     Parameters
     ----------
     discharge : DataFrame
     constituent : DataFrame
     """
-    start, end = wy_dates(wy)
-    flux = load_ts(discharge, constituent, units)
-    return flux.loc[start:end].sum()
+    loads, _, _ = water_year_loads(discharge, constituent, units, rule, max_gap)
+
+    if int(wy) not in loads.index:
+        return 0.0
+
+    return loads.loc[int(wy)].iloc[0]
 
 # OLD FUNCTIONS BELOW
 def phos_load(model1, model2, wy=None):
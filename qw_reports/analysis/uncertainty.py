@@ -0,0 +1,389 @@
+"""
+Uncertainty of loads from the prediction intervals of concentration.
+
+Every modeled constituent has '_L90.0' and '_U90.0' columns next to its
+prediction. The spread of each observation's error is recovered from them,
+on the log scale for constituents modeled in log space and on the linear
+scale otherwise, and propagated to the load of each period in one of two
+ways:
+
+- analytic: the variance of each period's load, integrated by
+  interval_loads with errors that are correlated from one interval to the
+  next (an AR(1) process with the lag-one correlation of correlation_time).
+  Intervals are bounded by a lognormal with that mean and variance.
+- monte_carlo: realizations of the whole record, with the same correlated
+  errors, integrated like the point load. Realizations are drawn in batches
+  of at most max_elements values, so memory does not grow with their
+  number, and the same seed and max_elements always give the same result.
+
+Errors are assumed independent between periods far apart, and observations
+without an interval add no uncertainty.
+
+Examples
+--------
+>>> loads, seconds, _ = water_year_loads(iv['Discharge'], iv['TP'])
+>>> spread = load_realizations(iv['Discharge'], iv['TP'], iv['TP_L90.0'],
+...                            iv['TP_U90.0'], n_realizations=2000)
+>>> mean_annual_load_interval(loads['TP'], seconds['TP'], spread)
+"""
+import numpy as np
+import pandas as pd
+
+from scipy.signal import lfilter
+from scipy.stats import norm
+
+from qw_reports.analysis.loads import (DEFAULT_MAX_GAP, DEFAULT_RULE,
+                                       SECONDS_PER_YEAR, interval_loads,
+                                       load_rate, period_keys, period_loads)
+
+METHODS = ['analytic', 'monte_carlo']
+
+SCALES = ['log', 'linear']
+
+# scale of the prediction intervals of each constituent, from the response
+# of its models: Nitrate is modeled (and filled by process_nitrate) in
+# concentration, TP and SSC in log(concentration)
+CONSTITUENT_SCALES = {'Nitrate': 'linear', 'TP': 'log', 'SSC': 'log'}
+
+# time over which the errors of a surrogate model decorrelate
+DEFAULT_CORRELATION_TIME = pd.Timedelta('1D')
+
+DEFAULT_REALIZATIONS = 1000
+
+# values drawn per batch of realizations; about 32 MB per array
+DEFAULT_MAX_ELEMENTS = 2**22
+
+
+def _z(percentile):
+    return norm.ppf(0.5 + percentile/200.)
+
+
+def interval_sigma(lower, upper, percentile=90.0, scale='log'):
+    """Standard deviation of the error of each observation, from its
+    prediction interval.
+
+    Parameters
+    ----------
+    lower, upper : array
+        Bounds of the prediction interval.
+    percentile : float
+        Width of the interval; 90 for the '_L90.0' and '_U90.0' columns.
+    scale : string
+        'log' for intervals of a model of log(concentration), 'linear'
+        otherwise.
+
+    Returns
+    -------
+    array, on the scale of the model, NaN where the interval is missing.
+    """
+    if scale not in SCALES:
+        raise ValueError('scale must be one of {}'.format(SCALES))
+
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if scale == 'log':
+            width = np.log(upper) - np.log(lower)
+        else:
+            width = upper - lower
+
+    sigma = width / (2 * _z(percentile))
+
+    return np.where(np.isfinite(sigma), sigma, np.nan)
+
+
+def concentration_sd(predicted, sigma, scale='log'):
+    """Standard deviation of concentration about the prediction.
+
+    On the log scale the prediction is taken as the mean of a lognormal.
+    """
+    predicted = np.asarray(predicted, dtype=float)
+
+    if scale == 'log':
+        return predicted * np.sqrt(np.expm1(sigma ** 2))
+
+    return np.asarray(sigma, dtype=float)
+
+
+def lag_correlation(times, correlation_time=DEFAULT_CORRELATION_TIME):
+    """Correlation of the errors of consecutive observations, from the median
+    time between them.
+
+    None for correlation_time gives independent errors, pd.Timedelta.max
+    fully correlated ones.
+    """
+    if correlation_time is None or len(times) < 2:
+        return 0.0
+
+    step = np.median(np.diff(np.asarray(times, dtype='datetime64[ns]').view(np.int64)))
+
+    return float(np.exp(-step / pd.Timedelta(correlation_time).value))
+
+
+def _prepare(discharge, predicted, lower, upper, percentile, scale):
+    """Times, discharge, prediction and error sigma of each observation,
+    sorted and aligned on the prediction.
+    """
+    predicted = predicted.sort_index()
+    times = predicted.index
+
+    sigma = interval_sigma(lower.reindex(times), upper.reindex(times),
+                           percentile, scale)
+
+    return (times, discharge.reindex(times).values.astype(float),
+            predicted.values.astype(float), sigma)
+
+
+def _periods(times, freq):
+    """Period label of each interval, and the position at which each period
+    starts.
+    """
+    keys = pd.Index(period_keys(times[:-1], freq))
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+    return keys[starts], starts
+
+
+def load_variance(discharge, predicted, lower, upper, units='lbs', freq='WY',
+                  scale='log', percentile=90.0,
+                  correlation_time=DEFAULT_CORRELATION_TIME,
+                  rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+    """Variance of the load in each period, see period_loads.
+
+    The standard deviation of each interval's load is integrated from that
+    of its concentrations, as the load itself is. With a lag-one correlation
+    rho between intervals, the variance of a period of intervals with
+    deviations a is sum(a_i a_j rho^|i - j|), computed in one pass with a
+    linear filter.
+
+    Parameters
+    ----------
+    discharge : Series
+    predicted, lower, upper : Series
+        Prediction and the bounds of its interval.
+    units : string
+        'lbs' or 'tons'.
+    freq : string
+        'WY' or a pandas period frequency, see period_loads.
+    scale, percentile
+        See interval_sigma.
+    correlation_time : Timedelta
+        See lag_correlation.
+    rule, max_gap
+        See interval_loads.
+
+    Returns
+    -------
+    Series of variances indexed by period.
+    """
+    times, q, predicted, sigma = _prepare(discharge, predicted, lower, upper,
+                                          percentile, scale)
+    if len(times) < 2:
+        return pd.Series(dtype=float)
+
+    sd = np.nan_to_num(concentration_sd(predicted, sigma, scale))
+    # an interval is integrated only where the point load is
+    covered = np.isfinite(predicted * q)
+    rates = np.where(covered, load_rate(q, sd, units), np.nan)
+    a, _ = interval_loads(times, rates, rule, max_gap)
+    a = a[:, 0]
+
+    labels, starts = _periods(times, freq)
+    rho = lag_correlation(times, correlation_time)
+
+    # r_i = sum over j < i of a_j rho^(i - j), restarted at each period
+    r = lfilter([0, rho], [1, -rho], a)
+    period_start = np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+    r = r - rho ** (np.arange(len(a)) - period_start) * r[period_start]
+
+    variance = np.add.reduceat(a * a + 2 * a * r, starts)
+
+    return pd.Series(variance, index=labels)
+
+
+def _errors(rng, n, size, rho):
+    """Standard normal AR(1) errors, one column per realization.
+    """
+    white = rng.standard_normal((n, size))
+
+    if rho >= 1:
+        return np.broadcast_to(white[:1], (n, size))
+    if rho <= 0:
+        return white
+
+    # scale the first value so that the process starts stationary
+    scale = np.sqrt(1 - rho ** 2)
+    white[0] /= scale
+
+    return lfilter([scale], [1, -rho], white, axis=0)
+
+
+def load_realizations(discharge, predicted, lower, upper, units='lbs',
+                      freq='WY', scale='log', percentile=90.0,
+                      correlation_time=DEFAULT_CORRELATION_TIME,
+                      n_realizations=DEFAULT_REALIZATIONS, seed=0,
+                      max_elements=DEFAULT_MAX_ELEMENTS,
+                      rule=DEFAULT_RULE, max_gap=DEFAULT_MAX_GAP):
+    """Monte Carlo realizations of the load in each period.
+
+    Each realization perturbs every prediction by a correlated error with
+    the spread of its interval, lognormal about the prediction on the log
+    scale and normal, clipped at zero, on the linear scale, and integrates
+    the record as period_loads does.
+
+    Parameters
+    ----------
+    n_realizations : int
+    seed : int
+    max_elements : int
+        Most values drawn at once; realizations are drawn in batches of
+        max_elements // len(predicted), at least one.
+
+    See load_variance for the other parameters.
+
+    Returns
+    -------
+    DataFrame indexed by period, one column per realization.
+    """
+    times, q, predicted, sigma = _prepare(discharge, predicted, lower, upper,
+                                          percentile, scale)
+    n = len(times)
+    if n < 2:
+        return pd.DataFrame(columns=range(n_realizations), dtype=float)
+
+    sigma = np.nan_to_num(sigma)[:, np.newaxis]
+    predicted = predicted[:, np.newaxis]
+    factor = load_rate(q, 1.0, units)[:, np.newaxis]
+
+    labels, starts = _periods(times, freq)
+    rho = lag_correlation(times, correlation_time)
+    rng = np.random.default_rng(seed)
+
+    batch = max(1, min(n_realizations, max_elements // n))
+    realizations = np.empty((len(labels), n_realizations))
+
+    for start in range(0, n_realizations, batch):
+        stop = min(start + batch, n_realizations)
+        errors = _errors(rng, n, stop - start, rho)
+
+        if scale == 'log':
+            concentration = predicted * np.exp(sigma * errors - sigma ** 2 / 2)
+        else:
+            concentration = np.maximum(predicted + sigma * errors, 0)
+
+        loads, _ = interval_loads(times, concentration * factor, rule, max_gap)
+        realizations[:, start:stop] = np.add.reduceat(loads, starts, axis=0)
+
+    return pd.DataFrame(realizations, index=labels)
+
+
+def lognormal_interval(mean, sd, percentile=90.0):
+    """Bounds of the lognormal with a mean and standard deviation.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s2 = np.log1p((sd / mean) ** 2)
+        mu = np.log(mean) - s2 / 2
+
+    z = _z(percentile)
+
+    return np.exp(mu - z * np.sqrt(s2)), np.exp(mu + z * np.sqrt(s2))
+
+
+def period_load_intervals(discharge, predicted, lower, upper, method='analytic',
+                          percentile=90.0, **kwargs):
+    """Load of each period with the bounds of its interval.
+
+    Parameters
+    ----------
+    method : string
+        'analytic' (see load_variance) or 'monte_carlo' (see
+        load_realizations).
+    percentile : float
+        Width of the prediction interval columns, and of the load interval.
+
+    Other keyword arguments are passed to load_variance or
+    load_realizations, e.g. units, freq and scale.
+
+    Returns
+    -------
+    DataFrame indexed by period with the load and its lower and upper
+    bounds.
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}'.format(METHODS))
+
+    loads, _, _ = period_loads(discharge, predicted, kwargs.get('units', 'lbs'),
+                               kwargs.get('freq', 'WY'),
+                               kwargs.get('rule', DEFAULT_RULE),
+                               kwargs.get('max_gap', DEFAULT_MAX_GAP))
+    load = loads.iloc[:, 0]
+
+    if method == 'analytic':
+        variance = load_variance(discharge, predicted, lower, upper,
+                                 percentile=percentile, **kwargs)
+        low, high = lognormal_interval(load, np.sqrt(variance.reindex(load.index)),
+                                       percentile)
+    else:
+        realizations = load_realizations(discharge, predicted, lower, upper,
+                                         percentile=percentile, **kwargs)
+        low, high = _quantiles(realizations.reindex(load.index), percentile)
+
+    return pd.DataFrame({'load': load, 'lower': low, 'upper': high},
+                        index=load.index)
+
+
+def _quantiles(realizations, percentile):
+    tail = (100 - percentile) / 200.
+
+    return (realizations.quantile(tail, axis=1),
+            realizations.quantile(1 - tail, axis=1))
+
+
+def mean_annual_load_interval(loads, seconds, spread, first=None, last=None,
+                              percentile=90.0):
+    """Bounds of the mean annual load over the water years first through
+    last, as computed by water_year_mean_load.
+
+    Parameters
+    ----------
+    loads, seconds : Series
+        Load and seconds covered of one constituent by water year, from
+        water_year_loads.
+    spread : Series or DataFrame
+        Load variance by water year from load_variance, or load realizations
+        by water year from load_realizations.
+    first, last : int
+        First and last water years. None for the start or end of the record.
+    percentile : float
+
+    Returns
+    -------
+    (lower, upper), NaN where no time in the range is covered or spread is
+    None.
+    """
+    if spread is None:
+        return np.nan, np.nan
+
+    years = loads.index
+    in_range = np.ones(len(years), dtype=bool)
+    if first is not None:
+        in_range &= years >= int(first)
+    if last is not None:
+        in_range &= years <= int(last)
+
+    covered = seconds[in_range].sum()
+    if covered == 0:
+        return np.nan, np.nan
+
+    scale = SECONDS_PER_YEAR / covered
+    spread = spread.reindex(years[in_range])
+
+    if isinstance(spread, pd.DataFrame):
+        low, high = _quantiles(spread.sum().to_frame().T * scale, percentile)
+        return low.iloc[0], high.iloc[0]
+
+    mean = loads[in_range].sum() * scale
+    sd = np.sqrt(spread.sum()) * scale
+
+    return lognormal_interval(mean, sd, percentile)
@@ -0,0 +1,197 @@
+"""
+On-disk cache of fitted HierarchicalModel sub-models.
+
+Entries are keyed by a content hash of everything a fit depends on: the
+samples, the surrogate values they are matched to, the model list and the
+fitting options. Each entry holds the FittedModel of every sub-model, with its
+coefficients, covariance, diagnostics and bias correction, so a model built
+from unchanged inputs is ready to predict without fitting.
+
+Examples
+--------
+>>> cache = ModelCache('model_cache', max_bytes=2**28)
+>>> model = HierarchicalModel(con_df, sur_df, model_list, cache=cache)
+>>> cache.stats()
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+# bump when FittedModel changes so that stale entries are not loaded
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 2**28
+
+
+def _hash_frame(digest, df):
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+
+def frame_digest(df):
+    """Content hash of a DataFrame or Series, including its index and
+    column names.
+    """
+    digest = hashlib.sha1()
+    _hash_frame(digest, df)
+    return digest.hexdigest()
+
+
+def model_key(constituent_df, surrogate_df, model_list, match_time, min_samples,
+              p_thres, match_method='said'):
+    """Content hash of the inputs of a HierarchicalModel fit.
+
+    Parameters
+    ----------
+    constituent_df : DataFrame
+        Samples of the constituent.
+    surrogate_df : DataFrame
+        Surrogate values the samples are matched to, limited to the
+        surrogates of the model list.
+    model_list : list
+    match_time, min_samples, p_thres
+        Fitting options of the HierarchicalModel.
+    match_method : string
+        'said' for fits matched by said, 'index' for fits from a match
+        index, whose samples can differ.
+
+    Returns
+    -------
+    Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((CACHE_VERSION, model_list, match_time, min_samples,
+                        p_thres, match_method)).encode())
+    _hash_frame(digest, constituent_df)
+    _hash_frame(digest, surrogate_df)
+
+    return digest.hexdigest()
+
+
+class ModelCache:
+    """Size-bounded directory of fitted sub-models.
+
+    When the entries exceed max_bytes the least recently used are removed.
+    Entries are written atomically, so several processes may share a cache.
+
+    Parameters
+    ----------
+    path : string
+        Cache directory, created if missing.
+    max_bytes : int
+        Upper bound on the total size of the entries.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Counts for this instance.
+    """
+    suffix = '.pkl'
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def _entries(self):
+        """(path, size, last use) of every entry.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            entries.append((path, stat.st_size, stat.st_mtime))
+
+        return entries
+
+    def get(self, key):
+        """Cached fits for key, or None.
+        """
+        path = self._entry_path(key)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.misses += 1
+            return None
+
+        try:
+            with f:
+                fits = pickle.load(f)
+        # truncated, or pickled before a class or module it holds was moved
+        # or renamed
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return fits
+
+    def put(self, key, fits):
+        """Store fits under key and evict old entries beyond max_bytes.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(fits, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._entry_path(key))
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        max_bytes.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+
+        # the newest entry is kept even if it alone exceeds the bound
+        for path, size, _ in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    @property
+    def nbytes(self):
+        """Total size of the entries.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def stats(self):
+        """Hit, miss and eviction counts, entry count and size.
+        """
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
@@ -0,0 +1,270 @@
+"""
+Run the Reports of many sites in parallel.
+
+HDF5 files cannot take concurrent writers, so workers never touch the store.
+The main process reads each site's tables and sends them to a worker, which
+runs the site's Report against an in-memory store and sends back the tables
+it wrote. A single writer thread drains those writes from a queue into the
+store. Reads and writes share a lock, so the store is only ever accessed by
+one thread at a time.
+
+Examples
+--------
+>>> with pd.HDFStore('said.h5') as store:
+...     driver = ReportDriver(store, Project('il_nu_net.json'), n_workers=4)
+...     failures = driver.run()
+"""
+import os
+import queue
+import threading
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from qw_reports.reports import Report
+
+# tables of a site read by a Report
+SITE_TABLES = ['iv', 'qwdata', 'match']
+
+OUTPUT_DIRECTORIES = ['model_data', 'report', 'plots']
+
+
+class MemoryStore:
+    """Dictionary of tables with the get, put and keys methods of HDFStore
+    used by Report. Tables put are also kept in updates.
+    """
+    def __init__(self, tables):
+        self._tables = dict(tables)
+        self.updates = {}
+
+    def keys(self):
+        return list(self._tables.keys())
+
+    def __contains__(self, path):
+        return path in self._tables
+
+    def get(self, path):
+        return self._tables[path]
+
+    def put(self, path, df):
+        self._tables[path] = df
+        self.updates[path] = df
+
+
+class StoreWriter(threading.Thread):
+    """Thread that writes queued tables to a store, one site at a time.
+
+    Parameters
+    ----------
+    store : HDFStore
+    lock : threading.Lock
+        Held for every access to the store.
+    maxsize : int
+        Largest number of sites waiting to be written; further puts block.
+    """
+    def __init__(self, store, lock, maxsize=0):
+        super().__init__(daemon=True)
+        self.store = store
+        self.lock = lock
+        self.queue = queue.Queue(maxsize)
+        # site id -> traceback of a failed write
+        self.failures = {}
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            site_id, tables = item
+            try:
+                with self.lock:
+                    for path, df in tables.items():
+                        self.store.put(path, df)
+            except Exception:
+                self.failures[site_id] = traceback.format_exc()
+
+    def put(self, site_id, tables):
+        """Queue the tables of a site for writing.
+        """
+        self.queue.put((site_id, tables))
+
+    def close(self):
+        """Write everything queued and stop.
+        """
+        self.queue.put(None)
+        self.join()
+
+
+def run_site(site, tables, min_samples=10, cache=None, plots=True,
+             changed_only=False, force=False):
+    """Run the Report of one site against in-memory tables.
+
+    Returns
+    -------
+    (tables written by the Report, model summary table, artifacts skipped
+    and regenerated)
+    """
+    store = MemoryStore(tables)
+
+    report = Report(store, site, min_samples=min_samples, cache=cache,
+                    force=force)
+    report.run_all_models(changed_only=changed_only)
+    if plots:
+        report.generate_plots()
+
+    return store.updates, report.summary_table, report.artifacts()
+
+
+class ReportDriver:
+    """Run Report.run_all_models and Report.generate_plots for many sites.
+
+    Parameters
+    ----------
+    store : HDFStore
+        Open store holding the /said/{id}/ tables of every site.
+    project_template : Project or list
+        Project with a sites attribute, or a list of site dicts.
+    n_workers : int
+        Number of worker processes. None uses every core; 1 runs each site
+        in this process.
+    min_samples : int
+        Passed to Report.
+    cache : ModelCache
+        Passed to Report.
+    plots : bool
+        Also run generate_plots.
+    changed_only : bool
+        Passed to Report.run_all_models.
+    force : bool
+        Regenerate every report file and figure, even those whose inputs are
+        unchanged. Passed to Report.
+
+    Attributes
+    ----------
+    failures : dict
+        Traceback of every site that failed, by site id.
+    summary : DataFrame
+        Model summary of every site that succeeded.
+    artifacts : DataFrame
+        Report files and figures of every site that succeeded, and whether
+        each was skipped or regenerated.
+    """
+    def __init__(self, store, project_template, n_workers=None, min_samples=10,
+                 cache=None, plots=True, changed_only=False, force=False):
+        self.store = store
+        self.sites = getattr(project_template, 'sites', project_template)
+        self.n_workers = n_workers or os.cpu_count()
+        self.min_samples = min_samples
+        self.cache = cache
+        self.plots = plots
+        self.changed_only = changed_only
+        self.force = force
+
+        self.failures = {}
+        self.summary = None
+        self.artifacts = None
+
+        self._lock = threading.Lock()
+
+    def _read_tables(self, site):
+        db_path = '/said/{}/'.format(site['id'])
+
+        with self._lock:
+            keys = set(self.store.keys())
+            return {db_path + table: self.store.get(db_path + table)
+                    for table in SITE_TABLES if db_path + table in keys}
+
+    def run(self):
+        """Run every site.
+
+        A site that fails is recorded in failures and the others continue.
+
+        Returns
+        -------
+        failures
+        """
+        for directory in OUTPUT_DIRECTORIES:
+            os.makedirs(directory, exist_ok=True)
+
+        self.failures = {}
+        summaries = []
+        artifacts = []
+
+        writer = StoreWriter(self.store, self._lock, maxsize=self.n_workers)
+        writer.start()
+
+        def collect(site, result=None, error=None):
+            if error is not None:
+                self.failures[site['id']] = error
+                return
+
+            tables, summary, site_artifacts = result
+            writer.put(site['id'], tables)
+            summaries.append(summary.assign(site=site['id']))
+            artifacts.append(site_artifacts.assign(site=site['id']))
+
+        def options():
+            return dict(min_samples=self.min_samples, cache=self.cache,
+                        plots=self.plots, changed_only=self.changed_only,
+                        force=self.force)
+
+        try:
+            if self.n_workers == 1:
+                for site in self.sites:
+                    try:
+                        result = run_site(site, self._read_tables(site), **options())
+                    except Exception:
+                        collect(site, error=traceback.format_exc())
+                    else:
+                        collect(site, result)
+
+            else:
+                self._run_pool(collect, options())
+
+        finally:
+            writer.close()
+
+        self.failures.update(writer.failures)
+        if summaries:
+            self.summary = pd.concat(summaries, ignore_index=True)
+        if artifacts:
+            self.artifacts = pd.concat(artifacts, ignore_index=True)
+
+        return self.failures
+
+    def _run_pool(self, collect, options):
+        """Keep at most two sites per worker in flight, so that only a few
+        sites' tables are held in memory at once.
+        """
+        sites = iter(self.sites)
+        pending = {}
+
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            while True:
+                while len(pending) < 2 * self.n_workers:
+                    site = next(sites, None)
+                    if site is None:
+                        break
+                    try:
+                        tables = self._read_tables(site)
+                    except Exception:
+                        collect(site, error=traceback.format_exc())
+                        continue
+                    future = executor.submit(run_site, site, tables, **options)
+                    pending[future] = site
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    site = pending.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        collect(site, error=''.join(traceback.format_exception(
+                            type(error), error, error.__traceback__)))
+                    else:
+                        collect(site, future.result())
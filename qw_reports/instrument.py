@@ -0,0 +1,295 @@
+"""
+Opt-in timing and memory instrumentation of the report pipeline.
+
+Stages of the pipeline (staging, reading, fitting, prediction, writing, load
+computation, tables, events and plotting) run inside stage() blocks. When
+tracing is enabled each block appends a JSON line to the trace file with its
+wall time, CPU time, peak RSS delta and rows processed, tagged with the site
+and constituent it ran for. When tracing is disabled stage() does nothing.
+
+Tracing is enabled through the environment, so worker processes started by
+ReportDriver or Scheduler trace to the same file.
+
+Examples
+--------
+>>> instrument.enable('trace.jsonl', profile='fit')
+>>> with instrument.tags(site='05586300', constituent='TP'):
+...     with instrument.stage('fit', rows=len(con_df)):
+...         model = HierarchicalModel(con_df, sur_df, model_list)
+>>> instrument.summary('trace.jsonl')
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TRACE_ENV = 'QW_REPORTS_TRACE'
+PROFILE_ENV = 'QW_REPORTS_PROFILE'
+
+STAGES = ['stage', 'read', 'fit', 'predict', 'write', 'loads', 'tables', 'events',
+          'plot']
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes, or None.
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Tracer:
+    """Write a JSON line per stage to a trace file.
+
+    Each record holds:
+
+    - stage, site, constituent and any other tags
+    - rows: number of rows processed, when known
+    - start: Unix time at which the stage started
+    - wall: wall time in seconds
+    - cpu: CPU time of the calling thread in seconds
+    - peak_rss_delta: bytes by which the stage raised the process's peak RSS
+    - pid
+    - error: name of the exception raised by the stage, if any
+
+    Stages may be nested. Tags are inherited by the stages inside them, and
+    the time of an inner stage is also counted in the outer one.
+
+    Parameters
+    ----------
+    path : string
+        Trace file, appended to.
+    profile : string
+        Name of a stage to capture with cProfile. Each capture is dumped next
+        to the trace file as <trace>.<stage>.<pid>.<n>.prof, and its path is
+        recorded as profile. Stages running while another capture is active
+        in the process are not captured.
+    """
+    def __init__(self, path, profile=None):
+        self.path = path
+        self.profile = profile
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # cProfile captures cannot overlap
+        self._profiling = threading.Lock()
+        self._captures = 0
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+
+        return self._local.stack
+
+    @contextmanager
+    def tags(self, **tags):
+        """Tag every stage run inside the block, without recording a stage.
+        """
+        stack = self._stack()
+        context = dict(stack[-1]) if stack else {}
+        context.update((k, v) for k, v in tags.items() if v is not None)
+
+        stack.append(context)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def stage(self, name, rows=None, **tags):
+        """Record a stage.
+
+        Yields
+        ------
+        The record, so that rows or other fields known only after the stage
+        can be set on it.
+        """
+        with self.tags(**tags):
+            record = {'stage': name}
+            record.update(self._stack()[-1])
+            record['rows'] = rows
+
+            profiler = None
+            if name == self.profile and self._profiling.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+            start = time.time()
+            peak = _peak_rss()
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+
+            try:
+                yield record
+
+            except BaseException as error:
+                record['error'] = type(error).__name__
+                raise
+
+            finally:
+                record['start'] = start
+                record['wall'] = time.perf_counter() - wall
+                record['cpu'] = time.thread_time() - cpu
+                if peak is not None:
+                    record['peak_rss_delta'] = _peak_rss() - peak
+                record['pid'] = os.getpid()
+
+                if profiler is not None:
+                    profiler.disable()
+                    record['profile'] = self._dump(profiler, name)
+                    self._profiling.release()
+
+                self.write(record)
+
+    def _dump(self, profiler, name):
+        with self._lock:
+            self._captures += 1
+            n = self._captures
+
+        path = '{}.{}.{}.{}.prof'.format(os.path.splitext(self.path)[0], name,
+                                         os.getpid(), n)
+        profiler.dump_stats(path)
+
+        return path
+
+    def write(self, record):
+        """Append a record to the trace file.
+        """
+        line = json.dumps(record, default=str) + '\n'
+
+        # lines are written whole, so processes can share the file
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+_tracer = None
+
+
+def enable(path, profile=None):
+    """Trace every stage of this process and of worker processes started
+    from it to path.
+
+    Parameters
+    ----------
+    path : string
+        Trace file, appended to.
+    profile : string
+        Name of a stage to capture with cProfile, see Tracer.
+    """
+    global _tracer
+
+    os.environ[TRACE_ENV] = path
+    if profile:
+        os.environ[PROFILE_ENV] = profile
+    else:
+        os.environ.pop(PROFILE_ENV, None)
+
+    _tracer = Tracer(path, profile)
+
+
+def disable():
+    """Stop tracing.
+    """
+    global _tracer
+
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(PROFILE_ENV, None)
+    _tracer = None
+
+
+def get_tracer():
+    """The active Tracer, or None if tracing is disabled.
+    """
+    global _tracer
+
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+
+    # worker processes enable from the environment set by their parent
+    if _tracer is None or _tracer.path != path:
+        _tracer = Tracer(path, os.environ.get(PROFILE_ENV))
+
+    return _tracer
+
+
+@contextmanager
+def tags(**tags):
+    """Tag every stage run inside the block, see Tracer.tags.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield
+        return
+
+    with tracer.tags(**tags):
+        yield
+
+
+@contextmanager
+def stage(name, rows=None, **tags):
+    """Record a stage if tracing is enabled, see Tracer.stage.
+
+    Yields a record dict either way; when tracing is disabled it is discarded.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield {}
+        return
+
+    with tracer.stage(name, rows=rows, **tags) as record:
+        yield record
+
+
+def read_trace(path):
+    """Records of a trace file as a DataFrame.
+    """
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    return pd.DataFrame(records)
+
+
+def summary(path, by=('stage',)):
+    """Totals of a trace file.
+
+    Parameters
+    ----------
+    path : string
+        Trace file.
+    by : sequence
+        Fields to group by, e.g. ('site', 'stage').
+
+    Returns
+    -------
+    DataFrame of the count, wall and CPU time, largest peak RSS delta and rows
+    of each group, slowest first.
+    """
+    trace = read_trace(path)
+    for column in ['rows', 'peak_rss_delta']:
+        if column not in trace:
+            trace[column] = float('nan')
+
+    groups = trace.groupby(list(by), dropna=False)
+    table = pd.DataFrame({'count': groups.size(),
+                          'wall': groups['wall'].sum(),
+                          'cpu': groups['cpu'].sum(),
+                          'peak_rss_delta': groups['peak_rss_delta'].max(),
+                          'rows': groups['rows'].sum()})
+
+    return table.sort_values('wall', ascending=False)
@@ -0,0 +1,133 @@
+"""
+Manifest of the report artifacts written for a site.
+
+Each artifact (a report text file, figure or summary table) is recorded with
+a content hash of the inputs it was drawn from: the slice of data it shows,
+the model list and the plotting parameters. An artifact whose inputs hash to
+the recorded key, and whose file still exists, is not generated again.
+
+Examples
+--------
+>>> manifest = ArtifactManifest('report/site_manifest.json')
+>>> key = artifact_key(sur_df[['Discharge', 'TP']], con_df['TP'], 'tp')
+>>> manifest.build('plots/site_tp.png', key, plot_tp, con_df, sur_df,
+...                filename='plots/site_tp.png')
+>>> manifest.save()
+>>> manifest.report()
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from qw_reports.cache import _hash_frame
+
+# bump when the artifacts change without their inputs changing
+MANIFEST_VERSION = 1
+
+
+def artifact_key(*inputs):
+    """Content hash of the inputs of an artifact.
+
+    DataFrames and Series are hashed by content, including their index and
+    column names; anything else by its repr.
+
+    Returns
+    -------
+    Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(MANIFEST_VERSION).encode())
+
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            _hash_frame(digest, value)
+        else:
+            digest.update(repr(value).encode())
+
+    return digest.hexdigest()
+
+
+class ArtifactManifest:
+    """Input hashes of the artifacts written for a site.
+
+    Parameters
+    ----------
+    path : string
+        JSON file holding the manifest. Read if it exists.
+    force : bool
+        Generate every artifact, even those that are current.
+
+    Attributes
+    ----------
+    skipped, regenerated : list
+        Paths of the artifacts skipped and generated by this instance.
+    """
+    def __init__(self, path, force=False):
+        self.path = path
+        self.force = force
+
+        self.skipped = []
+        self.regenerated = []
+
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_current(self, artifact, key):
+        """Whether artifact exists and was generated from inputs hashing to key.
+        """
+        if self.force:
+            return False
+
+        return self.entries.get(artifact) == key and os.path.exists(artifact)
+
+    def record(self, artifact, key):
+        """Record that artifact was generated from inputs hashing to key.
+        """
+        self.entries[artifact] = key
+        self.regenerated.append(artifact)
+
+    def build(self, artifact, key, func, *args, **kwargs):
+        """Call func(*args, **kwargs) to generate artifact, unless it is
+        current.
+
+        Returns
+        -------
+        True if the artifact was generated.
+        """
+        if self.is_current(artifact, key):
+            self.skipped.append(artifact)
+            return False
+
+        func(*args, **kwargs)
+        self.record(artifact, key)
+
+        return True
+
+    def save(self):
+        """Write the manifest atomically.
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def report(self):
+        """Status, 'skipped' or 'regenerated', of each artifact handled by
+        this instance.
+
+        Returns
+        -------
+        DataFrame with artifact and status columns.
+        """
+        rows = ([(path, 'skipped') for path in self.skipped] +
+                [(path, 'regenerated') for path in self.regenerated])
+
+        return pd.DataFrame(rows, columns=['artifact', 'status'])
@@ -0,0 +1,152 @@
+"""
+Index matching discrete samples to the nearest continuous (IV) record.
+
+The index is stored alongside the qwdata at /said/{id}/match and holds, for
+each sample, the position of the nearest IV row, its time, the signed offset
+in minutes and the surrogate values of that row. Prediction columns written
+to the iv table by Report.commit are not surrogates and are left out, so the
+index does not change when predictions do.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+MATCH_COLS = ['iv_pos', 'iv_time', 'offset']
+
+# prediction interval bounds, e.g. TP_L90.0 and NitrateSurr_U90.0
+_INTERVAL_COLUMN = re.compile(r'_[LU]\d+(\.\d+)?$')
+
+
+def surrogate_columns(columns):
+    """Columns of an iv table other than predictions: each constituent with
+    a '<constituent>_model' column, that column, and every prediction
+    interval bound.
+    """
+    columns = list(columns)
+    predicted = set()
+    for col in columns:
+        if isinstance(col, str) and col.endswith('_model'):
+            predicted.update([col, col[:-len('_model')]])
+
+    return [col for col in columns if col not in predicted
+            and not (isinstance(col, str) and _INTERVAL_COLUMN.search(col))]
+
+
+def _nearest(iv_times, sample_times):
+    """Positions of the nearest iv_times for each of sample_times.
+
+    iv_times must be sorted.
+    """
+    n = len(iv_times)
+    right = np.searchsorted(iv_times, sample_times)
+    left = np.clip(right - 1, 0, n - 1)
+    right = np.clip(right, 0, n - 1)
+
+    use_right = np.abs(iv_times[right] - sample_times) < np.abs(sample_times - iv_times[left])
+    return np.where(use_right, right, left)
+
+
+def _index_frame(iv, samples, positions):
+    """Assemble match index rows for the samples matched to positions in iv.
+
+    samples is the DatetimeIndex of the samples.
+    """
+    offset = (samples.values - iv.index.values[positions]) / np.timedelta64(1, 'm')
+
+    index = pd.DataFrame({'iv_pos': positions.astype(np.int64),
+                          'iv_time': iv.index[positions],
+                          'offset': offset},
+                         index=samples)
+
+    surrogates = iv.iloc[positions][surrogate_columns(iv.columns)]
+    for col in surrogates.columns:
+        index[col] = surrogates[col].values
+
+    return index
+
+
+def build_match_index(iv, qwdata):
+    """Match each sample in qwdata to the nearest row of iv.
+
+    Uses a single sorted search over the IV timestamps.
+
+    Parameters
+    ----------
+    iv : DataFrame
+        Continuous surrogate record with a sorted DatetimeIndex.
+    qwdata : DataFrame
+        Discrete samples.
+
+    Returns
+    -------
+    DataFrame indexed by sample time with columns MATCH_COLS followed by the
+    surrogate values of the matched IV row (see surrogate_columns).
+    """
+    if iv.empty or qwdata.empty:
+        return pd.DataFrame(columns=MATCH_COLS + surrogate_columns(iv.columns),
+                            index=qwdata.index[:0])
+
+    positions = _nearest(iv.index.values, qwdata.index.values)
+
+    return _index_frame(iv, qwdata.index, positions)
+
+
+def update_match_index(match_index, iv, qwdata):
+    """Update a match index after new samples or IV rows arrive.
+
+    Only new samples and samples for which a closer IV row has appeared are
+    searched again; surrogate values are refreshed from iv for every sample. If
+    the IV record was shifted, e.g. by prepending data, the index is rebuilt.
+    """
+    if match_index is None or match_index.empty or iv.empty:
+        return build_match_index(iv, qwdata)
+
+    iv_times = iv.index.values
+    positions = match_index['iv_pos'].values.astype(np.int64)
+
+    # positions must still point at the same IV timestamps
+    if positions.max() >= len(iv_times) or \
+            (iv.index[positions] != match_index['iv_time']).any():
+        return build_match_index(iv, qwdata)
+
+    # drop samples that were removed, keep the known ones
+    match_index = match_index[match_index.index.isin(qwdata.index)]
+    positions = match_index['iv_pos'].values.astype(np.int64)
+    sample_times = match_index.index.values
+
+    # a closer row can only have appeared after the matched row
+    after = np.clip(positions + 1, 0, len(iv_times) - 1)
+    stale = np.abs(iv_times[after] - sample_times) < \
+        np.abs(sample_times - iv_times[positions])
+    positions[stale] = _nearest(iv_times, sample_times[stale])
+
+    new_samples = qwdata.index[~qwdata.index.isin(match_index.index)]
+
+    samples = match_index.index.append(new_samples)
+    positions = np.concatenate([positions, _nearest(iv_times, new_samples.values)])
+
+    order = np.argsort(samples.values, kind='mergesort')
+
+    return _index_frame(iv, samples[order], positions[order])
+
+
+def matched_surrogates(match_index, match_time=30):
+    """Surrogate values matched to each sample within match_time.
+
+    Parameters
+    ----------
+    match_index : DataFrame
+        As returned by build_match_index.
+    match_time : float
+        Maximum offset, in minutes, between a sample and its IV row.
+
+    Returns
+    -------
+    DataFrame indexed by sample time, with NaN where no IV row was within
+    match_time.
+    """
+    surrogates = match_index.drop(MATCH_COLS, axis=1)
+    surrogates.loc[match_index['offset'].abs().values > match_time] = np.nan
+
+    return surrogates
@@ -3,12 +3,16 @@ import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import matplotlib as mpl
 
+from matplotlib.figure import Figure
+
 from math import ceil
+from concurrent.futures import ProcessPoolExecutor
 
 
 from said.surrogatemodel import SurrogateRatingModel
 from linearmodel.datamanager import DataManager
 
+from scipy.stats import t as t_dist
 from statsmodels.iolib.summary import Summary
 from statsmodels.iolib.table import SimpleTable
 
@@ -23,21 +27,454 @@ import pandas as pd
 
 #XXX write out each import
 from qw_reports.plot import *
+from qw_reports import instrument
+from qw_reports.cache import model_key
+from qw_reports.match import build_match_index, matched_surrogates
+from qw_reports.scenarios import scenario_frame
+from qw_reports.validation import LeaveOneOut
+
+SUMMARY_COLS = ['model','# obs','adjusted r^2','p-value','PRESS','LOO r^2',
+                'LOO coverage']
+
+# rows evaluated at a time by PredictionEngine, about two years of 15-minute
+# data or 0.5 MB of design matrix per model term
+DEFAULT_CHUNK_SIZE = 2**16
+
+# transforms recognized by linearmodel.model.find_raw_variable
+TRANSFORM_FUNCTIONS = {
+    None: lambda x: x,
+    'log': np.log,
+    'log10': np.log10,
+    'sqrt': np.sqrt,
+    'pow2': np.square,
+    'reciprocal': np.reciprocal,
+}
+
+INVERSE_TRANSFORM_FUNCTIONS = {
+    None: lambda x: x,
+    'log': np.exp,
+    'log10': lambda x: np.power(10, x),
+    'sqrt': np.square,
+    'pow2': np.sqrt,
+    'reciprocal': np.reciprocal,
+}
+
+
+def duan_smearing(residuals, transform):
+    """Duan's nonparametric bias-correction factor for a retransformed response.
+
+    Only log transforms are corrected; other transforms return 1.
+    """
+    residuals = np.asarray(residuals, dtype=float)
+
+    if transform in ('log', 'log10') and residuals.size > 0:
+        return INVERSE_TRANSFORM_FUNCTIONS[transform](residuals).mean()
+
+    else:
+        return 1.0
+
+
+class FittedModel:
+    """Cached result of fitting one sub-model of a HierarchicalModel.
+
+    Holds everything downstream code needs from the statsmodels fit, so that
+    each sub-model is fit exactly once.
+
+    Parameters
+    ----------
+    results : RegressionResults
+        Fitted statsmodels OLS results.
+    formula : string
+        Model formula, e.g. 'log(SSC) ~ log(Turb_HACH)'.
+    """
+    def __init__(self, results, formula):
+        self.formula = formula
+
+        self.response = results.model.endog_names
+        self.response_transform, self.raw_response = \
+            saidmodel.find_raw_variable(self.response)
+
+        self.exog_names = list(results.model.exog_names)
+        # (transform, raw variable) of each non-intercept term
+        self.terms = [saidmodel.find_raw_variable(name)
+                      for name in self.exog_names if name != 'Intercept']
+
+        self.params = np.asarray(results.params, dtype=float)
+        self.cov_params = np.asarray(results.cov_params(), dtype=float)
+
+        # samples the model was fit to
+        self.exog = np.asarray(results.model.exog, dtype=float)
+        self.endog = np.asarray(results.model.endog, dtype=float)
+        self.sample_times = pd.DatetimeIndex(results.model.data.row_labels)
+
+        self.resid = np.asarray(results.resid, dtype=float)
+        self.mse = results.mse_resid
+        self.df_resid = results.df_resid
+
+        self.nobs = results.nobs
+        self.rsquared = results.rsquared
+        self.rsquared_adj = results.rsquared_adj
+        self.f_pvalue = results.f_pvalue
+
+        self.bias_correction = duan_smearing(self.resid,
+                                             self.response_transform)
+
+        self.loo = LeaveOneOut(self.exog, self.endog)
+
+    def summary_row(self):
+        """Row of statistics matching SUMMARY_COLS.
+        """
+        return [self.formula, self.nobs, self.rsquared_adj, self.f_pvalue,
+                self.loo.press, self.loo.rsquared, self.loo.coverage]
+
+
+class SurrogateData:
+    """Read-only, array-backed view of a site's surrogate record.
+
+    One instance is meant to be shared by every HierarchicalModel of a site,
+    and through them by every sub-model. Float columns are read as views of
+    the source frame rather than copied, and each (raw variable, transform)
+    pair is computed once and kept as a read-only contiguous float array, so
+    memory scales with the number of distinct transformed variables rather
+    than with the number of constituents or model terms.
+
+    The source frame must not be modified in place while it is in use.
+
+    Parameters
+    ----------
+    surrogate_df : DataFrame
+        Raw surrogate record.
+    """
+    def __init__(self, surrogate_df):
+        self.index = surrogate_df.index
+        self._df = surrogate_df
+        self._columns = {}
+        # bytes of each column that were allocated rather than viewed
+        self._allocated = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, transform, raw_variable):
+        """Return the transformed column, computing it on first use.
+
+        Surrogates missing from the record are returned as NaN.
+        """
+        key = (raw_variable, transform)
+
+        if key not in self._columns:
+            if raw_variable in self._df:
+                values = np.ascontiguousarray(self._df[raw_variable], dtype=float)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values = TRANSFORM_FUNCTIONS[transform](values)
+            else:
+                values = np.full(len(self), np.nan)
+
+            self._allocated[key] = values.nbytes if values.flags.owndata else 0
+
+            # flag a view of our own so the source frame stays writeable
+            values = values.view()
+            values.flags.writeable = False
+            self._columns[key] = values
+
+        return self._columns[key]
+
+    def columns(self, terms, rows=None):
+        """Columns for a list of (transform, raw variable) terms.
+
+        Without rows the cached arrays themselves are returned; with a boolean
+        mask or positions only those rows are copied out.
+        """
+        if rows is None:
+            return [self.get(transform, raw) for transform, raw in terms]
+
+        return [self.get(transform, raw)[rows] for transform, raw in terms]
+
+    def to_frame(self):
+        """The surrogate record as a DataFrame, without copying.
+        """
+        return self._df
+
+    @property
+    def nbytes(self):
+        """Bytes allocated by the container, excluding views of the record.
+        """
+        return sum(self._allocated.values())
+
+    @property
+    def view_nbytes(self):
+        """Bytes of the record viewed by the container without copying.
+        """
+        return sum(values.nbytes for key, values in self._columns.items()
+                   if not self._allocated[key])
+
+
+class PredictionEngine:
+    """Vectorized predictions from a FittedModel.
+
+    Evaluates the response, the bias-corrected raw response and the prediction
+    interval with NumPy over contiguous float arrays, without going through
+    linearmodel or statsmodels.
+
+    Parameters
+    ----------
+    fit : FittedModel
+    percentile : float
+        Width of the prediction interval; 90 gives the '_L90.0' and '_U90.0'
+        columns.
+    """
+    def __init__(self, fit, percentile=90.0):
+        self.fit = fit
+        self.terms = fit.terms
+        self.params = fit.params
+        self.cov_params = fit.cov_params
+        self.mse = fit.mse
+        self.bias_correction = fit.bias_correction
+
+        self.intercept = 'Intercept' in fit.exog_names
+        self.t_value = t_dist.ppf(0.5 + percentile/200., fit.df_resid)
+
+        self.lower_suffix = '_L{}'.format(float(percentile))
+        self.upper_suffix = '_U{}'.format(float(percentile))
+
+    def evaluate(self, columns, raw_response=True, bias_correction=True,
+                 prediction_interval=True, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Evaluate the model over transformed explanatory columns.
+
+        Parameters
+        ----------
+        columns : list of array
+            One array per model term, as returned by SurrogateData.columns.
+        chunk_size : int
+            Number of rows evaluated at a time, which bounds the size of the
+            temporary design matrix. None evaluates every row at once.
+
+        Returns
+        -------
+        dict mapping column name to array
+        """
+        fit = self.fit
+        n = len(columns[0])
+        p = len(self.params)
+        chunk_size = chunk_size or max(n, 1)
+
+        name = fit.raw_response if raw_response else fit.response
+
+        response = np.empty(n)
+        if prediction_interval:
+            lower = np.empty(n)
+            upper = np.empty(n)
+
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+
+            design = np.empty((stop - start, p))
+            j = 0
+            if self.intercept:
+                design[:, 0] = 1
+                j = 1
+            for column in columns:
+                design[:, j] = column[start:stop]
+                j += 1
+
+            y = design.dot(self.params)
+            response[start:stop] = y
+
+            if prediction_interval:
+                # variance of a new observation: mse + x cov x'
+                variance = self.mse + np.einsum('ij,ij->i',
+                                                design.dot(self.cov_params), design)
+                half_width = self.t_value * np.sqrt(variance)
+                lower[start:stop] = y - half_width
+                upper[start:stop] = y + half_width
+
+        if raw_response:
+            inverse = INVERSE_TRANSFORM_FUNCTIONS[fit.response_transform]
+            response = inverse(response)
+            if bias_correction:
+                response *= self.bias_correction
+
+            if prediction_interval:
+                # retransformed quantiles are not bias corrected; reorder them
+                # for decreasing transforms such as reciprocal
+                lower, upper = inverse(lower), inverse(upper)
+                lower, upper = np.fmin(lower, upper), np.fmax(lower, upper)
+
+        out = {name: response}
+        if prediction_interval:
+            out[name + self.lower_suffix] = lower
+            out[name + self.upper_suffix] = upper
+
+        return out
+
+    def predict(self, explanatory_df, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        """Predict from a DataFrame of raw surrogates.
+
+        Keyword arguments are passed to evaluate.
+        """
+        columns = SurrogateData(explanatory_df).columns(self.terms)
+        out = self.evaluate(columns, chunk_size=chunk_size, **kwargs)
+
+        return pd.DataFrame(out, index=explanatory_df.index)
+
+
+def cascading_prediction(ranked_engines, transforms):
+    """Predict with the best engine, then fill the remaining gaps with each
+    fallback engine in turn.
+
+    Parameters
+    ----------
+    ranked_engines : list
+        (model id, PredictionEngine) pairs, best first.
+    transforms : SurrogateData
+        Surrogates to predict from.
+
+    Returns
+    -------
+    dict mapping column name to array, including '<constituent>_model' with
+    the id of the engine that filled each row (-1 where none applies), or
+    None if there are no engines. The ids are stored in the smallest signed
+    integer type that holds the largest id, int8 up to 127 sub-models.
+    """
+    ranked_engines = list(ranked_engines)
+    n = len(transforms)
+    largest = max([i for i, _ in ranked_engines], default=0)
+    model_id = np.full(n, -1, dtype=np.min_scalar_type(-(largest + 1)))
+    missing = np.ones(n, dtype=bool)
+    out = None
+
+    for i, engine in ranked_engines:
+        rows = np.flatnonzero(missing)
+        if len(rows) == 0:
+            break
+
+        prediction = engine.evaluate(transforms.columns(engine.terms, rows))
+        name = engine.fit.raw_response
+
+        if out is None:
+            out = {col: np.full(n, np.nan) for col in prediction}
+
+        for col, values in prediction.items():
+            out[col][rows] = values
+
+        #record which model filled each row
+        covered = rows[~np.isnan(prediction[name])]
+        model_id[covered] = i
+        missing[covered] = False
+
+    if out is None:
+        return None
+
+    out[name + '_model'] = model_id
+
+    return out
+
+
+def _build_sub_model(constituent_data, surrogate_data, constituent,
+                     surrogate_set, surrogate_transforms, constituent_transform,
+                     match_time):
+    """Build one SurrogateRatingModel of a HierarchicalModel.
+    """
+    model = SurrogateRatingModel(constituent_data,
+                                 surrogate_data,
+                                 constituent_variable = constituent,
+                                 surrogate_variables = surrogate_set,
+                                 match_method = 'nearest',
+                                 #should set match in init
+                                 match_time = match_time)
+
+    #set the surrogate transforms based on the surrogate index
+    for surrogate, transforms in zip(surrogate_set, surrogate_transforms):
+        model.set_surrogate_transform(transforms, surrogate_variable=surrogate)
+
+    model.set_constituent_transform(constituent_transform)
+
+    return model
+
+
+def _fit_sub_model(*args):
+    """Build and fit one sub-model.
+
+    Returns
+    -------
+    (SurrogateRatingModel, FittedModel), or (None, None) if the model could not
+    be built.
+    """
+    try:
+        model = _build_sub_model(*args)
+        #FIXME depends on private methods
+        res = model._model._model.fit()
+        #TODO check transforms
+
+    #XXX added this as well as try except 2019/02/07
+    except ValueError:
+        return None, None
+
+    return model, FittedModel(res, model._model.get_model_formula())
+
+
+def _fit_sub_model_in_worker(*args):
+    """Fit one sub-model in a worker process.
+
+    statsmodels formula models rebuild their design from the caller's
+    namespace when unpickled, which does not work across processes, so only the
+    FittedModel is sent back. The parent rebuilds the SurrogateRatingModel on
+    demand.
+    """
+    model, fit = _fit_sub_model(*args)
+    return fit
+
+
+def _near_samples(surrogate_df, sample_times, match_time):
+    """Rows of surrogate_df within match_time minutes of a sample.
+
+    Any row a sample can be matched to is among them, so a sub-model fit
+    from these rows alone matches and fits as from the whole record.
+    """
+    times = surrogate_df.index.values
+    order = np.argsort(times, kind='mergesort')
+    tolerance = pd.Timedelta(minutes=match_time).to_timedelta64()
+    sample_times = np.asarray(sample_times, dtype=times.dtype)
+
+    #count the sample windows open at each row
+    first = np.searchsorted(times[order], sample_times - tolerance, 'left')
+    last = np.searchsorted(times[order], sample_times + tolerance, 'right')
+    open_windows = np.zeros(len(times) + 1, dtype=int)
+    np.add.at(open_windows, first, 1)
+    np.add.at(open_windows, last, -1)
+
+    keep = np.zeros(len(times), dtype=bool)
+    keep[order] = np.cumsum(open_windows[:-1]) > 0
+
+    return surrogate_df[keep]
+
+
+def _worker_job(job, surrogate_df):
+    """Arguments of _fit_sub_model_in_worker for a job, with the surrogate
+    record, surrogate_df, cut down to the sub-model's surrogates near the
+    samples, so that the whole record is not sent to every worker.
+    """
+    (constituent_data, _, constituent, surrogate_set, surrogate_transforms,
+     constituent_transform, match_time) = job
+
+    sample_times = constituent_data.get_data().index
+    surrogate_df = _near_samples(surrogate_df.reindex(columns=surrogate_set),
+                                 sample_times, match_time)
+
+    return (constituent_data, DataManager(surrogate_df), constituent,
+            surrogate_set, surrogate_transforms, constituent_transform,
+            match_time)
+
 
 def model_row_summary(model):
+    """Summarize each sub-model of a HierarchicalModel from its cached fit.
+    """
     if not model:
         return None
 
-    res = model._model._model.fit()
-    columns = SUMMARY_COLS
-    row = [[
-        model._model.get_model_formula(),
-        res.nobs,
-        res.rsquared_adj,
-        res.f_pvalue
-    ]]
+    rows = [fit.summary_row() for fit in model._fits]
 
-    return pd.DataFrame(row, columns=columns)
+    return pd.DataFrame(rows, columns=SUMMARY_COLS)
 
 
 class HierarchicalModel:
@@ -60,8 +497,9 @@ class HierarchicalModel:
 
     TODO
     ----
-    -model skill is currently assessed by r^2. Include alternative metrics
-    like tightest prediction interval.
+    -model skill is assessed by r^2 or leave-one-out statistics (see
+    get_prediction). Include alternative metrics like tightest prediction
+    interval.
     -improve interface with linearmodel to a avoid reliance on
     private methods.
 
@@ -69,19 +507,43 @@ class HierarchicalModel:
 
     def __init__(self, constituent_df, surrogate_df, model_list,
                  min_samples=30, max_extrapolation=0.1, match_time=30,
-                 p_thres=0.05):
+                 p_thres=0.05, n_jobs=None, executor=None, match_index=None,
+                 cache=None):
         """ Initialize a HierarchicalModel
 
 
         :param constituent_data:
         :type constituent_data: DataManager
-        :param surrogate_data:
-        :type surrogate_data: DataManger
+        :param surrogate_data: surrogate record. Pass the same SurrogateData to
+            each HierarchicalModel of a site to share one read-only copy of the
+            record and its transformed columns between them.
+        :type surrogate_data: DataFrame or SurrogateData
         :param model_list:
+        :param n_jobs: number of processes used to fit the sub-models. None or
+            1 fits serially; -1 uses every core.
+        :type n_jobs: int
+        :param executor: fit the sub-models with this executor instead of
+            creating a process pool. Takes precedence over n_jobs.
+        :type executor: concurrent.futures.Executor
+        :param match_index: precomputed sample-to-surrogate matches, see
+            qw_reports.match. If given, the sub-models are fit from the matched
+            surrogate values instead of matching against the whole record.
+            Every surrogate of a sample then comes from the one IV row nearest
+            to it, rather than said matching each surrogate on its own, so the
+            samples and fits can differ from those without it.
+        :type match_index: DataFrame
+        :param cache: reuse the fits of a previous model with the same samples,
+            matched surrogates, model list and options instead of fitting.
+        :type cache: qw_reports.cache.ModelCache
         """
         #HierarchicalModel.pad_data(surrogate_df) 
-        self._surrogate_data = DataManager(surrogate_df)
+        if not isinstance(surrogate_df, SurrogateData):
+            surrogate_df = SurrogateData(surrogate_df)
+
+        # surrogates and their transforms, shared by every sub-model
+        self._surrogate_record = surrogate_df
         self._constituent_data = DataManager(constituent_df)
+        self._constituent_df = constituent_df
 
         self._model_list = model_list
 
@@ -90,8 +552,19 @@ class HierarchicalModel:
         self.min_samples = min_samples
         self.p_thres = p_thres
 
+        self.n_jobs = n_jobs
+        self._executor = executor
+        self._match_index = match_index
+        self._cache = cache
+
+        # number of OLS fits actually run by this instance
+        self.fit_count = 0
 
-        self._create_models()
+
+        with instrument.stage('fit', rows=len(constituent_df)) as record:
+            self._create_models()
+            record.setdefault('constituent', self._constituent)
+            record['fits'] = self.fit_count
 
     @staticmethod
     def pad_data(sur_df):
@@ -113,61 +586,129 @@ class HierarchicalModel:
         #specify (n) the number of models managed within the instance
         n = len(self._model_list)
         self._models = [None for i in range(n)]
+        self._fits = [None for i in range(n)]
 
         #initialize arrays to store p values, nobs and rsquared of each model
         self._pvalues = np.zeros(n)
         self._nobs = np.zeros(n)
         self._rsquared = np.zeros(n)
-        #import pdb; pdb.set_trace()
+
+        #with a match index, the sub-models only see the surrogate values
+        #matched to each sample, so their own matching is trivial and the
+        #full record is never copied into a DataManager
+        if self._match_index is not None:
+            matched = matched_surrogates(self._match_index, self.match_time)
+            matched = matched[~matched.index.duplicated()]
+            self._surrogate_data = None
+            fit_surrogate_data = DataManager(matched)
+        else:
+            matched = self._surrogate_record.to_frame()
+            self._surrogate_data = DataManager(matched)
+            fit_surrogate_data = self._surrogate_data
+
+        #surrogate sets are built here, not in the workers, so that set
+        #ordering (and hence term order) is the same on every path
+        jobs = []
         for i in range(n):
             #FIXME try to fix this by taking a the set of surrogate_variables
             surrogate_set = list(set(self._surrogates[i])) #removes duplicates
-            try: 
-                self._models[i] = SurrogateRatingModel(self._constituent_data,
-                                                       self._surrogate_data,
-                                                       constituent_variable = self._constituent,
-                                                       surrogate_variables = surrogate_set,
-                                                       match_method = 'nearest',
-                                                       #should set match in init
-                                                       match_time = self.match_time)
-                for surrogate in surrogate_set:
-                    #ceate an index of each occurance of the surrogate
-                    surrogate_transforms = [self._surrogate_transforms[i][j] for j,v in enumerate(self._surrogates[i]) if v == surrogate]
-                    #set the surrogate transforms based on the surrogate index
-                    #XXX testing if else
-                    #if len(surrogate_transforms) != 1: #XXX consider using >
-                    #    raise ValueError('Only works with single surrogate transform')
-                    #else:
-                    #    surrogate_transforms = surrogate_transforms[0]
-                    self._models[i].set_surrogate_transform(surrogate_transforms, surrogate_variable=surrogate)
-    
-                #set transforms for each surrogate
-                #for surrogate in self._surrogates[i]:
-                #    self._models[i].set_surrogate_transform(self._surrogate_transforms[i], surrogate_variable=surrogate)
-                self._models[i].set_constituent_transform(self._constituent_transforms[i])
-    
-                #FIXME depends on private methods
-                res = self._models[i]._model._model.fit()
-                self._pvalues[i] = res.f_pvalue
-                self._rsquared[i] = res.rsquared_adj
-                self._nobs[i] = res.nobs
-                #TODO check transforms
-    
-            #XXX added this as well as try except 2019/02/07
-            #while None in self._models:
-            #    self._models.remove(None)
-            except ValueError:
-                self._models[i] = None
-
-        good_i = [i for i, x in enumerate(self._models) if x is not None]
-        while None in self._models:
-            self._models.remove(None)
+            #ceate an index of each occurance of the surrogate
+            surrogate_transforms = [[self._surrogate_transforms[i][j]
+                                     for j,v in enumerate(self._surrogates[i]) if v == surrogate]
+                                    for surrogate in surrogate_set]
+            jobs.append((self._constituent_data,
+                         fit_surrogate_data,
+                         self._constituent,
+                         surrogate_set,
+                         surrogate_transforms,
+                         self._constituent_transforms[i],
+                         self.match_time))
+
+        #content hash of everything the fits depend on, also used to tell
+        #whether artifacts drawn from the model are current
+        self.input_key = self._cache_key()
+
+        cached = None
+        if self._cache is not None:
+            cached = self._cache.get(self.input_key)
+
+        if cached is not None:
+            #sub-models are rebuilt on demand, as after fitting in workers
+            results = [(None, fit) for fit in cached]
+
+        elif self._executor is not None:
+            worker_jobs = [_worker_job(job, matched) for job in jobs]
+            fits = list(self._executor.map(_fit_sub_model_in_worker,
+                                           *zip(*worker_jobs)))
+            results = [(None, fit) for fit in fits]
+
+        elif self.n_jobs is not None and self.n_jobs != 1:
+            max_workers = self.n_jobs if self.n_jobs > 0 else None
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                worker_jobs = [_worker_job(job, matched) for job in jobs]
+                fits = list(executor.map(_fit_sub_model_in_worker,
+                                         *zip(*worker_jobs)))
+            results = [(None, fit) for fit in fits]
+
+        else:
+            results = [_fit_sub_model(*job) for job in jobs]
+
+        if self._cache is not None and cached is None:
+            self._cache.put(self.input_key, [fit for model, fit in results])
+
+        for i, (model, fit) in enumerate(results):
+            self._models[i] = model
+            self._fits[i] = fit
+
+            if fit is not None:
+                if cached is None:
+                    self.fit_count += 1
+                self._pvalues[i] = fit.f_pvalue
+                self._rsquared[i] = fit.rsquared_adj
+                self._nobs[i] = fit.nobs
+
+        #drop models that could not be built
+        good_i = [i for i, x in enumerate(self._fits) if x is not None]
+
+        self._models = [self._models[i] for i in good_i]
+        self._fits = [self._fits[i] for i in good_i]
+        self._jobs = [jobs[i] for i in good_i]
+        self._engines = [None for i in good_i]
 
         self._pvalues = self._pvalues[good_i]
         self._nobs = self._nobs[good_i]
         self._rsquared = self._rsquared[good_i]
 
+    def _cache_key(self):
+        """Key of this model's fits in the model cache, see input_key.
+
+        Only the surrogate values matched to each sample are hashed, so rows
+        appended to the record away from the samples keep the key. Fits with
+        and without a match index are keyed apart.
+        """
+        surrogates = sorted(set(s for surrogate_set in self._surrogates
+                                for s in surrogate_set))
+
+        match_index = self._match_index
+        if match_index is None:
+            match_index = build_match_index(self._surrogate_record.to_frame(),
+                                            self._constituent_df)
+        matched = matched_surrogates(match_index, self.match_time)
+
+        return model_key(self._constituent_df[[self._constituent]],
+                         matched.reindex(columns=surrogates),
+                         self._model_list, self.match_time, self.min_samples,
+                         self.p_thres,
+                         'said' if self._match_index is None else 'index')
+
+    def _get_model(self, i):
+        """Return the i-th SurrogateRatingModel, building it if it was fit in
+        a worker process.
+        """
+        if self._models[i] is None:
+            self._models[i] = _build_sub_model(*self._jobs[i])
 
+        return self._models[i]
 
     def _set_variables_and_transforms(self):
         """Parses surrogates, constituent, and their transforms.
@@ -209,19 +750,26 @@ class HierarchicalModel:
         self._constituent = temp_constituents[0]
 
 
-    def get_prediction(self, explanatory_data=None):
-        """Use the HierarchicalModel to make a prediction based on explanatory_data.
+    def _ranked_models(self, rank_by='rsquared'):
+        """Indices of the sub-models used for prediction, from worst to best.
 
-        If no explanatory data is given, the prediction is based on the data uses to initialize
-        the HierarchicalModel
-
-        :param explanatory_data:
-        :return:
+        :param rank_by: 'rsquared' ranks by adjusted r^2, 'loo_rsquared' by
+            leave-one-out r^2 and 'press' by the prediction sum of squares.
         """
-        #rank models by r2, starting with the lowest (worst)
-        model_ranks = self._rsquared.argsort()
+        #rank models by skill, starting with the lowest (worst)
+        if rank_by == 'rsquared':
+            skill = self._rsquared
+        elif rank_by == 'loo_rsquared':
+            skill = np.array([fit.loo.rsquared for fit in self._fits])
+        elif rank_by == 'press':
+            skill = -np.array([fit.loo.press for fit in self._fits])
+        else:
+            raise ValueError('unknown rank_by: {}'.format(rank_by))
+
+        model_ranks = skill.argsort()
         #model_ranks = range(len(model_list))
 
+        ranked = []
         for i in model_ranks:
             #skip models that aren't robust
             #TODO replace hard nobs thresh with thres * (surrogatecount + 1)
@@ -230,35 +778,140 @@ class HierarchicalModel:
             elif self._rsquared[i] == 0: #skip models that had no data
                 continue
 
-            elif type(explanatory_data) is type(None):
-                explanatory_data = self._models[i]._surrogate_data
-            
-            prediction = self._models[i]._model.predict_response_variable(
-                explanatory_data = explanatory_data,
-                raw_response=True,
-                bias_correction=True,
-                prediction_interval=True)
-            try:
-                hierarchical_prediction.update(prediction)
+            ranked.append(i)
+
+        return ranked
+
+    def get_prediction(self, explanatory_data=None, cascade=True, rank_by='rsquared'):
+        """Use the HierarchicalModel to make a prediction based on explanatory_data.
+
+        If no explanatory data is given, the prediction is based on the data uses to initialize
+        the HierarchicalModel
 
-            except:
+        :param explanatory_data:
+        :param cascade: if True, the best model predicts first and each
+            fallback model only predicts the rows still missing a prediction.
+            The sub-model that produced each row is recorded in the
+            '<constituent>_model' column (-1 where no model applies).
+            If False, every model predicts every row and better models
+            overwrite worse ones.
+        :param rank_by: skill measure used to rank the sub-models: 'rsquared'
+            (adjusted r^2), 'loo_rsquared' (leave-one-out r^2) or 'press'.
+        :return:
+        """
+        transforms = self._explanatory_transforms(explanatory_data)
+
+        with instrument.stage('predict', rows=len(transforms.index)) as record:
+            record.setdefault('constituent', self._constituent)
+            return self._get_prediction(transforms, cascade, rank_by)
+
+    def _get_prediction(self, transforms, cascade, rank_by):
+        """Called by get_prediction.
+        """
+        if cascade:
+            return self._get_cascading_prediction(transforms, rank_by)
+
+        hierarchical_prediction = None
+        for i in self._ranked_models(rank_by):
+            engine = self._get_engine(i)
+            prediction = pd.DataFrame(engine.evaluate(transforms.columns(engine.terms)),
+                                      index=transforms.index)
+
+            if hierarchical_prediction is None:
                 hierarchical_prediction = prediction
+            else:
+                hierarchical_prediction.update(prediction)
 
         return hierarchical_prediction
-        
+
+    def _get_cascading_prediction(self, transforms, rank_by='rsquared'):
+        """Predict with the best model, then fill the remaining gaps with each
+        fallback model in turn.
+
+        Called by get_prediction.
+        """
+        #best model first
+        ranked = [(i, self._get_engine(i)) for i in reversed(self._ranked_models(rank_by))]
+        out = cascading_prediction(ranked, transforms)
+
+        if out is None:
+            return None
+
+        return pd.DataFrame(out, index=transforms.index)
+
+    def get_scenario_prediction(self, scenarios, index=None, columns=None,
+                                rank_by='rsquared'):
+        """Predict a stack of explanatory scenarios at once.
+
+        Every scenario is evaluated in a single pass per sub-model, with the
+        same cascading fallback as get_prediction.
+
+        :param scenarios: scenario-indexed frame, see qw_reports.scenarios, or
+            an array of shape (n scenarios, n times, n variables).
+        :param index: times of an array's second axis
+        :param columns: surrogate names of an array's third axis
+        :param rank_by: see get_prediction
+        :return: DataFrame indexed like the scenario frame, e.g. by
+            (scenario, datetime)
+        """
+        if not isinstance(scenarios, pd.DataFrame):
+            scenarios = scenario_frame(scenarios, index, columns)
+
+        return self._get_cascading_prediction(SurrogateData(scenarios), rank_by)
+
+    def get_surrogate_variables(self):
+        """Raw surrogates of every sub-model, in order of first use.
+        """
+        return list(dict.fromkeys(s for surrogates in self._surrogates
+                                  for s in surrogates))
+
+    def _explanatory_transforms(self, explanatory_data=None):
+        """SurrogateData of the surrogates to predict from.
+
+        The surrogate record given at initialization is reused when no
+        explanatory data is given.
+        """
+        if explanatory_data is None:
+            return self._surrogate_record
+
+        if isinstance(explanatory_data, DataManager):
+            explanatory_data = explanatory_data.get_data()
+
+        return SurrogateData(explanatory_data)
+
+    def get_windowed_fits(self):
+        """WindowedFit of each sub-model, for rolling or water-year refits.
+        """
+        from qw_reports.windowed import WindowedFit
+
+        return [WindowedFit(fit) for fit in self._fits]
+
+    def _get_engine(self, i):
+        """Return the PredictionEngine of the i-th sub-model.
+        """
+        if self._engines[i] is None:
+            self._engines[i] = PredictionEngine(self._fits[i])
+
+        return self._engines[i]
 
     def plot_model_pred_vs_obs(self, axes=None, savepath=None, dpi=150):
         n = len(self._models)
         cols = min(n, 2)
         rows = ceil(n/cols)
 
-        if axes is None:
+        if axes is None and savepath:
+            #outside of pyplot, see qw_reports.plot.load_figure
+            fig = Figure()
+            axes = fig.subplots(rows, cols, sharex=True, sharey=True, squeeze=False)
+        elif axes is None:
             fig, axes = plt.subplots(rows, cols, sharex=True, sharey=True)
 
         if not isinstance(axes, np.ndarray):
             axes = np.array(axes)
 
-        for ax, model in zip(axes.flatten(), self._models):
+        models = [self._get_model(i) for i in range(n)]
+
+        for ax, model in zip(axes.flatten(), models):
             model._model._plot_model_pred_vs_obs(ax)
             ax.set_title('+'.join(model._model.get_explanatory_variables()))
             if not ax.is_last_row():
@@ -273,7 +926,8 @@ class HierarchicalModel:
 
     def report(self):
         summary = ''
-        for model in self._models:
+        for i in range(len(self._models)):
+            model = self._get_model(i)
             summary += model._model.get_model_summary().as_text()
             summary += '\n'
             return summary
@@ -282,22 +936,23 @@ class HierarchicalModel:
     def summary(self):
         """Generates a summary table with basic statistics for each submodel.
 
-        TODO: immprove interface with linearmodel, so that this doesn't rely on
-        private methods.
+        Statistics are read from the fits cached by _create_models.
         """
         summary = Summary()
         headers = ['Model form', 'Observations', 'Adjusted r^2',
-                   'P value']
+                   'P value', 'PRESS', 'LOO r^2', 'LOO 90% coverage']
         table_data = []
         # for each model
-        for model in self._models:
+        for fit in self._fits:
             row = []
-            # populate row with model statistics
-            res = model._model._model.fit()
-            row.append(model._model.get_model_formula())
-            row.append( round(res.nobs) )
-            row.append( round(res.rsquared_adj, 2))
-            row.append( format(res.f_pvalue, '.1E'))
+            # populate row with cached model statistics
+            row.append(fit.formula)
+            row.append( round(fit.nobs) )
+            row.append( round(fit.rsquared_adj, 2))
+            row.append( format(fit.f_pvalue, '.1E'))
+            row.append( round(fit.loo.press, 2))
+            row.append( round(fit.loo.rsquared, 2))
+            row.append( round(fit.loo.coverage, 2))
             # append the row to the data
             table_data.append(row)
 
@@ -7,16 +7,18 @@ import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import matplotlib as mpl
 
+from matplotlib.figure import Figure
+
 import numpy as np
 
 from hygnd.munge import update_merge
 
+from qw_reports.analysis.loads import load_rate
+
 DPI = 150
 HP_FIGSIZE = (7.5,5) #Half page figsize
 MODEL_FIGSIZE = (7.5,9)
 
-LOAD_FACTOR = 0.00269688566 #XXX check this, 
-
 MARKER_SIZE = 3
 
 mpl.rcParams['lines.markeredgewidth'] = 0.5
@@ -26,6 +28,24 @@ mpl.rcParams['font.size'] = 8
 mpl.rcParams.update({'font.size':8})
 
 
+def load_figure(filename=None):
+    """Figure with three stacked axes for discharge, concentration and load.
+
+    Figures that are saved to a file are created outside of pyplot, so they
+    are freed once saved and several can be drawn at once from different
+    threads.
+    """
+    if filename:
+        fig = Figure(figsize=HP_FIGSIZE, dpi=DPI)
+        axes = fig.subplots(3, sharex=True)
+    else:
+        fig, axes = plt.subplots(3, sharex=True, figsize=HP_FIGSIZE, dpi=DPI)
+
+    fig.subplots_adjust(hspace=0)
+
+    return fig, axes
+
+
 def plot_dp(con_data, sur_data, filename=None, title=None,
            legend=None,
            start_date=None,
@@ -35,8 +55,7 @@ def plot_dp(con_data, sur_data, filename=None, title=None,
 
     df2 = con_data.get_data()
     df = sur_data.get_data()
-    fig, (ax1, ax2, ax3) = plt.subplots(3, sharex=True, figsize=HP_FIGSIZE, dpi=DPI)
-    fig.subplots_adjust(hspace=0)
+    fig, (ax1, ax2, ax3) = load_figure(filename)
 
     ax1.plot(df.index, df.Discharge, color='cornflowerblue', label='Discharge')
     ax2.plot(df.index,df.OrthoP, color='maroon', label='In-situ PO_4-P')
@@ -83,7 +102,7 @@ def format_load_plot(fig,
     fig.autofmt_xdate()
 
     if filename:
-        plt.savefig(filename, bbox_inches = 'tight')
+        fig.savefig(filename, bbox_inches = 'tight')
 
 
 def plot_discharge_ts(discharge, ax, color='cornflowerblue'):
@@ -91,15 +110,14 @@ def plot_discharge_ts(discharge, ax, color='cornflowerblue'):
 
 
 def plot_load_ts(df, constituent_col, discharge_col, ax, color='black'):
-    """
+    """Load in tons per day.
+
     TODO: include discharge in same plot
     """
-
-    LOAD_CONV = LOAD_FACTOR #XXX check
     #L90 = '{}_L90.0'.format(response_var)
     #U90 = '{}_U90.0'.format(response_var)
 
-    load = df[discharge_col] * df[constituent_col] * LOAD_CONV
+    load = load_rate(df[discharge_col], df[constituent_col], units='tons', per='day')
     ax.plot(df.index, load, color=color)
 
 
@@ -139,8 +157,7 @@ def plot_tp(con_df, sur_df, filename=None, title=None,
              start_date=None, end_date=None):
 
 
-    fig, (ax1, ax2, ax3) = plt.subplots(3, sharex=True, figsize=HP_FIGSIZE, dpi=DPI)
-    fig.subplots_adjust(hspace=0)
+    fig, (ax1, ax2, ax3) = load_figure(filename)
 
     plot_discharge_ts(sur_df['Discharge'], ax=ax1)
 
@@ -153,8 +170,7 @@ def plot_tp(con_df, sur_df, filename=None, title=None,
                      title=title, legend=None, filename=filename)
 
 def plot_ssc(con_df, sur_df, filename=None, title=None, start_date=None, end_date=None):
-    fig, (ax1, ax2, ax3) = plt.subplots(3, sharex=True, figsize=HP_FIGSIZE, dpi=DPI)
-    fig.subplots_adjust(hspace=0)
+    fig, (ax1, ax2, ax3) = load_figure(filename)
 
     plot_discharge_ts(sur_df['Discharge'], ax=ax1)
 
@@ -167,8 +183,7 @@ def plot_ssc(con_df, sur_df, filename=None, title=None, start_date=None, end_dat
                      title=title, legend=None, filename=filename)
 
 def plot_nitrate(con_df, sur_df, filename=None, title=None, start_date=None, end_date=None):
-    fig, (ax1, ax2, ax3) = plt.subplots(3, sharex=True, figsize=HP_FIGSIZE, dpi=DPI)
-    fig.subplots_adjust(hspace=0)
+    fig, (ax1, ax2, ax3) = load_figure(filename)
 
     plot_discharge_ts(sur_df['Discharge'], ax=ax1)
 
@@ -179,3 +194,56 @@ def plot_nitrate(con_df, sur_df, filename=None, title=None, start_date=None, end
     format_load_plot(fig, 'Nitrate (mg/L-N)', 'Nitrate (tons/day)',
                      start_date=start_date, end_date=end_date,
                      title=title, legend=None, filename=filename)
+
+# (concentration, load) axis labels of plot_events
+EVENT_LABELS = {'Nitrate': ('Nitrate (mg/L-N)', 'Nitrate (tons/day)'),
+                'SSC': ('SSC (mg/L)', 'SSC (tons/day)'),
+                'TP': ('TP (mg/L-P)', 'TP (tons/day)')}
+
+def plot_events(sur_df, events, constituent, baseflow=None, con_df=None,
+                filename=None, title=None, start_date=None, end_date=None):
+    """Discharge, concentration and load of a constituent with the events of
+    an event table shaded.
+
+    Parameters
+    ----------
+    sur_df : DataFrame
+        iv table with Discharge and the constituent's predictions.
+    events : DataFrame
+        Event table of the site, see qw_reports.analysis.events.event_table.
+    constituent : string
+    baseflow : Series
+        Drawn under discharge if given.
+    con_df : DataFrame
+        Samples, drawn over the concentration.
+    start_date, end_date
+        Default to the span of the events.
+    """
+    fig, (ax1, ax2, ax3) = load_figure(filename)
+
+    plot_discharge_ts(sur_df['Discharge'], ax=ax1)
+    if baseflow is not None:
+        ax1.plot(baseflow.index, baseflow.values, color='gray', linestyle='--')
+
+    if '{}_L90.0'.format(constituent) in sur_df:
+        obs = con_df[constituent] if con_df is not None else None
+        plot_concentration_ts(sur_df, constituent, ax2, obs=obs)
+    else:
+        ax2.plot(sur_df.index, sur_df[constituent], color='blue')
+
+    plot_load_ts(sur_df, constituent, 'Discharge', ax3)
+
+    for ax in (ax1, ax2, ax3):
+        for start, end in zip(events['start'], events['end']):
+            ax.axvspan(start, end, facecolor='orange', alpha=0.2)
+
+    if len(events):
+        start_date = start_date or events['start'].min()
+        end_date = end_date or events['end'].max()
+
+    concentration_label, load_label = EVENT_LABELS.get(
+        constituent, (constituent, '{} (tons/day)'.format(constituent)))
+
+    format_load_plot(fig, concentration_label, load_label,
+                     start_date=start_date, end_date=end_date,
+                     title=title, legend=None, filename=filename)
@@ -7,6 +7,8 @@ from hygnd.munge import fill_iv_w_dv, filter_param_cd, interp_to_freq, update_me
 #import table to lookup field names
 from qw_reports.codes import pn
 from qw_reports.model import HierarchicalModel
+from qw_reports.match import build_match_index, update_match_index
+from qw_reports import instrument
 
 class SAIDProject(NWISStore):
     """Rename to ModelProject
@@ -65,48 +67,47 @@ class SurrogateModel(Collection):
               approved_only=True):
         """Prepare and store dataframes for input to SAID
         """
+        with instrument.stage('stage', site=self._id) as record:
+            record['rows'] = self._stage(proxy_id, verbose, start, end,
+                                         approved_only)
+
+    def _stage(self, proxy_id, verbose, start, end, approved_only):
+        """Called by stage.
+
+        Returns the number of iv rows staged.
+        """
         if verbose:
             print(self._id)
 
+        iv, qwdata, match = stage_tables(*self.read_raw(proxy_id), start=start,
+                                         end=end, approved_only=approved_only)
 
+        self.put('iv', iv)
+        self.put('qwdata',qwdata)
+        self.put('match', match)
+
+        return len(iv)
+
+    def read_raw(self, proxy_id=None):
+        """Raw NWIS iv, dv and qwdata of the site, gaps filled from the proxy.
+        """
         iv = self._apply_proxy('iv', proxy_id)
         dv = self._apply_proxy('dv', proxy_id)
         qwdata = self._apply_proxy('qwdata', proxy_id)
 
-        #clean iv
-        iv = iv.replace(-999999, np.NaN)
-        dv = dv.replace(-999999, np.NaN)
-
-        if approved_only == True:
-            #iv = iv.replace('P,e','A').replace('P:e','A')
-            iv = filter_param_cd(iv, 'A')#.replace(-999999, np.NaN)
-            dv = filter_param_cd(dv, 'A')#.replace(-999999, np.NaN)
-
-        if not iv.empty:
-            # clip data to time interval
-            iv = iv[start:end]
-            dv = dv[start:end]
-            qwdata = qwdata[start:end]
-
-            iv = iv.drop_duplicates()
-            iv = interp_to_freq(iv, freq=15, interp_limit=120)
-
-            # fill in gaps in instantaneous discharge with daily estimates
-            if '00060' in dv.columns:
-                iv = fill_iv_w_dv(iv, dv, freq='15min', col='00060')
-
-            # interpolate the OrthoPhosphate down to 15min intervals
-            if '51289' in iv.columns:
-                iv['51289'] = interp_to_freq(iv['51289'], freq=15,
-                                            interp_limit=480)
-
-        iv = format_surrogate_df(iv)
-        qwdata = format_constituent_df(qwdata)
-        # can't use grap sample for estimating DP, fix
-        #qwdata['PP'] = qwdata['TP'] - qwdata['OrthoP']
-        #what is being put
-        self.put('iv', iv)
-        self.put('qwdata',qwdata)
+        return iv, dv, qwdata
+
+    def update_match_index(self):
+        """Bring the stored sample-to-surrogate match index up to date with
+        the stored iv and qwdata.
+        """
+        try:
+            match_index = self.get('match')
+        except KeyError:
+            match_index = None
+
+        match_index = update_match_index(match_index, self.get('iv'), self.get('qwdata'))
+        self.put('match', match_index)
 
     def _apply_proxy(self, service, proxy_id):
         #import pdb; pdb.set_trace()
@@ -146,6 +147,45 @@ class SurrogateModel(Collection):
         except:
             return station.get(service)
 
+def stage_tables(iv, dv, qwdata, start=None, end=None, approved_only=True):
+    """Staged iv, qwdata and match index of a site from its raw NWIS tables.
+
+    Does not touch the store, see SurrogateModel.stage.
+    """
+    #clean iv
+    iv = iv.replace(-999999, np.NaN)
+    dv = dv.replace(-999999, np.NaN)
+
+    if approved_only == True:
+        #iv = iv.replace('P,e','A').replace('P:e','A')
+        iv = filter_param_cd(iv, 'A')#.replace(-999999, np.NaN)
+        dv = filter_param_cd(dv, 'A')#.replace(-999999, np.NaN)
+
+    if not iv.empty:
+        # clip data to time interval
+        iv = iv[start:end]
+        dv = dv[start:end]
+        qwdata = qwdata[start:end]
+
+        iv = iv.drop_duplicates()
+        iv = interp_to_freq(iv, freq=15, interp_limit=120)
+
+        # fill in gaps in instantaneous discharge with daily estimates
+        if '00060' in dv.columns:
+            iv = fill_iv_w_dv(iv, dv, freq='15min', col='00060')
+
+        # interpolate the OrthoPhosphate down to 15min intervals
+        if '51289' in iv.columns:
+            iv['51289'] = interp_to_freq(iv['51289'], freq=15,
+                                        interp_limit=480)
+
+    iv = format_surrogate_df(iv)
+    qwdata = format_constituent_df(qwdata)
+    # can't use grap sample for estimating DP, fix
+    #qwdata['PP'] = qwdata['TP'] - qwdata['OrthoP']
+
+    return iv, qwdata, build_match_index(iv, qwdata)
+
 #XXX these can be class methods
 def format_constituent_df(df):
     check_params = ['p00665','p80154','p00631','p70331']
@@ -14,10 +14,12 @@ from io import StringIO
 
 #XXX write out each import
 from qw_reports.plot import *
-from qw_reports.model import HierarchicalModel
+from qw_reports.model import HierarchicalModel, SurrogateData, SUMMARY_COLS
+from qw_reports.match import build_match_index, update_match_index
+from qw_reports.manifest import ArtifactManifest, artifact_key
+from qw_reports import instrument
 
 #MARK_SIZE = 3 # not used
-SUMMARY_COLS = ['model','# obs','adjusted r^2','p-value']
 HP_FIGSIZE = (7.5,5) #Half page figsize
 DPI = 150
 MODEL_FIGSIZE = (7.5,9)
@@ -25,16 +27,11 @@ MODEL_FIGSIZE = (7.5,9)
 mpl.rcParams.update({'font.size':8})
 mpl.rcParams['lines.linewidth'] = 1
 
-#FLUX_CONV = 0.00269688566
+# figures drawn by generate_plots: (name, plot function, constituent)
+SITE_PLOTS = [('nitrate', plot_nitrate, 'Nitrate'),
+              ('ssc', plot_ssc, 'SSC'),
+              ('tp', plot_tp, 'TP')]
 
-# Conversions
-mg2lbs = 2.20462e-6
-l2cf = 1/0.0353137
-min2sec = 60
-lbs2ton = 0.0005
-interval = 15 * min2sec
-
-FLUX_CONV = mg2lbs * l2cf * interval
 def get_time_limit(df1, df2):
     start = min(df1.dropna(how='all').index[0], df2.dropna(how='all').index[0])
     end = max(df1.dropna(how='all').index[-1], df2.dropna(how='all').index[-1])
@@ -90,90 +87,250 @@ def un_model(store, site, model_list, constituent):
     #summary.to_csv('report/{}_{}_summary.csv'.format(site['name'],constituent))
 
 class Report:
-    def __init__(self, store, site, min_samples=10):
+    """Models and plots of one site.
+
+    A Report is a session over the site's tables: the iv and qwdata frames are
+    read once (see load), every constituent model and process_nitrate adds
+    its prediction columns to the session, and commit writes them to the iv
+    table in a single write.
+
+    Report files, figures and the summary table are only regenerated when the
+    data, model list or plotting parameters they are drawn from have changed
+    since they were last written, as recorded in the site's manifest
+    (report/{site name}_manifest.json). Pass force=True to regenerate them all.
+
+    Models are fit with said's matching of samples to the surrogate record.
+    Pass use_match_index=True to fit them from the site's match index instead,
+    which matches every surrogate of a sample to the one nearest row of the
+    record; the samples and coefficients of a model can differ from those of
+    said's matching.
+    """
+    def __init__(self, store, site, min_samples=10, cache=None, force=False,
+                 use_match_index=False):
         self.store = store
         self.site = site
         self.summary_table = pd.DataFrame(columns=SUMMARY_COLS)
         self.min_samples = min_samples
 
+        # qw_reports.cache.ModelCache, skips fitting models of unchanged sites
+        self.cache = cache
+        self.use_match_index = use_match_index
+
+        self.manifest = ArtifactManifest(
+            'report/{}_manifest.json'.format(self.site['name']), force=force)
 
-    def run_model(self,model_list, constituent, match_time=30, min_samples=None):
         db_path = '/said/{}/'.format(self.site['id'])
-        iv_path = db_path + 'iv'
-        qwdata_path = db_path + 'qwdata'
+        self.iv_path = db_path + 'iv'
+        self.qwdata_path = db_path + 'qwdata'
+        self.match_path = db_path + 'match'
+
+        # session state, filled by load
+        self.iv = None
+        self.qwdata = None
+        self.match_index = None
+        self._match_changed = False
+        # surrogate record shared by the models of every constituent
+        self.surrogates = None
+        # prediction columns waiting to be written by commit
+        self._pending = []
+
+    def memory_usage(self):
+        """Bytes of the site's shared surrogate record: those viewed from the
+        iv frame without copying and those allocated for transformed columns.
+        """
+        if self.surrogates is None:
+            return pd.Series({'viewed': 0, 'allocated': 0})
+
+        return pd.Series({'viewed': self.surrogates.view_nbytes,
+                          'allocated': self.surrogates.nbytes})
+
+    def load(self):
+        """Read the site's iv and qwdata frames and update its match index.
+
+        Called by the first method that needs them.
+        """
+        with instrument.stage('read', site=self.site['id']) as record:
+            try:
+                self.iv = self.store.get(self.iv_path)
+                self.qwdata = self.store.get(self.qwdata_path)
+
+            except KeyError:
+                print('site {} not found'.format(self.site['name']))
+                raise
+
+            if self.match_path in self.store.keys():
+                stored = self.store.get(self.match_path)
+                self.match_index = update_match_index(stored, self.iv, self.qwdata)
+                self._match_changed = not self.match_index.equals(stored)
+            else:
+                self.match_index = build_match_index(self.iv, self.qwdata)
+                self._match_changed = True
+
+            record['rows'] = len(self.iv)
 
-        try:
-            sur_df = self.store.get(iv_path)
-            con_df = self.store.get(qwdata_path)
+        self.surrogates = SurrogateData(self.iv)
+
+    def _ensure_loaded(self):
+        if self.iv is None:
+            self.load()
+
+        #surrogate columns are not changed by the predictions written by
+        #commit, so the record survives it
+        if self.surrogates is None:
+            self.surrogates = SurrogateData(self.iv)
+
+    def run_model(self,model_list, constituent, match_time=30, min_samples=None):
+        """Fit a HierarchicalModel and add its predictions to the session.
+
+        Predictions are written to the iv table by commit.
+        """
+        self._ensure_loaded()
 
-        except KeyError:
-            print('site {} not found'.format(self.site['name']))
-       
         if min_samples is None:
             min_samples = self.min_samples
 
-        model = HierarchicalModel(con_df, sur_df, model_list, match_time=match_time,
-                                  min_samples=min_samples)
-        predictions = model.get_prediction()
-        sur_df = update_merge(sur_df, predictions)
-        self.store.put(iv_path, sur_df)
+        with instrument.tags(site=self.site['id'], constituent=constituent):
+            self._run_model(model_list, constituent, match_time, min_samples)
+
+    def _run_model(self, model_list, constituent, match_time, min_samples):
+        """Called by run_model.
+        """
+        match_index = self.match_index if self.use_match_index else None
+        model = HierarchicalModel(self.qwdata, self.surrogates, model_list,
+                                  match_time=match_time, min_samples=min_samples,
+                                  match_index=match_index, cache=self.cache)
+        self._pending.append(model.get_prediction())
 
         temp_csv = StringIO(model.summary().as_csv())
         model_summary = pd.read_csv(temp_csv, sep=',')
-        model_summary.columns=['model','# obs','adjusted r^2','p-value']
-        self.summary_table = self.summary_table.append(model_summary)
-
-        report = model.report()
-        path = f"report/{constituent}_long_report.txt"
-        open(path, 'w').close()
-        with open(path,"a") as report_file:
-            report_file.write(report)
-        
-        model.plot_model_pred_vs_obs(savepath=f"report/{constituent}_pred_vs_obs_plot.png", dpi=150)
+        model_summary.columns=SUMMARY_COLS
+        self.summary_table = pd.concat([self.summary_table, model_summary])
+
+        site_name = self.site['name']
+        path = f"report/{site_name}_{constituent}_long_report.txt"
+
+        def write_report():
+            with open(path, 'w') as report_file:
+                report_file.write(model.report())
+
+        self.manifest.build(path, artifact_key(model.input_key), write_report)
+
+        plot_path = f"report/{site_name}_{constituent}_pred_vs_obs_plot.png"
+        with instrument.stage('plot', figure='pred_vs_obs') as record:
+            record['skipped'] = not self.manifest.build(
+                plot_path, artifact_key(model.input_key, DPI),
+                model.plot_model_pred_vs_obs, savepath=plot_path, dpi=DPI)
         #XXX update with class
         #print(model.summary())
         #summary.to_csv('report/{}_{}_summary.csv'.format(site['name'],constituent))
 
-
     def process_nitrate(self):
         """Process an in situ measurement like nitrate or orthoP
+
+        The bounds are written to the iv table by commit.
         """
+        self._ensure_loaded()
+
         constituent = 'NitrateSurr'
-        db_path = '/said/{}/'.format(self.site['id'])
-        iv_path = db_path + 'iv'
-        df = self.store.get(iv_path)
+        df = self.iv
 
         n_error = np.maximum(0.5, df[constituent]*.1)
-        df[constituent+'_U90.0'] = df[constituent] + n_error
-        df['NitrateSurr_L90.0'] = df.NitrateSurr - n_error
+        bounds = pd.DataFrame(index=df.index)
+        bounds[constituent+'_U90.0'] = df[constituent] + n_error
         #clip values below 0
-        df['NitrateSurr_L90.0'] = np.maximum(0, df['NitrateSurr_L90.0'])
+        bounds[constituent+'_L90.0'] = np.maximum(0, df[constituent] - n_error)
+
+        self._pending.append(bounds)
+
+    def _changed_columns(self, updates):
+        """Columns of updates that differ from the iv frame.
+        """
+        changed = []
+        for col in updates:
+            if col not in self.iv or not updates.index.equals(self.iv.index):
+                changed.append(col)
+            elif not np.array_equal(updates[col].values.astype(float),
+                                    self.iv[col].values.astype(float),
+                                    equal_nan=True):
+                changed.append(col)
+
+        return changed
+
+    def commit(self, changed_only=False):
+        """Write the session's prediction columns to the iv table in one write.
+
+        :param changed_only: leave out columns identical to those already
+            stored, and skip the write if none changed. The match index is
+            likewise only written if it changed.
+        :return: list of the columns written
+        """
+        if self._match_changed or not changed_only:
+            self.store.put(self.match_path, self.match_index)
+            self._match_changed = False
 
-        update_table(self.store, iv_path, df)
+        if not self._pending:
+            return []
+
+        updates = pd.concat(self._pending, axis=1)
+        updates = updates.loc[:, ~updates.columns.duplicated(keep='last')]
+        self._pending = []
+
+        if changed_only:
+            updates = updates[self._changed_columns(updates)]
+
+        if updates.shape[1] == 0:
+            return []
+
+        with instrument.stage('write', rows=len(updates), site=self.site['id']):
+            self.iv = update_merge(self.iv, updates)
+            self.store.put(self.iv_path, self.iv)
+        #rebuilt from the merged frame when next needed
+        self.surrogates = None
+
+        return list(updates.columns)
+
+    def artifacts(self):
+        """Report files, figures and tables skipped or regenerated by this
+        Report, see ArtifactManifest.report.
+        """
+        return self.manifest.report()
 
     def generate_plots(self):
-        try:
-            sur_df = self.store.get('/said/{}/iv'.format(self.site['id']))
-            con_df = self.store.get('/said/{}/qwdata'.format(self.site['id']))
+        """Plot discharge, concentration and load of each constituent.
+
+        A figure is redrawn only if the columns it shows have changed.
+        """
+        self._ensure_loaded()
+        sur_df = self.iv
+        con_df = self.qwdata
 
-        except KeyError:
-            print('site {} not found'.format(site['name']))
+        for name, plot, constituent in SITE_PLOTS:
+            filename = 'plots/{}_{}.png'.format(self.site['name'], name)
+            columns = ['Discharge', constituent, constituent + '_L90.0',
+                       constituent + '_U90.0']
+            key = artifact_key(plot.__name__, sur_df.reindex(columns=columns),
+                               con_df.reindex(columns=[constituent]))
 
-        plot_nitrate(con_df, sur_df, filename='plots/{}_nitrate.png'.format(self.site['name']))
-        plot_ssc(con_df, sur_df, filename='plots/{}_ssc.png'.format(self.site['name']))
-        plot_tp(con_df, sur_df, filename='plots/{}_tp.png'.format(self.site['name']))
+            with instrument.stage('plot', rows=len(sur_df), site=self.site['id'],
+                                  constituent=constituent) as record:
+                record['skipped'] = not self.manifest.build(
+                    filename, key, plot, con_df, sur_df, filename=filename)
 
-    def run_all_models(self):
+        self.manifest.save()
+
+    def run_all_models(self, changed_only=False):
         """Generates a plots and model data for a given site
-        """
-        #self.process_nitrate()
-        try:
-            sur_df = self.store.get('/said/{}/iv'.format(self.site['id']))
-            con_df = self.store.get('/said/{}/qwdata'.format(self.site['id']))
 
-        except KeyError:
-            print('site {} not found'.format(site['name']))
+        The site's tables are read once and the predictions of every model
+        are written in a single commit.
 
+        :param changed_only: see commit
+        """
+        self._ensure_loaded()
+        sur_df = self.iv
+        con_df = self.qwdata
+
+        #self.process_nitrate()
 
         #determine start and end for plots
         start_date, end_date = get_time_limit(sur_df, con_df)
@@ -227,6 +384,8 @@ class Report:
         ]
         self.run_model(tp_model_list, 'TP')
 
+        self.commit(changed_only=changed_only)
+
         #write ssc model report
         #reportfile = 'report/{}_ssc_report.txt'.format(site['name'])
         #with open(reportfile, 'w') as f:
@@ -245,21 +404,9 @@ class Report:
         #except:
         #    print('phospate plot didnt work')
         #
-        self.summary_table.to_csv('report/{}_model_summary.csv'.format(self.site['name']),
-                            index=False)
-
-
-def model_row_summary(model):
-    if not model:
-        return None
+        summary_path = 'report/{}_model_summary.csv'.format(self.site['name'])
+        self.manifest.build(summary_path, artifact_key(self.summary_table),
+                            self.summary_table.to_csv, summary_path, index=False)
 
-    res = model._model._model.fit()
-    columns = SUMMARY_COLS
-    row = [[
-        model._model.get_model_formula(),
-        res.nobs,
-        res.rsquared_adj,
-        res.f_pvalue
-    ]]
+        self.manifest.save()
 
-    return pd.DataFrame(row, columns=columns)
@@ -0,0 +1,84 @@
+"""
+Stacks of explanatory scenarios for batched what-if predictions.
+
+A scenario stack is a frame indexed by (scenario, datetime) holding one copy
+of the surrogates of the record per scenario. HierarchicalModel.get_scenario_prediction
+evaluates every scenario of a stack in one pass per sub-model.
+
+Examples
+--------
+>>> scenarios = scaled_scenarios(sur_df, {'Discharge': [0.8, 0.9, 1.0, 1.1]},
+...                              columns=model.get_surrogate_variables())
+>>> prediction = model.get_scenario_prediction(scenarios)
+>>> prediction['TP'].unstack('scenario')
+"""
+import numpy as np
+import pandas as pd
+
+
+def scenario_frame(scenarios, index, columns, names=None):
+    """Scenario-indexed frame from a (scenario, time, variable) array.
+
+    Parameters
+    ----------
+    scenarios : array
+        Surrogate values, shape (n scenarios, n times, n variables).
+    index : DatetimeIndex or array
+        Times of the second axis. An unnamed index is named 'datetime'.
+    columns : list
+        Surrogate names of the third axis.
+    names : list
+        Scenario labels; defaults to 0 through n scenarios - 1.
+
+    Returns
+    -------
+    DataFrame indexed by (scenario, datetime).
+    """
+    scenarios = np.asarray(scenarios, dtype=float)
+    n_scenarios, n_times, n_variables = scenarios.shape
+
+    if names is None:
+        names = np.arange(n_scenarios)
+
+    index = pd.DatetimeIndex(index)
+    index = pd.MultiIndex.from_product([names, index],
+                                       names=['scenario', index.name or 'datetime'])
+
+    return pd.DataFrame(scenarios.reshape(-1, n_variables), index=index,
+                        columns=columns)
+
+
+def scaled_scenarios(surrogate_df, factors, columns=None):
+    """Scenarios that scale surrogates of a record by constant factors.
+
+    Parameters
+    ----------
+    surrogate_df : DataFrame
+        Baseline surrogate record.
+    factors : dict or DataFrame
+        Scale factors, one column per scaled surrogate and one row (or list
+        entry) per scenario. Surrogates without factors are left unchanged.
+        The scenarios are labelled by the index of factors.
+    columns : list
+        Surrogates copied into each scenario, such as those of
+        HierarchicalModel.get_surrogate_variables, so that columns no model
+        reads are not copied. Defaults to every column of surrogate_df.
+
+    Returns
+    -------
+    DataFrame indexed by (scenario, datetime), see scenario_frame.
+    """
+    factors = pd.DataFrame(factors)
+
+    if columns is not None:
+        surrogate_df = surrogate_df[list(columns)]
+
+    base = surrogate_df.values.astype(float)
+    scenarios = np.repeat(base[np.newaxis], len(factors), axis=0)
+
+    for column in factors:
+        j = surrogate_df.columns.get_loc(column)
+        scenarios[:, :, j] *= factors[column].values[:, np.newaxis]
+
+    return scenario_frame(scenarios, surrogate_df.index, surrogate_df.columns,
+                          names=factors.index)
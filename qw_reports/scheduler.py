@@ -0,0 +1,511 @@
+"""
+Dependency-aware scheduling of the per-site report pipeline.
+
+Each (site, stage) is a Task that declares the store tables it reads and
+writes. A task depends on the last task added before it that writes one of
+its inputs, so tasks of different sites are independent and run
+concurrently, e.g. plotting one site while another is modeled.
+
+Tasks run in threads. CPU-bound tasks, such as modeling and plotting, can
+instead run in worker processes: the scheduler reads their inputs, the task
+runs against an in-memory copy of them, and the tables it writes are sent
+back and written by the scheduler, so only the main process touches the
+store.
+
+Every table put through the scheduler's store is fingerprinted by content. A
+task whose inputs have the same fingerprints as when it last ran, and whose
+outputs exist, is skipped. Fingerprints and task state are kept in the store
+under /scheduler, so skipping carries over between runs. Tables changed
+outside the scheduler are not noticed; run with force=True after editing the
+store by hand.
+
+Examples
+--------
+>>> with pd.HDFStore('said.h5') as store:
+...     scheduler = Scheduler(store, max_workers=4)
+...     add_report_pipeline(scheduler, project.sites, store_path='said.h5')
+...     timings = scheduler.run()
+...     print(scheduler.report())
+"""
+import os
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, wait,
+                                FIRST_COMPLETED)
+from functools import partial
+
+import pandas as pd
+
+from qw_reports import instrument
+from qw_reports.cache import frame_digest
+from qw_reports.driver import MemoryStore, OUTPUT_DIRECTORIES
+
+STATE_PATH = '/scheduler/tasks'
+FINGERPRINT_PATH = '/scheduler/fingerprints'
+
+TIMING_COLS = ['status', 'start', 'end', 'duration']
+
+
+class Task:
+    """A unit of work on the store.
+
+    Parameters
+    ----------
+    name : string
+        Unique name, e.g. '03339000/model'.
+    func : callable
+        Called with the scheduler's store.
+    inputs : list
+        Store tables read by func.
+    outputs : list
+        Store tables written by func.
+    files : list
+        Files written by func. A task is only skipped if they exist.
+    resources : list
+        Names of resources held exclusively while func runs. 'store' holds
+        the store lock, for functions that open the store file themselves.
+    always_run : bool
+        Never skip the task, e.g. when its inputs are outside the store.
+    process : bool
+        Run func in a worker process, given a store holding only the task's
+        inputs. func must be picklable.
+    """
+    def __init__(self, name, func, inputs=(), outputs=(), files=(),
+                 resources=(), always_run=False, process=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.files = list(files)
+        self.resources = sorted(resources)
+        self.always_run = always_run
+        self.process = process
+
+        # names of the tasks this task waits for, set by Scheduler.add
+        self.dependencies = []
+
+
+class LockedStore:
+    """Store proxy that serializes access with a lock and fingerprints each
+    table put.
+
+    Parameters
+    ----------
+    store : HDFStore
+    lock : threading.RLock
+    """
+    def __init__(self, store, lock=None):
+        self._store = store
+        self.lock = lock or threading.RLock()
+        # path -> (digest, time recorded)
+        self._fingerprints = {}
+
+    def keys(self):
+        with self.lock:
+            return list(self._store.keys())
+
+    def __contains__(self, path):
+        return path in self.keys()
+
+    def get(self, path):
+        with self.lock:
+            return self._store.get(path)
+
+    def put(self, path, df):
+        with self.lock:
+            self._store.put(path, df)
+            self._fingerprints[path] = (frame_digest(df), time.time())
+
+    def fingerprint(self, path):
+        """Content digest of a table, or None if it does not exist.
+        """
+        with self.lock:
+            if path not in self._fingerprints:
+                if path not in self._store.keys():
+                    return None
+                self._fingerprints[path] = (frame_digest(self._store.get(path)),
+                                            time.time())
+
+            return self._fingerprints[path][0]
+
+    def invalidate(self, path, since=None):
+        """Forget the fingerprint of path, unless it was recorded after since.
+        """
+        with self.lock:
+            recorded = self._fingerprints.get(path)
+            if recorded is not None and (since is None or recorded[1] < since):
+                del self._fingerprints[path]
+
+
+class Scheduler:
+    """Run Tasks concurrently in dependency order.
+
+    Parameters
+    ----------
+    store : HDFStore
+        Store the tasks read and write; tasks are given a LockedStore over it.
+    max_workers : int
+        Number of tasks run at once, and of worker processes. None uses every
+        core.
+    """
+    def __init__(self, store, max_workers=None):
+        self.store = LockedStore(store)
+        self.max_workers = max_workers or os.cpu_count()
+
+        self.tasks = OrderedDict()
+        # table -> name of the last task that writes it
+        self._writers = {}
+
+        self._resource_locks = {'store': self.store.lock}
+        self._state = {}
+        self.failures = {}
+        self.timings = None
+        self._processes = None
+
+    def add(self, task):
+        """Add a task after the tasks already added.
+        """
+        if task.name in self.tasks:
+            raise ValueError('duplicate task: {}'.format(task.name))
+
+        task.dependencies = sorted(set(self._writers[path] for path in task.inputs
+                                       if path in self._writers))
+
+        for path in task.outputs:
+            self._writers[path] = task.name
+
+        self.tasks[task.name] = task
+        return task
+
+    def _load_state(self):
+        keys = self.store.keys()
+        self._state = {}
+
+        if STATE_PATH in keys:
+            self._state = self.store.get(STATE_PATH)['digest'].to_dict()
+
+        if FINGERPRINT_PATH in keys:
+            fingerprints = self.store.get(FINGERPRINT_PATH)['digest']
+            for path, digest in fingerprints.items():
+                self.store._fingerprints.setdefault(path, (digest, 0))
+
+    def _save_state(self):
+        state = pd.DataFrame({'digest': pd.Series(self._state, dtype=object)})
+        fingerprints = pd.DataFrame({'digest': pd.Series(
+            {path: digest for path, (digest, _) in self.store._fingerprints.items()
+             if not path.startswith('/scheduler/')}, dtype=object)})
+
+        with self.store.lock:
+            self.store._store.put(STATE_PATH, state)
+            self.store._store.put(FINGERPRINT_PATH, fingerprints)
+
+    def _input_digest(self, task):
+        """Combined fingerprint of a task's inputs, or None if one is missing.
+        """
+        digests = [self.store.fingerprint(path) for path in task.inputs]
+        if any(digest is None for digest in digests):
+            return None
+
+        return frame_digest(pd.Series(digests, index=task.inputs, dtype=object))
+
+    def _is_current(self, task):
+        if task.always_run or task.name not in self._state:
+            return False
+
+        if self._input_digest(task) != self._state[task.name]:
+            return False
+
+        keys = set(self.store.keys())
+        return all(path in keys for path in task.outputs) and \
+            all(os.path.exists(path) for path in task.files)
+
+    def _execute(self, task, statuses, force, start_time):
+        start = time.perf_counter() - start_time
+
+        if any(statuses.get(dep) in ('failed', 'blocked') for dep in task.dependencies):
+            return 'blocked', start, start
+
+        if not force and self._is_current(task):
+            return 'skipped', start, start
+
+        locks = [self._resource_locks.setdefault(name, threading.RLock())
+                 for name in task.resources]
+        for lock in locks:
+            lock.acquire()
+
+        started = time.time()
+        start = time.perf_counter() - start_time
+        try:
+            if task.process:
+                self._run_in_process(task)
+            else:
+                task.func(self.store)
+        except Exception:
+            self.failures[task.name] = traceback.format_exc()
+            return 'failed', start, time.perf_counter() - start_time
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        end = time.perf_counter() - start_time
+
+        # outputs written without going through self.store are re-read
+        for path in task.outputs:
+            self.store.invalidate(path, since=started)
+
+        # digest after the run, as a task may write its own inputs
+        self._state[task.name] = self._input_digest(task)
+
+        return 'run', start, end
+
+    def _run_in_process(self, task):
+        keys = set(self.store.keys())
+        tables = {path: self.store.get(path) for path in task.inputs if path in keys}
+
+        future = self._processes.submit(_run_with_tables, task.func, tables)
+        for path, df in future.result().items():
+            self.store.put(path, df)
+
+    def run(self, force=False):
+        """Run every task, skipping those that are current.
+
+        Parameters
+        ----------
+        force : bool
+            Run every task even if its inputs are unchanged.
+
+        Returns
+        -------
+        DataFrame of the status ('run', 'skipped', 'failed' or 'blocked' by
+        a failed dependency), start, end and duration in seconds of each task.
+        """
+        self._load_state()
+        self.failures = {}
+
+        dependents = {name: [] for name in self.tasks}
+        waiting = {}
+        for name, task in self.tasks.items():
+            waiting[name] = len(task.dependencies)
+            for dep in task.dependencies:
+                dependents[dep].append(name)
+
+        ready = [name for name, count in waiting.items() if count == 0]
+        statuses = {}
+        rows = {}
+        start_time = time.perf_counter()
+
+        if any(task.process for task in self.tasks.values()):
+            self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            # start the workers now, before any threads are running
+            self._processes.submit(int).result()
+
+        try:
+            self._dispatch(ready, waiting, dependents, statuses, rows, force,
+                           start_time)
+        finally:
+            if self._processes is not None:
+                self._processes.shutdown()
+                self._processes = None
+
+        self._save_state()
+
+        self.wall_time = time.perf_counter() - start_time
+        self.timings = pd.DataFrame.from_dict(rows, orient='index',
+                                              columns=TIMING_COLS).reindex(list(self.tasks))
+        self.timings.index.name = 'task'
+
+        return self.timings
+
+    def _dispatch(self, ready, waiting, dependents, statuses, rows, force,
+                  start_time):
+        """Run ready tasks in threads until every task has finished.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while ready or running:
+                for name in ready:
+                    future = executor.submit(self._execute, self.tasks[name],
+                                             statuses, force, start_time)
+                    running[future] = name
+                ready = []
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    status, start, end = future.result()
+                    statuses[name] = status
+                    rows[name] = [status, start, end, end - start]
+
+                    for child in dependents[name]:
+                        waiting[child] -= 1
+                        if waiting[child] == 0:
+                            ready.append(child)
+
+    def critical_path(self):
+        """Longest chain of dependent tasks of the last run, by duration.
+
+        Returns
+        -------
+        (list of task names, total duration in seconds)
+        """
+        length = {}
+        previous = {}
+        for name, task in self.tasks.items():
+            duration = self.timings.loc[name, 'duration']
+            best = max(task.dependencies, key=lambda dep: length[dep], default=None)
+            length[name] = duration + (length[best] if best else 0)
+            previous[name] = best
+
+        if not length:
+            return [], 0.0
+
+        name = max(length, key=length.get)
+        total = length[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+
+        return path[::-1], total
+
+    def report(self):
+        """Summary of the last run: task counts by status, wall time, total
+        task time and the critical path.
+        """
+        path, total = self.critical_path()
+        counts = self.timings['status'].value_counts()
+
+        lines = ['{} tasks: {}'.format(len(self.timings), ', '.join(
+                     '{} {}'.format(count, status) for status, count in counts.items())),
+                 'wall time {:.1f} s, task time {:.1f} s'.format(
+                     self.wall_time, self.timings['duration'].sum()),
+                 'critical path {:.1f} s: {}'.format(total, ' -> '.join(path))]
+
+        return '\n'.join(lines)
+
+
+def _run_with_tables(func, tables):
+    """Run a task function in a worker process against in-memory tables.
+    """
+    store = MemoryStore(tables)
+    func(store)
+    return store.updates
+
+
+def stage_site(site, store_path, approved_only, store):
+    """Stage a site through the scheduler's store.
+
+    The raw NWIS tables are read by hygnd, which opens the store file
+    itself, so the read holds the store lock; the staged tables are written
+    through the scheduler's own handle.
+    """
+    from qw_reports.preprocess.said import SurrogateModel, stage_tables
+
+    with store.lock:
+        raw = SurrogateModel(site['id'], store_path).read_raw(site.get('proxy'))
+
+    with instrument.stage('stage', site=site['id']) as record:
+        iv, qwdata, match = stage_tables(*raw, start=site.get('start'),
+                                         end=site.get('end'),
+                                         approved_only=approved_only)
+        record['rows'] = len(iv)
+
+    db_path = '/said/{}/'.format(site['id'])
+    store.put(db_path + 'iv', iv)
+    store.put(db_path + 'qwdata', qwdata)
+    store.put(db_path + 'match', match)
+
+
+def model_site(site, min_samples, cache, force, store):
+    from qw_reports.reports import Report
+
+    report = Report(store, site, min_samples=min_samples, cache=cache,
+                    force=force)
+    report.run_all_models(changed_only=True)
+
+
+def plot_site(site, force, store):
+    from qw_reports.reports import Report
+
+    Report(store, site, force=force).generate_plots()
+
+
+def site_loads(site, store):
+    from qw_reports.tables import LoadTable
+
+    entry = LoadTable(store, None).calculate_site_load(site['id'])
+    store.put('/said/{}/load_table'.format(site['id']), entry.to_frame().T)
+
+
+def network_loads(sites, store):
+    from qw_reports.tables import LoadTable
+
+    rows = [store.get('/said/{}/load_table'.format(site['id'])) for site in sites]
+    data = pd.concat(rows)
+    data.index.name = LoadTable(store, None).data.index.name
+    store.put('/tables/loads', data)
+
+
+def add_report_pipeline(scheduler, sites, store_path=None, stage=True,
+                        plots=True, min_samples=10, cache=None,
+                        approved_only=True, force=False):
+    """Add the stage, model, load and plot tasks of every site, and the
+    network load table, to a scheduler.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+    sites : list
+        Site dicts, as in a project template.
+    store_path : string
+        Path of the store file, needed to stage sites.
+    stage : bool
+        Add stage tasks. Staging reads NWIS tables outside the /said tables,
+        so stage tasks always run; unchanged staged tables still let the
+        tasks after them be skipped.
+    plots : bool
+        Add plot tasks.
+    min_samples, cache
+        Passed to Report.
+    approved_only : bool
+        Passed to SurrogateModel.stage.
+    force : bool
+        Regenerate report files and figures whose inputs are unchanged.
+        Passed to Report.
+    """
+    # created here rather than by concurrent tasks
+    for directory in OUTPUT_DIRECTORIES:
+        os.makedirs(directory, exist_ok=True)
+
+    for site in sites:
+        site_id = site['id']
+        db_path = '/said/{}/'.format(site_id)
+        iv, qwdata, match = db_path + 'iv', db_path + 'qwdata', db_path + 'match'
+
+        if stage:
+            scheduler.add(Task('{}/stage'.format(site_id),
+                               partial(stage_site, site, store_path, approved_only),
+                               outputs=[iv, qwdata, match], always_run=True))
+
+        scheduler.add(Task('{}/model'.format(site_id),
+                           partial(model_site, site, min_samples, cache, force),
+                           inputs=[iv, qwdata, match], outputs=[iv, match],
+                           files=['report/{}_model_summary.csv'.format(site['name'])],
+                           process=True))
+
+        scheduler.add(Task('{}/loads'.format(site_id), partial(site_loads, site),
+                           inputs=[iv], outputs=[db_path + 'load_table']))
+
+        if plots:
+            scheduler.add(Task('{}/plots'.format(site_id), partial(plot_site, site, force),
+                               inputs=[iv, qwdata],
+                               files=['plots/{}_{}.png'.format(site['name'], name)
+                                      for name in ['nitrate', 'ssc', 'tp']],
+                               process=True))
+
+    scheduler.add(Task('tables', partial(network_loads, sites),
+                       inputs=['/said/{}/load_table'.format(site['id']) for site in sites],
+                       outputs=['/tables/loads']))
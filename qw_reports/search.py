@@ -0,0 +1,212 @@
+"""
+Exhaustive search of surrogate combinations for HierarchicalModel model lists.
+
+Every subset of the candidate (surrogate, transform) terms up to a size limit
+is fit from a Gram matrix shared by all subsets over the same samples. Subsets
+are visited depth first and each added term extends the parent's Cholesky
+factor by one row, so no candidate is fit from scratch.
+
+Examples
+--------
+>>> table = search_models(con_df, sur_df, 'log(TP)',
+                          surrogates=['OrthoP', 'Turb_HACH', 'Turb_YSI', 'Discharge'],
+                          max_terms=2)
+
+>>> model = HierarchicalModel(con_df, sur_df, model_list=table['model'][:4].tolist())
+"""
+import numpy as np
+import pandas as pd
+
+from scipy.linalg import solve_triangular
+from scipy.stats import f as f_dist
+from linearmodel import model as saidmodel
+
+from qw_reports.model import TRANSFORM_FUNCTIONS
+from qw_reports.match import build_match_index, matched_surrogates
+
+SEARCH_COLS = ['model', 'formula', '# obs', 'adjusted r^2', 'p-value']
+
+
+def _variable_name(transform, raw_variable):
+    if transform is None:
+        return raw_variable
+    return '{}({})'.format(transform, raw_variable)
+
+
+def _transform(transform, values):
+    """Transform values, marking non-finite results as NaN.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = TRANSFORM_FUNCTIONS[transform](np.array(values, dtype=float))
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+class _GramCache:
+    """Gram matrices of [1, candidates, response] over sample subsets.
+
+    Subsets that share the same valid samples share one Gram matrix.
+    """
+    def __init__(self, design):
+        self.design = design
+        self.valid = ~np.isnan(design)
+        self._grams = {}
+
+    def get(self, mask):
+        key = mask.tobytes()
+        if key not in self._grams:
+            a = self.design[mask]
+            self._grams[key] = a.T.dot(a)
+        return self._grams[key]
+
+
+def search_models(constituent_df, surrogate_df, constituent, surrogates=None,
+                  transforms=(None, 'log'), max_terms=2, match_time=30,
+                  min_samples=30, match_index=None):
+    """Fit every combination of candidate surrogates and rank them.
+
+    Parameters
+    ----------
+    constituent_df : DataFrame
+        Discrete samples.
+    surrogate_df : DataFrame
+        Continuous surrogate record.
+    constituent : string
+        Response with its transform, e.g. 'log(TP)'.
+    surrogates : list
+        Candidate raw surrogates. Defaults to every column of surrogate_df.
+    transforms : list
+        Candidate transforms applied to each surrogate; None for untransformed.
+    max_terms : int
+        Largest number of surrogate terms in a model. A surrogate appears at
+        most once in a model.
+    match_time : float
+        Maximum time, in minutes, between a sample and its surrogate values.
+    min_samples : int
+        Minimum number of matched samples for a candidate to be reported.
+    match_index : DataFrame
+        Precomputed match index (see qw_reports.match); built if not given.
+
+    Returns
+    -------
+    DataFrame with columns SEARCH_COLS ranked by adjusted r^2. The 'model'
+    column holds model_list entries, e.g. ['log(TP)', ['log(Turb_HACH)']].
+    """
+    constituent_transform, raw_constituent = saidmodel.find_raw_variable(constituent)
+
+    if match_index is None:
+        match_index = build_match_index(surrogate_df, constituent_df)
+
+    matched = matched_surrogates(match_index, match_time)
+    matched = matched[~matched.index.duplicated()]
+    response = constituent_df[raw_constituent]
+    response = response[~response.index.duplicated()]
+    matched = matched.reindex(response.index)
+
+    if surrogates is None:
+        surrogates = [col for col in surrogate_df.columns if col in matched]
+
+    # candidate terms and the design [1, terms..., response]
+    terms = [(transform, surrogate) for surrogate in surrogates
+             for transform in transforms]
+    columns = [np.ones(len(response))]
+    columns += [_transform(t, matched[s].values) for t, s in terms]
+    columns.append(_transform(constituent_transform, response.values))
+    design = np.column_stack(columns)
+
+    grams = _GramCache(design)
+    y = design.shape[1] - 1
+    base_mask = grams.valid[:, y]
+
+    rows = []
+
+    def factor(subset, mask):
+        """Cholesky factor and forward-solved response of a subset from
+        scratch, used when its valid samples differ from its parent's.
+        """
+        gram = grams.get(mask)
+        cols = [0] + [j + 1 for j in subset]
+        try:
+            chol = np.linalg.cholesky(gram[np.ix_(cols, cols)])
+        except np.linalg.LinAlgError:
+            return None, None
+        z = solve_triangular(chol, gram[cols, y], lower=True)
+        return chol, z
+
+    def extend(chol, z, gram, cols, k):
+        """Add column k to the factor of cols; None if k is collinear.
+        """
+        l = solve_triangular(chol, gram[cols, k], lower=True)
+        d2 = gram[k, k] - l.dot(l)
+        if d2 <= 1e-10 * gram[k, k]:
+            return None, None
+
+        d = np.sqrt(d2)
+        p = len(cols)
+        new_chol = np.zeros((p + 1, p + 1))
+        new_chol[:p, :p] = chol
+        new_chol[p, :p] = l
+        new_chol[p, p] = d
+        new_z = np.append(z, (gram[k, y] - l.dot(z)) / d)
+        return new_chol, new_z
+
+    def record(subset, mask, gram, z):
+        n = mask.sum()
+        p = len(subset) + 1
+        if n < max(min_samples, p + 2):
+            return
+
+        rss = gram[y, y] - z.dot(z)
+        tss = gram[y, y] - gram[0, y]**2 / n
+        if tss <= 0:
+            return
+
+        rsquared = 1 - rss / tss
+        rsquared_adj = 1 - (1 - rsquared) * (n - 1) / (n - p)
+        f_value = ((tss - rss) / (p - 1)) / (rss / (n - p))
+        f_pvalue = f_dist.sf(f_value, p - 1, n - p)
+
+        names = [_variable_name(*terms[j]) for j in subset]
+        rows.append([[constituent, names],
+                     '{} ~ {}'.format(constituent, ' + '.join(names)),
+                     n, rsquared_adj, f_pvalue])
+
+    def visit(subset, mask, chol, z):
+        used = set(terms[j][1] for j in subset)
+        start = subset[-1] + 1 if subset else 0
+
+        for j in range(start, len(terms)):
+            if terms[j][1] in used:
+                continue
+
+            child = subset + [j]
+            child_mask = mask & grams.valid[:, j + 1]
+            if child_mask.sum() < max(min_samples, len(child) + 3):
+                continue
+
+            if (child_mask == mask).all():
+                # same samples as the parent: extend its factor by one row
+                gram = grams.get(mask)
+                cols = [0] + [i + 1 for i in subset]
+                child_chol, child_z = extend(chol, z, gram, cols, j + 1)
+            else:
+                gram = grams.get(child_mask)
+                child_chol, child_z = factor(child, child_mask)
+
+            if child_chol is None:
+                continue
+
+            record(child, child_mask, gram, child_z)
+
+            if len(child) < max_terms:
+                visit(child, child_mask, child_chol, child_z)
+
+    if base_mask.sum() > 0:
+        chol, z = factor([], base_mask)
+        if chol is not None:
+            visit([], base_mask, chol, z)
+
+    table = pd.DataFrame(rows, columns=SEARCH_COLS)
+    table = table.sort_values('adjusted r^2', ascending=False)
+
+    return table.reset_index(drop=True)
@@ -0,0 +1,258 @@
+"""
+Online predictions and loads from the frozen sub-models of a HierarchicalModel.
+
+StreamingPredictor keeps only the fitted coefficients of each sub-model, so
+every new observation costs the same however long the record behind the
+model is, and nothing is re-read or refit. Observations arrive one at a time
+or in micro-batches from any iterable feed; queue_feed and tail_csv turn an
+in-memory queue or a growing CSV file into a feed.
+
+Examples
+--------
+>>> predictor = StreamingPredictor(tp_model, discharge='Discharge')
+>>> for out in predictor.run(tail_csv('iv.csv'), batch_size=4):
+...     print(out[['TP', 'TP_L90.0', 'TP_U90.0', 'cumulative load']])
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from qw_reports.model import PredictionEngine, SurrogateData, cascading_prediction
+from qw_reports.analysis.loads import (DEFAULT_MAX_GAP, DEFAULT_RULE,
+                                       interval_loads, load_rate)
+
+LOAD_COLS = ['load', 'cumulative load']
+
+
+class StreamingPredictor:
+    """Predict concentration, prediction intervals and loads as surrogate
+    observations arrive.
+
+    The load of each observation is that of the interval ending at it,
+    integrated from the previous observation by interval_loads. It is NaN for
+    the first observation and after a gap; the cumulative load skips them.
+
+    Parameters
+    ----------
+    model : HierarchicalModel
+        Fitted model whose coefficients are frozen.
+    discharge : string
+        Surrogate column holding discharge, used for loads.
+    units : string
+        Load units, 'lbs' or 'tons'.
+    rank_by : string
+        Skill measure used to rank the sub-models, see
+        HierarchicalModel.get_prediction.
+    percentile : float
+        Width of the prediction interval.
+    rule, max_gap
+        See interval_loads.
+    """
+    def __init__(self, model, discharge='Discharge', units='lbs',
+                 rank_by='rsquared', percentile=90.0, rule=DEFAULT_RULE,
+                 max_gap=DEFAULT_MAX_GAP):
+        self.constituent = model._constituent
+        self.discharge = discharge
+        self.units = units
+        self.rule = rule
+        self.max_gap = max_gap
+
+        # best model first, as in HierarchicalModel.get_prediction
+        self._engines = [(i, PredictionEngine(model._fits[i], percentile))
+                         for i in reversed(model._ranked_models(rank_by))]
+
+        if not self._engines:
+            raise ValueError('model has no sub-models to predict with')
+
+        engine = self._engines[0][1]
+        self.columns = [self.constituent,
+                        self.constituent + engine.lower_suffix,
+                        self.constituent + engine.upper_suffix,
+                        self.constituent + '_model'] + LOAD_COLS
+
+        self.cumulative_load = 0.0
+        self.last_time = None
+        # load rate of the last observation, which starts the next interval
+        self.last_rate = np.nan
+        self.count = 0
+
+    def update(self, batch):
+        """Predict a micro-batch of observations.
+
+        Observations at or before the last one seen are ignored, so that
+        replayed rows are not counted in the cumulative load twice.
+
+        Parameters
+        ----------
+        batch : DataFrame
+            Raw surrogates indexed by time.
+
+        Returns
+        -------
+        DataFrame with the columns in self.columns, one row per new
+        observation.
+        """
+        batch = batch.sort_index()
+        batch = batch[~batch.index.duplicated(keep='last')]
+        if self.last_time is not None:
+            batch = batch[batch.index > self.last_time]
+
+        if len(batch) == 0:
+            return pd.DataFrame(columns=self.columns, index=batch.index)
+
+        out = cascading_prediction(self._engines, SurrogateData(batch))
+
+        concentration = out[self.constituent]
+        if self.discharge in batch:
+            discharge = batch[self.discharge].values.astype(float)
+            rate = load_rate(discharge, concentration, units=self.units)
+        else:
+            rate = np.full(len(batch), np.nan)
+
+        load = np.full(len(batch), np.nan)
+        if self.last_time is not None:
+            times = pd.DatetimeIndex([self.last_time]).append(batch.index)
+            rates = np.append(self.last_rate, rate)
+        else:
+            times, rates = batch.index, rate
+
+        loads, seconds = interval_loads(times, rates, self.rule, self.max_gap)
+        loads, seconds = loads[:, 0], seconds[:, 0]
+        # intervals ending at each observation; gaps have no load
+        load[len(batch) - len(loads):] = np.where(seconds > 0, loads, np.nan)
+
+        out['load'] = load
+        out['cumulative load'] = self.cumulative_load + np.nancumsum(load)
+
+        self.cumulative_load = out['cumulative load'][-1]
+        self.last_time = batch.index[-1]
+        self.last_rate = rate[-1]
+        self.count += len(batch)
+
+        return pd.DataFrame(out, index=batch.index, columns=self.columns)
+
+    def observe(self, timestamp, values):
+        """Predict a single observation.
+
+        Parameters
+        ----------
+        timestamp : datetime-like
+        values : dict
+            Raw surrogate values by column name.
+        """
+        batch = pd.DataFrame([values], index=pd.DatetimeIndex([timestamp]))
+
+        return self.update(batch)
+
+    def run(self, feed, batch_size=1):
+        """Predict every observation of a feed.
+
+        Parameters
+        ----------
+        feed : iterable
+            Yields (timestamp, values) pairs, such as queue_feed or tail_csv,
+            or DataFrames of observations.
+        batch_size : int
+            Number of (timestamp, values) pairs predicted together. A
+            partial batch is predicted when the feed ends.
+
+        Yields
+        ------
+        DataFrame of predictions for each micro-batch.
+        """
+        buffer = []
+
+        for item in feed:
+            if isinstance(item, pd.DataFrame):
+                if buffer:
+                    yield self._flush(buffer)
+                yield self.update(item)
+                continue
+
+            buffer.append(item)
+            if len(buffer) >= batch_size:
+                yield self._flush(buffer)
+
+        if buffer:
+            yield self._flush(buffer)
+
+    def _flush(self, buffer):
+        timestamps, values = zip(*buffer)
+        del buffer[:]
+
+        batch = pd.DataFrame(list(values), index=pd.DatetimeIndex(timestamps))
+
+        return self.update(batch)
+
+
+def queue_feed(queue, sentinel=None):
+    """Feed of the items put on a queue.Queue, ending at sentinel.
+    """
+    while True:
+        item = queue.get()
+        if item is sentinel:
+            return
+        yield item
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _complete_lines(f, follow, poll_interval):
+    """Complete lines of a file, waiting for lines still being written.
+    """
+    partial = ''
+    while True:
+        line = f.readline()
+        if not line:
+            if not follow:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        partial += line
+        if partial.endswith('\n'):
+            yield partial
+            partial = ''
+
+    if partial:
+        yield partial
+
+
+def tail_csv(path, follow=True, poll_interval=1.0):
+    """Feed of the rows of a CSV file, including rows appended later.
+
+    The first line is a header; the first column holds timestamps and the
+    others surrogate values. Empty or unparseable values are NaN.
+
+    Parameters
+    ----------
+    path : string
+    follow : bool
+        Keep waiting for new rows at the end of the file. If False, the feed
+        ends at the end of the file.
+    poll_interval : float
+        Seconds between checks for new rows.
+    """
+    with open(path) as f:
+        lines = _complete_lines(f, follow, poll_interval)
+
+        header = next(lines, None)
+        if header is None:
+            return
+        columns = header.strip().split(',')[1:]
+
+        for line in lines:
+            fields = line.strip().split(',')
+            if len(fields) != len(columns) + 1:
+                continue
+
+            values = {column: _float(value)
+                      for column, value in zip(columns, fields[1:])}
+
+            yield pd.Timestamp(fields[0]), values
@@ -0,0 +1,112 @@
+"""
+Sensitivity of HierarchicalModel sub-models to the sample matching window.
+
+Each sample's offset to its nearest IV row is taken once from the match
+index. Samples are ordered by absolute offset, so the samples matched within
+any window are a prefix of that order and every window is read from the same
+running sums.
+
+Examples
+--------
+>>> sweep = match_time_sweep(con_df, sur_df, tp_model_list,
+                             match_times=[5, 10, 15, 30, 60, 120])
+"""
+import numpy as np
+import pandas as pd
+
+from scipy.stats import f as f_dist
+from linearmodel import model as saidmodel
+
+from qw_reports.model import TRANSFORM_FUNCTIONS
+from qw_reports.match import build_match_index
+from qw_reports.windowed import SufficientStatistics
+
+SWEEP_COLS = ['# obs', 'adjusted r^2', 'p-value', 'coef shift']
+
+
+def _transformed(variable, data):
+    transform, raw_variable = saidmodel.find_raw_variable(variable)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return TRANSFORM_FUNCTIONS[transform](np.array(data[raw_variable], dtype=float))
+
+
+def match_time_sweep(constituent_df, surrogate_df, model_list, match_times,
+                     match_index=None):
+    """Matched sample count, skill and coefficient stability of each model for
+    a list of match windows.
+
+    Parameters
+    ----------
+    constituent_df : DataFrame
+        Discrete samples.
+    surrogate_df : DataFrame
+        Continuous surrogate record.
+    model_list : list
+        Model list as passed to HierarchicalModel.
+    match_times : list
+        Match windows, in minutes.
+    match_index : DataFrame
+        Precomputed match index (see qw_reports.match); built if not given.
+
+    Returns
+    -------
+    DataFrame indexed by (model, match time) with the columns SWEEP_COLS
+    followed by the coefficients. 'coef shift' is the largest change of any
+    coefficient from its value at the widest window, in standard errors of
+    that fit.
+    """
+    if match_index is None:
+        match_index = build_match_index(surrogate_df, constituent_df)
+
+    match_index = match_index[~match_index.index.duplicated()]
+    match_times = np.sort(np.asarray(match_times, dtype=float))
+
+    frames = []
+    for constituent, surrogates in model_list:
+        _, raw_constituent = saidmodel.find_raw_variable(constituent)
+
+        response = constituent_df[raw_constituent]
+        response = response[~response.index.duplicated()]
+        matched = match_index.reindex(response.index)
+
+        y = _transformed(constituent, {raw_constituent: response.values})
+        x = np.column_stack([np.ones(len(y))] +
+                            [_transformed(s, matched) for s in surrogates])
+        offset = np.abs(matched['offset'].values)
+
+        # samples that can be fit, nearest first
+        valid = np.isfinite(y) & np.isfinite(x).all(axis=1) & ~np.isnan(offset)
+        order = np.flatnonzero(valid)[np.argsort(offset[valid], kind='mergesort')]
+        sums = SufficientStatistics(x[order], y[order])
+        cutoffs = np.searchsorted(offset[order], match_times, side='right')
+
+        fits = [sums.stats(0, hi) for hi in cutoffs]
+
+        # stability relative to the widest window
+        reference = fits[-1]
+        if reference['cov_params'] is not None:
+            se = np.sqrt(np.diag(reference['cov_params']))
+        else:
+            se = np.full(x.shape[1], np.nan)
+
+        rows = []
+        for fit in fits:
+            n, p = fit['n'], x.shape[1]
+            if n > p and fit['rsquared'] < 1:
+                f_value = (fit['rsquared'] / (p - 1)) / ((1 - fit['rsquared']) / (n - p))
+                f_pvalue = f_dist.sf(f_value, p - 1, n - p)
+            else:
+                f_pvalue = np.nan
+
+            shift = np.abs(fit['params'] - reference['params']) / se
+            shift = shift.max() if np.isfinite(shift).all() else np.nan
+
+            rows.append([n, fit['rsquared_adj'], f_pvalue, shift] + list(fit['params']))
+
+        formula = '{} ~ {}'.format(constituent, ' + '.join(surrogates))
+        columns = SWEEP_COLS + ['Intercept'] + list(surrogates)
+        index = pd.MultiIndex.from_product([[formula], match_times],
+                                           names=['model', 'match time'])
+        frames.append(pd.DataFrame(rows, columns=columns, index=index))
+
+    return pd.concat(frames, sort=False)
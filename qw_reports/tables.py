@@ -1,7 +1,12 @@
 import pandas as pd
 
 from linearmodel.datamanager import DataManager
-from qw_reports.analysis.loads import mean_annual_load
+from qw_reports.analysis.loads import (period_lengths, water_year_loads,
+                                       water_year_mean_load)
+from qw_reports.analysis.uncertainty import (CONSTITUENT_SCALES, METHODS,
+                                             load_realizations, load_variance,
+                                             mean_annual_load_interval)
+from qw_reports import instrument
 #from qw_reports.reports import make_phos_model
 
 class ReportTable():
@@ -33,13 +38,15 @@ class SampleTable(ReportTable):
 
 
     def generate(self, constituent):
-        for site in self.template.sites:
-            df = self.get_samples(site['id'])
-            series = df[constituent].dropna()
-
-            self.data.loc[site['id'], 'Mean'] = series.mean()
-            self.data.loc[site['id'], 'No. Obs.'] = series.count()
-            self.data.loc[site['id'], 'Median'] = series.median()
+        with instrument.stage('tables', rows=len(self.template.sites),
+                              table='samples', constituent=constituent):
+            for site in self.template.sites:
+                df = self.get_samples(site['id'])
+                series = df[constituent].dropna()
+
+                self.data.loc[site['id'], 'Mean'] = series.mean()
+                self.data.loc[site['id'], 'No. Obs.'] = series.count()
+                self.data.loc[site['id'], 'Median'] = series.median()
         
 
     def get_samples(self, site_id):
@@ -52,6 +59,9 @@ class SampleTable(ReportTable):
 
         return df
  
+# (iv column, units) of the loads in LoadTable.columns
+LOAD_CONSTITUENTS = [('Nitrate', 'lbs'), ('TP', 'lbs'), ('SSC', 'tons')]
+
 class LoadTable(ReportTable):
     """
     """
@@ -68,63 +78,190 @@ class LoadTable(ReportTable):
         self.data.index.name = 'Site ID'
 
 
-    def generate(self, water_years=None):
+    def interval_columns(self, percentile=90.0):
+        """Names of the lower and upper bound columns of each load column.
         """
+        return [(column + '_L{}'.format(float(percentile)),
+                 column + '_U{}'.format(float(percentile)))
+                for column in self.columns]
+
+    def generate(self, water_years=None, interval=None, percentile=90.0,
+                 **kwargs):
+        """Mean annual load of each constituent at every site.
+
+        Each site's iv table is read once, and every water-year and mean
+        load is computed from one integration of its loads (see site_loads).
+        Mean annual loads are scaled from the time covered by the record to
+        a year; the fraction of each period covered by each load column is
+        kept in self.coverage.
+
+        Parameters
+        ----------
         water_years : list
-
-        TODO: make this a method of a another class
+            Water years to tabulate, each with the mean annual load of the
+            site in that year, followed by the mean over the years from the
+            first through the last. If None, the table holds the mean annual
+            load of each site's whole record.
+        interval : string
+            'analytic' or 'monte_carlo' to add the bounds of each load,
+            propagated from the prediction intervals of the iv table (see
+            qw_reports.analysis.uncertainty), after each load column. None
+            for loads only.
+        percentile : float
+            Width of the prediction intervals and of the load intervals.
+
+        Other keyword arguments, e.g. n_realizations and seed, are passed to
+        load_variance or load_realizations.
+
+        Returns
+        -------
+        DataFrame indexed by site id.
         """
+        table_columns = list(self.columns)
+        if interval:
+            table_columns = [name for column, bounds in
+                             zip(self.columns, self.interval_columns(percentile))
+                             for name in (column,) + bounds]
 
         if water_years:
-            water_year_columns = water_years + ['mean']
-            #water_years.append('mean')
-            column_names = [self.columns, water_year_columns]
-            columns = pd.MultiIndex.from_product(column_names)
+            water_year_columns = list(water_years) + ['mean']
+            years = [int(year) for year in water_years]
+            # every water year from the first through the last
+            mean_years = list(range(years[0], years[-1] + 1))
+            columns = pd.MultiIndex.from_product([table_columns, water_year_columns])
+            coverage_columns = pd.MultiIndex.from_product([self.columns,
+                                                           water_year_columns])
+            ranges = [(year, year) for year in years] + [(years[0], years[-1])]
 
         else:
-            columns = self.columns
+            columns = table_columns
+            coverage_columns = self.columns
+            ranges = [(None, None)]
+
+        site_ids = pd.Index([site['id'] for site in self.template.sites],
+                            name=self.data.index.name)
+        data = pd.DataFrame(index=site_ids, columns=columns, dtype=float)
+        self.coverage = pd.DataFrame(index=site_ids, columns=coverage_columns,
+                                     dtype=float)
+
+        with instrument.stage('tables', rows=len(site_ids), table='loads'):
+            for site in self.template.sites:
+                sur_df = self._read_iv(site['id'])
+                loads, seconds, coverage = self.site_loads(site['id'], sur_df)
+
+                if interval:
+                    spreads = self.site_load_spread(site['id'], sur_df, interval,
+                                                    percentile, **kwargs)
+
+                # one row per table column, one column per range of years
+                values = pd.DataFrame(index=table_columns, columns=range(len(ranges)),
+                                      dtype=float)
+                for i, (first, last) in enumerate(ranges):
+                    values[i] = water_year_mean_load(loads, seconds, first, last)
+
+                    if interval:
+                        for column, (lower, upper) in zip(self.columns,
+                                                          self.interval_columns(percentile)):
+                            values.loc[[lower, upper], i] = mean_annual_load_interval(
+                                loads[column], seconds[column], spreads[column],
+                                first, last, percentile)
+
+                if water_years:
+                    covered = coverage.reindex(years).fillna(0).T
+                    covered['mean'] = (seconds.reindex(mean_years).fillna(0).sum()
+                                       / period_lengths(mean_years, 'WY').sum())
+
+                else:
+                    covered = (seconds.sum() / period_lengths(seconds.index, 'WY').sum())
+
+                # row-major order matches the MultiIndex columns
+                data.loc[site['id']] = values.values.ravel()
+                self.coverage.loc[site['id']] = covered.loc[self.columns].values.ravel()
 
-        data = pd.DataFrame(data=None, columns=columns)
+        return data
 
-        for site in self.template.sites:
+    def _read_iv(self, site_id):
+        try:
+            return self.store.get('/said/{}/iv'.format(site_id))
 
-            if water_years:
-                entry = pd.Series(index=columns, name=site['id'])
-                # Not working yet
-                for year in water_years:
-                    annual_entry = self.calculate_site_load(site['id'], wy=year)
-                    for constituent in annual_entry.index:
-                        entry.loc[constituent, year] = annual_entry.loc[constituent]
+        except KeyError:
+            print('site {} not found'.format(site_id))
+            raise
 
-                mean_entry = self.calculate_site_load(site['id'], year_range=[water_years[0], water_years[-1]])
-                for constituent in mean_entry.index:
-                    entry.loc[constituent, 'mean'] = mean_entry.loc[constituent]
+    def site_loads(self, site_id, sur_df=None):
+        """Load, seconds covered and coverage of each load column by water
+        year, see water_year_loads.
 
-            else:
-                entry = self.calculate_site_load(site['id'])
+        :param sur_df: the site's iv table; read from the store if None
+        """
+        if sur_df is None:
+            sur_df = self._read_iv(site_id)
 
-            data = data.append(entry)
+        with instrument.stage('loads', rows=len(sur_df), site=site_id):
+            tables = water_year_loads(
+                sur_df['Discharge'],
+                sur_df[[constituent for constituent, _ in LOAD_CONSTITUENTS]],
+                [units for _, units in LOAD_CONSTITUENTS])
 
-        return data
+        for table in tables:
+            table.columns = self.columns
 
+        return tables
 
-    def calculate_site_load(self, site_id, wy=None, year_range=None):
-        """
-        TODO: make this a method of the station object
+    def site_load_spread(self, site_id, sur_df=None, method='analytic',
+                         percentile=90.0, **kwargs):
+        """Spread of the water-year loads of each load column, as taken by
+        mean_annual_load_interval: variances for the analytic method,
+        realizations for monte_carlo. None for a constituent without
+        prediction interval columns.
+
+        Keyword arguments are passed to load_variance or load_realizations.
         """
-        try:
-            sur_df = self.store.get('/said/{}/iv'.format(site_id))
-            con_df = self.store.get('/said/{}/qwdata'.format(site_id))
+        if method not in METHODS:
+            raise ValueError('method must be one of {}'.format(METHODS))
+        if sur_df is None:
+            sur_df = self._read_iv(site_id)
+
+        spread = load_variance if method == 'analytic' else load_realizations
+        lower_suffix = '_L{}'.format(float(percentile))
+        upper_suffix = '_U{}'.format(float(percentile))
+
+        spreads = {}
+        with instrument.stage('loads', rows=len(sur_df), site=site_id,
+                              interval=method):
+            for column, (constituent, units) in zip(self.columns, LOAD_CONSTITUENTS):
+                if constituent + lower_suffix not in sur_df:
+                    spreads[column] = None
+                    continue
+
+                spreads[column] = spread(sur_df['Discharge'], sur_df[constituent],
+                                         sur_df[constituent + lower_suffix],
+                                         sur_df[constituent + upper_suffix],
+                                         units=units,
+                                         scale=CONSTITUENT_SCALES[constituent],
+                                         percentile=percentile, **kwargs)
+
+        return spreads
 
-        except KeyError:
-            print('site {} not found'.format(site_id))
+    def calculate_site_load(self, site_id, wy=None, year_range=None):
+        """Mean annual load of each constituent at a site.
+
+        :param wy: water year; if None, the whole record
+        :param year_range: first and last water years, used if wy is None
+        :return: Series indexed by the load columns
+        """
+        loads, seconds, _ = self.site_loads(site_id)
 
+        if wy:
+            first = last = wy
+        elif year_range:
+            first, last = year_range[0], year_range[-1]
+        else:
+            first = last = None
 
-        N = mean_annual_load(sur_df['Discharge'], sur_df['Nitrate'], wy=wy, year_range=year_range)
-        SSC = mean_annual_load(sur_df['Discharge'],sur_df['SSC'], wy=wy, year_range=year_range, units='tons')
-        TP = mean_annual_load(sur_df['Discharge'], sur_df['TP'], year_range=year_range, wy=wy)
+        entry = water_year_mean_load(loads, seconds, first, last)
+        entry.name = site_id
 
-        entry = pd.Series(data = [N, TP, SSC], index = self.columns, name= site_id)
         return entry
 
 def discrete_data_table(df):
@@ -0,0 +1,77 @@
+"""
+Leave-one-out cross-validation of ordinary least squares models.
+
+Every statistic is computed in closed form from the hat matrix of a single
+fit, so no model is refit.
+"""
+import numpy as np
+
+from scipy.stats import t as t_dist
+
+
+class LeaveOneOut:
+    """Leave-one-out statistics of an OLS fit.
+
+    Parameters
+    ----------
+    exog : array
+        Design matrix (n x p) of the fit, including any intercept column.
+    endog : array
+        Response (n) of the fit.
+    percentile : float
+        Width of the prediction interval whose coverage is assessed.
+
+    Attributes
+    ----------
+    hat : array
+        Leverage of each sample, the diagonal of the hat matrix.
+    resid : array
+        Leave-one-out (deleted) residuals, e_i / (1 - h_i).
+    press : float
+        Prediction sum of squares, the sum of squared deleted residuals.
+    rmse : float
+        Root mean square of the deleted residuals.
+    rsquared : float
+        Predictive r^2, 1 - PRESS / total sum of squares.
+    coverage : float
+        Fraction of samples that fall within the prediction interval of the
+        model fit without them.
+    """
+    def __init__(self, exog, endog, percentile=90.0):
+        exog = np.asarray(exog, dtype=float)
+        endog = np.asarray(endog, dtype=float)
+        n, p = exog.shape
+
+        self.percentile = percentile
+
+        # leverage from the thin QR factorization, h_i = |q_i|^2
+        q, _ = np.linalg.qr(exog)
+        self.hat = np.einsum('ij,ij->i', q, q)
+
+        fitted = q.dot(q.T.dot(endog))
+        e = endog - fitted
+
+        # samples with leverage of one cannot be predicted without themselves
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.resid = np.where(self.hat < 1, e / (1 - self.hat), np.nan)
+
+            valid = ~np.isnan(self.resid)
+            self.press = np.sum(self.resid[valid]**2)
+            self.rmse = np.sqrt(self.press / valid.sum()) if valid.any() else np.nan
+
+            sst = np.sum((endog - endog.mean())**2)
+            self.rsquared = 1 - self.press / sst if sst > 0 else np.nan
+
+            # residual variance of each leave-one-out fit
+            df = n - p - 1
+            sse = np.sum(e**2)
+            s2_loo = (sse - e**2 / (1 - self.hat)) / df
+
+            # y_i lies in the leave-one-out interval when its externally
+            # studentized residual is within the t quantile
+            if df > 0:
+                t_value = t_dist.ppf(0.5 + percentile/200., df)
+                studentized = np.abs(e) / np.sqrt(s2_loo * (1 - self.hat))
+                self.coverage = np.mean(studentized[valid] <= t_value) if valid.any() else np.nan
+            else:
+                self.coverage = np.nan
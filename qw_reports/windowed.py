@@ -0,0 +1,219 @@
+"""
+Rolling and seasonal refits of a sub-model from sufficient statistics.
+
+Running sums of X'X, X'y, y'y, sum(y) and n over the time-sorted samples of a
+fit let any window's least-squares solution and diagnostics be read in
+constant time, so sliding the window never refits from the data.
+SufficientStatistics holds the running sums for any ordering of samples.
+
+Examples
+--------
+>>> windowed = WindowedFit(model._fits[0])
+>>> by_year = windowed.water_years()
+>>> rolling = windowed.rolling(window='730D', step='30D')
+>>> prediction = windowed.predict(sur_df, rolling)
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from qw_reports.model import PredictionEngine, SurrogateData
+
+
+def _lognormal_bias_correction(mse, transform):
+    """Parametric retransformation bias for a window, which unlike Duan's
+    smearing can be computed from sufficient statistics alone.
+    """
+    if transform == 'log':
+        return np.exp(mse / 2)
+    elif transform == 'log10':
+        return np.exp((np.log(10)**2) * mse / 2)
+    else:
+        return 1.0
+
+
+class SufficientStatistics:
+    """Prefix sums of the least-squares sufficient statistics of ordered
+    samples.
+
+    The statistics of any contiguous run of samples [lo, hi) are the
+    difference of two prefix sums, so they are read in constant time.
+
+    Parameters
+    ----------
+    exog : array
+        Design matrix (n x p), rows in the order windows are taken over.
+    endog : array
+        Response (n).
+    """
+    def __init__(self, exog, endog):
+        n, p = exog.shape
+        self.p = p
+
+        # entry k holds the sums over the first k samples
+        self._xtx = np.zeros((n + 1, p, p))
+        np.cumsum(exog[:, :, None] * exog[:, None, :], axis=0, out=self._xtx[1:])
+        self._xty = np.zeros((n + 1, p))
+        np.cumsum(exog * endog[:, None], axis=0, out=self._xty[1:])
+        self._yty = np.concatenate([[0], np.cumsum(endog * endog)])
+        self._ysum = np.concatenate([[0], np.cumsum(endog)])
+
+    def stats(self, lo, hi):
+        """Least-squares fit of samples lo through hi - 1.
+
+        Returns
+        -------
+        dict with n, params, cov_params (None if the fit is not identified),
+        rsquared, rsquared_adj and mse.
+        """
+        n = hi - lo
+        p = self.p
+
+        stats = {'n': n, 'params': np.full(p, np.nan), 'cov_params': None,
+                 'rsquared': np.nan, 'rsquared_adj': np.nan, 'mse': np.nan}
+
+        if n <= p:
+            return stats
+
+        xtx = self._xtx[hi] - self._xtx[lo]
+        xty = self._xty[hi] - self._xty[lo]
+        yty = self._yty[hi] - self._yty[lo]
+        ysum = self._ysum[hi] - self._ysum[lo]
+
+        try:
+            xtx_inv = np.linalg.inv(xtx)
+        except np.linalg.LinAlgError:
+            return stats
+
+        params = xtx_inv.dot(xty)
+        sse = max(yty - params.dot(xty), 0)
+        tss = yty - ysum**2 / n
+        mse = sse / (n - p)
+
+        stats['params'] = params
+        stats['cov_params'] = mse * xtx_inv
+        stats['mse'] = mse
+        if tss > 0:
+            stats['rsquared'] = 1 - sse / tss
+            stats['rsquared_adj'] = 1 - (sse / (n - p)) / (tss / (n - 1))
+
+        return stats
+
+
+class WindowedFit:
+    """Windowed least-squares fits of one sub-model.
+
+    Parameters
+    ----------
+    fit : FittedModel
+        Sub-model fit whose samples (exog, endog and sample_times) are
+        refit over windows.
+    """
+    def __init__(self, fit):
+        self.fit = fit
+
+        order = np.argsort(fit.sample_times.values, kind='mergesort')
+        self.times = fit.sample_times.values[order]
+        self.p = fit.exog.shape[1]
+
+        self._sums = SufficientStatistics(fit.exog[order], fit.endog[order])
+
+    def _window_stats(self, start, end):
+        """Least-squares statistics for samples in [start, end).
+        """
+        lo, hi = np.searchsorted(self.times, [start, end])
+        return self._sums.stats(lo, hi)
+
+    def fit_windows(self, starts, ends, labels=None):
+        """Fit each window [start, end).
+
+        Returns
+        -------
+        DataFrame with one row per window: its bounds, sample count,
+        coefficients (named as in the fit), r^2, adjusted r^2 and MSE.
+        """
+        starts = pd.to_datetime(starts)
+        ends = pd.to_datetime(ends)
+
+        rows = []
+        for start, end in zip(starts.values, ends.values):
+            stats = self._window_stats(start, end)
+            rows.append([start, end, stats['n']] + list(stats['params']) +
+                        [stats['rsquared'], stats['rsquared_adj'], stats['mse']])
+
+        columns = ['start', 'end', 'n'] + self.fit.exog_names + \
+            ['rsquared', 'rsquared_adj', 'mse']
+
+        return pd.DataFrame(rows, columns=columns, index=labels)
+
+    def water_years(self, years=None):
+        """Fit each water year, October through September.
+
+        years defaults to every water year with samples.
+        """
+        if years is None:
+            sample_times = pd.DatetimeIndex(self.times)
+            water_years = sample_times.year + (sample_times.month >= 10)
+            years = np.unique(water_years)
+
+        starts = ['{}-10-01'.format(year - 1) for year in years]
+        ends = ['{}-10-01'.format(year) for year in years]
+
+        windows = self.fit_windows(starts, ends, labels=pd.Index(years, name='water year'))
+
+        return windows
+
+    def rolling(self, window='730D', step='30D'):
+        """Fit trailing windows of length window, one every step.
+
+        Windows are labelled by their (exclusive) end.
+        """
+        window = pd.Timedelta(window)
+        first = pd.Timestamp(self.times[0])
+        last = pd.Timestamp(self.times[-1])
+
+        ends = pd.date_range(first + window, last + pd.Timedelta(step), freq=step)
+        if len(ends) == 0:
+            ends = pd.DatetimeIndex([last + pd.Timedelta(step)])
+
+        return self.fit_windows(ends - window, ends, labels=ends.rename('end'))
+
+    def predict(self, explanatory_df, windows, **kwargs):
+        """Predict over explanatory_df with per-window coefficients.
+
+        Each row at time t is predicted by the first window ending after t and
+        starting at or before it; for water years, the year containing t.
+        Keyword arguments are passed to PredictionEngine.evaluate.
+        """
+        transforms = SurrogateData(explanatory_df)
+        times = explanatory_df.index.values
+        ends = windows['end'].values
+        starts = windows['start'].values
+
+        which = np.searchsorted(ends, times, side='right')
+
+        out = None
+        for k in range(len(windows)):
+            rows = np.flatnonzero((which == k) & (times >= starts[k]))
+            stats = self._window_stats(starts[k], ends[k])
+            if len(rows) == 0 or stats['cov_params'] is None:
+                continue
+
+            window_fit = copy.copy(self.fit)
+            window_fit.params = stats['params']
+            window_fit.cov_params = stats['cov_params']
+            window_fit.mse = stats['mse']
+            window_fit.df_resid = stats['n'] - self.p
+            window_fit.bias_correction = _lognormal_bias_correction(
+                stats['mse'], self.fit.response_transform)
+
+            engine = PredictionEngine(window_fit)
+            prediction = engine.evaluate(transforms.columns(engine.terms, rows), **kwargs)
+
+            if out is None:
+                out = {col: np.full(len(times), np.nan) for col in prediction}
+            for col, values in prediction.items():
+                out[col][rows] = values
+
+        return pd.DataFrame(out, index=explanatory_df.index)
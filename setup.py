@@ -12,7 +12,7 @@ setup(name='qw_reports',
           'console_scripts': [
               #nutrient_mon_report/__main__.py
               'nutrient_mon_report = nutrient_mon_report.__main__:main',
-              #TODO add script for plotting events
+              'qw_reports = qw_reports.__main__:main',
               #TODO add script for updating store
           ]
       },
@@ -0,0 +1,127 @@
+"""
+Storm event detection and event loads.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('hygnd')
+
+from qw_reports.analysis.events import (baseflow, detect_events, event_table,
+                                        network_events)
+from qw_reports.analysis.loads import interval_loads, load_rate
+
+
+def _record(storms, n=400):
+    """Discharge of 10 cfs every 15 minutes, with storms given as
+    (first position, stop position, discharge).
+    """
+    index = pd.date_range('2016-04-01', periods=n, freq='15min')
+    q = np.full(n, 10.)
+    for first, stop, value in storms:
+        q[first:stop] = value
+
+    return pd.Series(q, index=index, name='Discharge')
+
+
+def _base(discharge):
+    return pd.Series(10., index=discharge.index)
+
+
+def test_baseflow_bounds():
+    rng = np.random.RandomState(0)
+    discharge = _record([(100, 120, 80), (200, 260, 40)])
+    discharge = discharge * np.exp(rng.normal(0, 0.1, len(discharge)))
+    discharge.iloc[150:155] = np.nan
+
+    base = baseflow(discharge)
+
+    valid = discharge.notnull()
+    assert (base[valid] >= 0).all()
+    assert (base[valid] <= discharge[valid] + 1e-9).all()
+    assert base[~valid].isnull().all()
+    # storms are mostly quickflow
+    assert (base.iloc[100:120] < discharge.iloc[100:120]).all()
+
+
+def test_merge_and_min_duration():
+    # two storms an hour apart, and a 30 minute spike
+    discharge = _record([(100, 120, 50), (124, 150, 40), (300, 302, 60)])
+
+    events = detect_events(discharge, _base(discharge))
+
+    assert events.values.tolist() == [[100, 100, 149]]
+
+
+def test_split_at_gap():
+    discharge = _record([(100, 120, 50), (124, 150, 40)])
+    # a 3 hour gap between the storms
+    discharge = discharge.drop(discharge.index[121:132])
+
+    table = event_table(discharge, base=_base(discharge))
+    times = _record([]).index
+
+    assert table['start'].tolist() == [times[100], times[132]]
+    assert table['end'].tolist() == [times[119], times[149]]
+    assert table['peak discharge (cfs)'].tolist() == [50, 40]
+
+    # without max_gap the gap is bridged and the storms merge
+    table = event_table(discharge, base=_base(discharge), max_gap=None)
+    assert table['start'].tolist() == [times[100]]
+    assert table['end'].tolist() == [times[149]]
+
+
+def test_slope_starts_on_the_rising_limb():
+    discharge = _record([])
+    discharge.iloc[200:220] = 10 * 1.1 ** np.arange(1, 21)
+    discharge.iloc[220:240] = discharge.iloc[219]
+
+    threshold = detect_events(discharge, _base(discharge))
+    slope = detect_events(discharge, _base(discharge), method='slope')
+
+    assert slope['start'].tolist() == [199]
+    assert threshold['start'].tolist() == [202]
+    assert slope['end'].tolist() == threshold['end'].tolist() == [239]
+
+    with pytest.raises(ValueError):
+        detect_events(discharge, method='peaks')
+
+
+def test_event_volumes_and_loads():
+    discharge = _record([(100, 120, 50), (200, 240, 30)])
+    constituents = pd.DataFrame({'TP': 0.2, 'SSC': 100.}, index=discharge.index)
+    # SSC covers only half of the second event
+    constituents.iloc[200:220, 1] = np.nan
+
+    table = event_table(discharge, constituents, units=['lbs', 'tons'],
+                        base=_base(discharge))
+
+    volumes, _ = interval_loads(discharge.index, discharge.values)
+    quick, _ = interval_loads(discharge.index, discharge.values - 10)
+    tp, _ = interval_loads(discharge.index,
+                           load_rate(discharge.values, constituents['TP'].values))
+    for row, (start, end) in zip(table.itertuples(), [(100, 119), (200, 239)]):
+        np.testing.assert_allclose(row[6], volumes[start:end, 0].sum())
+        np.testing.assert_allclose(row[7], quick[start:end, 0].sum())
+        np.testing.assert_allclose(row[8], tp[start:end, 0].sum())
+
+    np.testing.assert_allclose(table['duration (h)'], [19 / 4., 39 / 4.])
+    assert np.isfinite(table['SSC (tons)'][0])
+    assert np.isnan(table['SSC (tons)'][1])
+
+
+def test_network_events(tmp_path):
+    discharge = _record([(100, 120, 50)])
+    sites = [{'id': '1'}, {'id': '2'}]
+
+    with pd.HDFStore(str(tmp_path / 'store.h5')) as store:
+        store.put('/said/1/iv', discharge.to_frame())
+
+        # sites without an iv table are skipped
+        table = network_events(store, sites)
+        assert table['site'].tolist() == ['1']
+
+        # but an iv table without discharge is an error
+        store.put('/said/2/iv', pd.DataFrame({'TP': 0.1}, index=discharge.index))
+        with pytest.raises(KeyError):
+            network_events(store, sites)
@@ -0,0 +1,116 @@
+"""
+Gap- and interval-aware load integration.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('hygnd')
+
+from qw_reports.analysis.loads import (LOAD_RATE, SECONDS_PER_YEAR, annual_load,
+                                       interval_loads, mean_annual_load,
+                                       period_lengths, water_year_loads)
+
+
+def test_interval_loads_rules():
+    times = pd.DatetimeIndex(['2015-01-01 00:00', '2015-01-01 00:15',
+                              '2015-01-01 00:45', '2015-01-01 04:45',
+                              '2015-01-01 05:00', '2015-01-01 05:15'])
+    rates = np.array([1., 3., 5., 7., np.nan, 2.])
+
+    loads, seconds = interval_loads(times, rates)
+    # the 4 hour interval is a gap, and intervals touching NaN add nothing
+    np.testing.assert_allclose(loads[:, 0], [2 * 900, 4 * 1800, 0, 0, 0])
+    np.testing.assert_allclose(seconds[:, 0], [900, 1800, 0, 0, 0])
+
+    loads, seconds = interval_loads(times, rates, rule='step')
+    np.testing.assert_allclose(loads[:, 0], [1 * 900, 3 * 1800, 0, 7 * 900, 0])
+    np.testing.assert_allclose(seconds[:, 0], [900, 1800, 0, 900, 0])
+
+    loads, _ = interval_loads(times, rates, max_gap=None)
+    np.testing.assert_allclose(loads[:, 0], [2 * 900, 4 * 1800, 6 * 14400, 0, 0])
+
+    with pytest.raises(ValueError):
+        interval_loads(times, rates, rule='simpson')
+
+
+def test_interval_loads_columns():
+    times = pd.date_range('2015-01-01', periods=4, freq='15min')
+    rates = np.array([[1., 2.], [3., np.nan], [5., 6.], [7., 8.]])
+
+    loads, seconds = interval_loads(times, rates)
+
+    np.testing.assert_allclose(loads, [[1800, 0], [3600, 0], [5400, 6300]])
+    np.testing.assert_allclose(seconds, [[900, 0], [900, 0], [900, 900]])
+
+
+@pytest.fixture
+def record():
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2014-09-01', '2016-11-01', freq='30min')
+    index = index[(index < '2015-06-01') | (index >= '2015-06-10')]
+    index = index.delete(np.sort(rng.choice(len(index), 1500, replace=False)))
+
+    discharge = pd.Series(np.exp(rng.normal(5, 1, len(index))), index=index)
+    tp = pd.Series(np.exp(rng.normal(-1, 0.5, len(index))), index=index, name='TP')
+    tp.iloc[rng.choice(len(tp), 300, replace=False)] = np.nan
+
+    return discharge, tp
+
+
+def _brute_force(discharge, tp):
+    """Load and seconds of each water year, one interval at a time.
+    """
+    loads, seconds = {}, {}
+    rate = (discharge * tp * LOAD_RATE).values
+    times = discharge.index
+    for i in range(len(times) - 1):
+        dt = (times[i + 1] - times[i]).total_seconds()
+        if dt > 7200 or np.isnan(rate[i]) or np.isnan(rate[i + 1]):
+            continue
+        year = times[i].year + (times[i].month >= 10)
+        loads[year] = loads.get(year, 0) + (rate[i] + rate[i + 1]) / 2 * dt
+        seconds[year] = seconds.get(year, 0) + dt
+
+    return pd.Series(loads), pd.Series(seconds)
+
+
+def test_water_year_loads(record):
+    discharge, tp = record
+    loads, seconds, coverage = water_year_loads(discharge, tp)
+    expected_loads, expected_seconds = _brute_force(discharge, tp)
+
+    assert list(loads.index) == [2014, 2015, 2016, 2017]
+    np.testing.assert_allclose(loads['TP'].values, expected_loads.values, rtol=1e-9)
+    np.testing.assert_allclose(seconds['TP'].values, expected_seconds.values, rtol=1e-12)
+    np.testing.assert_allclose(coverage['TP'].values,
+                               expected_seconds.values / period_lengths(loads.index, 'WY'))
+
+    # tons, and the order of the rows does not matter
+    tons, _, _ = water_year_loads(discharge, tp.sample(frac=1, random_state=0),
+                                  units='tons')
+    np.testing.assert_allclose(tons['TP'].values, expected_loads.values / 2000,
+                               rtol=1e-9)
+
+
+def test_mean_and_annual_load(record):
+    discharge, tp = record
+    loads, seconds = _brute_force(discharge, tp)
+
+    np.testing.assert_allclose(mean_annual_load(discharge, tp),
+                               loads.sum() / seconds.sum() * SECONDS_PER_YEAR,
+                               rtol=1e-9)
+    np.testing.assert_allclose(mean_annual_load(discharge, tp, wy=2016),
+                               loads[2016] / seconds[2016] * SECONDS_PER_YEAR,
+                               rtol=1e-9)
+    np.testing.assert_allclose(annual_load(2015, discharge, tp), loads[2015],
+                               rtol=1e-9)
+    assert annual_load(2010, discharge, tp) == 0
+
+
+def test_period_lengths():
+    np.testing.assert_allclose(period_lengths([2015, 2016], 'WY'),
+                               [365 * 86400, 366 * 86400])
+    np.testing.assert_allclose(
+        period_lengths(pd.DatetimeIndex(['2016-02-01', '2016-03-01']), 'M'),
+        [29 * 86400, 31 * 86400])
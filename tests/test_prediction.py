@@ -0,0 +1,68 @@
+"""
+Parity of PredictionEngine with linearmodel's predict_response_variable.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('said')
+pytest.importorskip('linearmodel')
+pytest.importorskip('hygnd')
+
+from linearmodel.datamanager import DataManager
+
+from benchmarks.synthetic import SSC_MODEL_LIST, TP_MODEL_LIST, synthetic_record
+from qw_reports.model import HierarchicalModel
+
+# largest relative difference allowed between the engines
+RTOL = 1e-6
+
+
+@pytest.fixture(scope='module', params=['TP', 'SSC'])
+def model(request):
+    con_df, sur_df = synthetic_record(years=1, n_samples=80)
+    model_list = {'TP': TP_MODEL_LIST, 'SSC': SSC_MODEL_LIST}[request.param]
+
+    return HierarchicalModel(con_df, sur_df, model_list, min_samples=10), sur_df
+
+
+def _compare(native, reference, columns):
+    for column in columns:
+        assert column in reference.columns
+        np.testing.assert_allclose(native[column].values,
+                                   reference[column].values, rtol=RTOL,
+                                   err_msg=column)
+
+
+def test_response(model):
+    model, sur_df = model
+    for i, fit in enumerate(model._fits):
+        reference = model._get_model(i)._model.predict_response_variable(
+            explanatory_data=DataManager(sur_df), raw_response=False,
+            bias_correction=False, prediction_interval=False)
+        native = model._get_engine(i).predict(
+            sur_df, raw_response=False, bias_correction=False,
+            prediction_interval=False)
+
+        _compare(native, reference, [fit.response])
+
+
+def test_raw_response_and_interval(model):
+    model, sur_df = model
+    for i, fit in enumerate(model._fits):
+        reference = model._get_model(i)._model.predict_response_variable(
+            explanatory_data=DataManager(sur_df), raw_response=True,
+            bias_correction=True, prediction_interval=True)
+        native = model._get_engine(i).predict(sur_df)
+
+        name = fit.raw_response
+        _compare(native, reference, [name, name + '_L90.0', name + '_U90.0'])
+
+
+def test_chunked(model):
+    model, sur_df = model
+    engine = model._get_engine(0)
+
+    whole = engine.predict(sur_df, chunk_size=None)
+    chunked = engine.predict(sur_df, chunk_size=1000)
+
+    np.testing.assert_array_equal(whole.values, chunked.values)
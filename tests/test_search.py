@@ -0,0 +1,96 @@
+"""
+Exhaustive surrogate search against fitting every candidate directly.
+"""
+from itertools import combinations, product
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('said')
+pytest.importorskip('linearmodel')
+pytest.importorskip('hygnd')
+
+from scipy.stats import f as f_dist
+
+from qw_reports.search import search_models
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2015-10-01', periods=2000, freq='15min')
+    sur_df = pd.DataFrame(np.exp(rng.normal(size=(len(index), 3))),
+                          columns=['A', 'B', 'C'], index=index)
+    # a gap in C, so that its candidates are fit on fewer samples
+    sur_df.iloc[:300, 2] = np.nan
+
+    samples = index[np.sort(rng.choice(len(index), 80, replace=False))]
+    x = sur_df.loc[samples]
+    con_df = pd.DataFrame({'TP': np.exp(0.5 * np.log(x['A']) + 0.2 * x['B']
+                                        + rng.normal(0, 0.3, len(samples)))},
+                          index=samples)
+
+    return con_df, sur_df
+
+
+def _fit(con_df, sur_df, terms):
+    """Sample count, adjusted r^2 and p-value of log(TP) on terms.
+    """
+    x = sur_df.loc[con_df.index]
+    columns = [np.ones(len(x))]
+    columns += [np.log(x[s].values) if t == 'log' else x[s].values for t, s in terms]
+    exog = np.column_stack(columns)
+    endog = np.log(con_df['TP'].values)
+
+    valid = np.isfinite(exog).all(axis=1)
+    exog, endog = exog[valid], endog[valid]
+    n, p = exog.shape
+
+    params = np.linalg.lstsq(exog, endog, rcond=None)[0]
+    rss = np.sum((endog - exog.dot(params))**2)
+    tss = np.sum((endog - endog.mean())**2)
+    rsquared_adj = 1 - (rss / (n - p)) / (tss / (n - 1))
+    f_pvalue = f_dist.sf(((tss - rss) / (p - 1)) / (rss / (n - p)), p - 1, n - p)
+
+    return n, rsquared_adj, f_pvalue
+
+
+def _name(transform, surrogate):
+    return surrogate if transform is None else '{}({})'.format(transform, surrogate)
+
+
+def test_matches_direct_fits(data):
+    con_df, sur_df = data
+    table = search_models(con_df, sur_df, 'log(TP)', max_terms=2, min_samples=10)
+
+    candidates = {}
+    for size in [1, 2]:
+        for surrogates in combinations(['A', 'B', 'C'], size):
+            for transforms in product([None, 'log'], repeat=size):
+                terms = list(zip(transforms, surrogates))
+                names = [_name(t, s) for t, s in terms]
+                candidates['log(TP) ~ ' + ' + '.join(names)] = terms
+
+    assert set(table['formula']) == set(candidates)
+
+    for _, row in table.iterrows():
+        n, rsquared_adj, f_pvalue = _fit(con_df, sur_df, candidates[row['formula']])
+        assert row['# obs'] == n
+        np.testing.assert_allclose(row['adjusted r^2'], rsquared_adj, rtol=1e-8)
+        np.testing.assert_allclose(row['p-value'], f_pvalue, rtol=1e-6, atol=1e-300)
+
+    assert table['adjusted r^2'].is_monotonic_decreasing
+    assert table['model'][0][0] == 'log(TP)'
+
+
+def test_max_terms_and_min_samples(data):
+    con_df, sur_df = data
+
+    table = search_models(con_df, sur_df, 'log(TP)', max_terms=1, min_samples=10)
+    assert (table['model'].map(lambda model: len(model[1])) == 1).all()
+
+    # C has fewer samples than required, so no candidate uses it
+    n_c = sur_df['C'].reindex(con_df.index).notnull().sum()
+    table = search_models(con_df, sur_df, 'log(TP)', min_samples=n_c + 1)
+    assert not table['formula'].str.contains('C').any()
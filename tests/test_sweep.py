@@ -0,0 +1,89 @@
+"""
+match_time sweep against fitting the samples matched within each window.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('said')
+pytest.importorskip('linearmodel')
+pytest.importorskip('hygnd')
+
+from qw_reports.match import build_match_index
+from qw_reports.sweep import match_time_sweep
+
+MATCH_TIMES = [5, 10, 20, 30]
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.RandomState(0)
+    index = pd.date_range('2015-10-01', periods=5000, freq='h')
+    sur_df = pd.DataFrame(np.exp(rng.normal(size=(len(index), 2))),
+                          columns=['A', 'B'], index=index)
+
+    # samples up to 30 minutes from the nearest hourly row
+    rows = np.sort(rng.choice(len(index), 150, replace=False))
+    offsets = pd.to_timedelta(rng.randint(-30, 30, len(rows)), 'min')
+    samples = index[rows] + offsets
+    x = sur_df.iloc[rows]
+    con_df = pd.DataFrame({'TP': np.exp(np.log(x['A'].values) + 0.3 * x['B'].values
+                                        + rng.normal(0, 0.3, len(rows)))},
+                          index=samples)
+
+    return con_df, sur_df
+
+
+def _fit(con_df, sur_df, match_time):
+    matched = build_match_index(sur_df, con_df)
+    keep = matched['offset'].abs().values <= match_time
+
+    exog = np.column_stack([np.ones(keep.sum()), np.log(matched['A'].values[keep]),
+                            matched['B'].values[keep]])
+    endog = np.log(con_df['TP'].values[keep])
+    n, p = exog.shape
+
+    params = np.linalg.lstsq(exog, endog, rcond=None)[0]
+    rss = np.sum((endog - exog.dot(params))**2)
+    tss = np.sum((endog - endog.mean())**2)
+    cov_params = rss / (n - p) * np.linalg.inv(exog.T.dot(exog))
+
+    return n, params, 1 - (rss / (n - p)) / (tss / (n - 1)), cov_params
+
+
+def test_matches_direct_fits(data):
+    con_df, sur_df = data
+    model_list = [['log(TP)', ['log(A)', 'B']]]
+
+    sweep = match_time_sweep(con_df, sur_df, model_list, MATCH_TIMES[::-1])
+    sweep = sweep.loc['log(TP) ~ log(A) + B']
+
+    assert list(sweep.index) == MATCH_TIMES
+    assert sweep['# obs'].is_monotonic_increasing
+
+    _, widest, _, cov_params = _fit(con_df, sur_df, MATCH_TIMES[-1])
+    for match_time, row in sweep.iterrows():
+        n, params, rsquared_adj, _ = _fit(con_df, sur_df, match_time)
+
+        assert row['# obs'] == n
+        np.testing.assert_allclose(row[['Intercept', 'log(A)', 'B']].values.astype(float),
+                                   params, rtol=1e-8)
+        np.testing.assert_allclose(row['adjusted r^2'], rsquared_adj, rtol=1e-8)
+        np.testing.assert_allclose(
+            row['coef shift'],
+            np.max(np.abs(params - widest) / np.sqrt(np.diag(cov_params))),
+            rtol=1e-6, atol=1e-9)
+
+
+def test_models_share_the_match_index(data):
+    con_df, sur_df = data
+    model_list = [['log(TP)', ['log(A)']], ['log(TP)', ['B']]]
+    match_index = build_match_index(sur_df, con_df)
+
+    sweep = match_time_sweep(con_df, sur_df, model_list, MATCH_TIMES,
+                             match_index=match_index)
+
+    assert set(sweep.index.get_level_values('model')) == {'log(TP) ~ log(A)',
+                                                          'log(TP) ~ B'}
+    np.testing.assert_array_equal(sweep.loc['log(TP) ~ B', '# obs'].values,
+                                  sweep.loc['log(TP) ~ log(A)', '# obs'].values)
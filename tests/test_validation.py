@@ -0,0 +1,66 @@
+"""
+Closed-form leave-one-out statistics against refitting without each sample.
+"""
+import numpy as np
+import pytest
+
+from scipy.stats import t as t_dist
+
+from qw_reports.validation import LeaveOneOut
+
+
+def _brute_force(exog, endog, percentile=90.0):
+    """Deleted residuals and interval coverage from n refits.
+    """
+    n, p = exog.shape
+    resid = np.empty(n)
+    covered = np.empty(n, dtype=bool)
+    t_value = t_dist.ppf(0.5 + percentile/200., n - 1 - p)
+
+    for i in range(n):
+        keep = np.arange(n) != i
+        x, y = exog[keep], endog[keep]
+        params = np.linalg.lstsq(x, y, rcond=None)[0]
+        mse = np.sum((y - x.dot(params))**2) / (n - 1 - p)
+        xtx_inv = np.linalg.inv(x.T.dot(x))
+
+        resid[i] = endog[i] - exog[i].dot(params)
+        half_width = t_value * np.sqrt(mse * (1 + exog[i].dot(xtx_inv).dot(exog[i])))
+        covered[i] = abs(resid[i]) <= half_width
+
+    return resid, covered
+
+
+@pytest.mark.parametrize('p', [1, 2, 4])
+def test_matches_refits(p):
+    rng = np.random.RandomState(p)
+    n = 40
+    exog = np.column_stack([np.ones(n), rng.normal(size=(n, p - 1))])
+    endog = exog.dot(rng.normal(size=p)) + rng.standard_t(3, size=n)
+
+    loo = LeaveOneOut(exog, endog)
+    resid, covered = _brute_force(exog, endog)
+
+    np.testing.assert_allclose(loo.resid, resid, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(loo.press, np.sum(resid**2), rtol=1e-9)
+    np.testing.assert_allclose(loo.rmse, np.sqrt(np.mean(resid**2)), rtol=1e-9)
+    np.testing.assert_allclose(
+        loo.rsquared, 1 - np.sum(resid**2) / np.sum((endog - endog.mean())**2),
+        rtol=1e-9)
+    assert loo.coverage == covered.mean()
+
+    # leverage is the diagonal of the hat matrix
+    hat = exog.dot(np.linalg.inv(exog.T.dot(exog))).dot(exog.T)
+    np.testing.assert_allclose(loo.hat, np.diag(hat), rtol=1e-9)
+
+
+def test_sample_with_full_leverage():
+    # the only sample of the second group is fit exactly by its own dummy
+    exog = np.column_stack([np.ones(6), [0, 0, 0, 0, 0, 1]])
+    endog = np.array([1., 2., 3., 2., 1., 5.])
+
+    loo = LeaveOneOut(exog, endog)
+
+    assert np.isnan(loo.resid[-1])
+    assert np.isfinite(loo.resid[:-1]).all()
+    np.testing.assert_allclose(loo.press, np.sum(loo.resid[:-1]**2))
@@ -0,0 +1,108 @@
+"""
+Windowed refits from prefix sums against fitting each window directly.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('said')
+pytest.importorskip('linearmodel')
+pytest.importorskip('hygnd')
+
+import statsmodels.formula.api as smf
+
+from qw_reports.model import FittedModel
+from qw_reports.windowed import SufficientStatistics, WindowedFit
+
+
+@pytest.fixture(scope='module')
+def samples():
+    rng = np.random.RandomState(0)
+    times = pd.DatetimeIndex(np.sort(
+        pd.Timestamp('2012-10-01').value
+        + rng.randint(0, 4 * 365 * 86400, 300).astype(np.int64) * 10**9))
+    df = pd.DataFrame({'x1': rng.normal(size=300), 'x2': rng.normal(size=300)},
+                      index=times)
+    # coefficients that drift, as with sensor drift
+    drift = np.linspace(0, 1, 300)
+    df['y'] = 1 + (1 + drift) * df['x1'] - 0.5 * df['x2'] + rng.normal(0, 0.2, 300)
+
+    # shuffled, as samples need not be fit in time order
+    return df.sample(frac=1, random_state=1)
+
+
+def _direct(df):
+    fit = smf.ols('y ~ x1 + x2', data=df).fit()
+    return fit.params.values, fit.rsquared, fit.rsquared_adj, fit.mse_resid
+
+
+def test_sufficient_statistics():
+    rng = np.random.RandomState(0)
+    exog = np.column_stack([np.ones(50), rng.normal(size=(50, 2))])
+    endog = exog.dot([1, 2, 3]) + rng.normal(size=50)
+    sums = SufficientStatistics(exog, endog)
+
+    for lo, hi in [(0, 50), (5, 20), (30, 50)]:
+        stats = sums.stats(lo, hi)
+        params = np.linalg.lstsq(exog[lo:hi], endog[lo:hi], rcond=None)[0]
+        mse = np.sum((endog[lo:hi] - exog[lo:hi].dot(params))**2) / (hi - lo - 3)
+
+        assert stats['n'] == hi - lo
+        np.testing.assert_allclose(stats['params'], params, rtol=1e-9)
+        np.testing.assert_allclose(stats['mse'], mse, rtol=1e-9)
+        np.testing.assert_allclose(
+            stats['cov_params'],
+            mse * np.linalg.inv(exog[lo:hi].T.dot(exog[lo:hi])), rtol=1e-9)
+
+    # too few samples to fit
+    assert np.isnan(sums.stats(0, 3)['params']).all()
+    assert sums.stats(0, 3)['cov_params'] is None
+
+
+def test_water_years(samples):
+    windowed = WindowedFit(FittedModel(smf.ols('y ~ x1 + x2', data=samples).fit(),
+                                       'y ~ x1 + x2'))
+    years = windowed.water_years()
+
+    assert list(years.index) == [2013, 2014, 2015, 2016]
+    for year, row in years.iterrows():
+        df = samples[(samples.index >= '{}-10-01'.format(year - 1))
+                     & (samples.index < '{}-10-01'.format(year))]
+        params, rsquared, rsquared_adj, mse = _direct(df)
+
+        assert row['n'] == len(df)
+        np.testing.assert_allclose(row[['Intercept', 'x1', 'x2']].values.astype(float),
+                                   params, rtol=1e-8)
+        np.testing.assert_allclose(row['rsquared'], rsquared, rtol=1e-8)
+        np.testing.assert_allclose(row['rsquared_adj'], rsquared_adj, rtol=1e-8)
+        np.testing.assert_allclose(row['mse'], mse, rtol=1e-8)
+
+
+def test_rolling(samples):
+    windowed = WindowedFit(FittedModel(smf.ols('y ~ x1 + x2', data=samples).fit(),
+                                       'y ~ x1 + x2'))
+    rolling = windowed.rolling(window='730D', step='90D')
+
+    assert len(rolling) > 1
+    for end, row in rolling.iterrows():
+        df = samples[(samples.index >= row['start']) & (samples.index < end)]
+        params, _, _, _ = _direct(df)
+
+        assert row['n'] == len(df)
+        np.testing.assert_allclose(row[['Intercept', 'x1', 'x2']].values.astype(float),
+                                   params, rtol=1e-8)
+
+
+def test_predict(samples):
+    windowed = WindowedFit(FittedModel(smf.ols('y ~ x1 + x2', data=samples).fit(),
+                                       'y ~ x1 + x2'))
+    years = windowed.water_years()
+
+    record = pd.DataFrame({'x1': 1.0, 'x2': 2.0},
+                          index=pd.date_range('2013-06-01', '2015-06-01', freq='30D'))
+    prediction = windowed.predict(record, years, prediction_interval=False)
+
+    water_year = record.index.year + (record.index.month >= 10)
+    params = years.loc[water_year, ['Intercept', 'x1', 'x2']].values.astype(float)
+    np.testing.assert_allclose(prediction['y'].values, params.dot([1, 1, 2]),
+                               rtol=1e-12)